@@ -1,489 +1,1244 @@
 import copy
+import json
 import math
+import os
 import random
+import time
+import types
+import zlib
 
 import chess
 import chess.polyglot
-from Node import *
-from sortedcontainers import SortedKeyList
+from PawnTable import *
+from SearchBoard import *
+from SearchCache import *
+from SearchStats import *
+from Tablebase import *
+from TranspositionTable import *
+
+
+# raised inside the search when it runs past its hard deadline
+class SearchTimeout(Exception):
+    pass
 
 
 # class wrapping all the AI variables and functions
 # noinspection SpellCheckingInspection
 class AI:
-    # the number of moves a current search has explored
-    movesExplored = 0
-    quiesceExplored = 0
-
-    # amount of transposed moves
-    movesTransposed = 0
+    # statistics of the current search, or the last one once it is over
+    stats = SearchStats()
 
     # transposition tables
-    transpoTable = {}
-    pawnTranspoTable = {}
+    # the main table is a fixed size and keeps its entries between moves
+    transpoTable = TranspositionTable(16)
+    # pawn structure scores by pawn key, which covers the pawns and kings
+    pawnHash = PawnTable(1)
 
-    # killer moves
-    killer = {}
+    # syzygy endgame tablebases, empty until a directory of tables is added
+    tablebase = Tablebase()
 
-    # number of cut nodes and alpha/beta specific cuts
-    cutNodes = 0
-    alphaCuts = 0
-    betaCuts = 0
+    # optional SearchCache on disk, only nodes this close to the root and searched this deep go into it
+    searchCache = None
+    searchCacheMaxPly = 2
+    searchCacheMinDepth = 4
 
-    # base values for all the pieces
-    # white gets a positive value, black a negative
-    pieceScores = {'P': 100, 'N': 320, 'B': 300, 'R': 500, 'Q': 900, 'K': 20000, 'p': -100, 'n': -320, 'b': -300,
-                   'r': -500, 'q': -900, 'k': -20000}
+    # killer moves, up to two quiet moves per ply that caused a cutoff there, newest first
+    killer = {}
+    # history heuristic, how often a quiet move has caused a cutoff, weighted by depth
+    # indexed by side to move * 4096 + from square * 64 + to square
+    history = [0] * 8192
+
+    # move ordering keys
+    # plain piece values indexed by piece type, for most valuable victim least valuable attacker
+    orderValues = [0, 100, 320, 300, 500, 900, 20000]
+    # capturing the piece that just moved is usually the move
+    recaptureBonus = 50
+
+    # quiescence search
+    # a capture is skipped if the stand pat score plus the captured piece and this margin still can't reach alpha
+    deltaMargin = 200
+
+    # time management
+    # the search is aborted once it passes the deadline, which is only set for timed searches
+    deadline = None
+    # milliseconds kept back from every move for communication lag
+    moveOverhead = 50
+    # how many moves the remaining clock is spread across when the GUI doesn't say
+    defaultMovesToGo = 30
+    # depth limit for timed searches
+    maxDepth = 64
+    # set this to false to never spend extra time when the best move changes or the score drops
+    timeExtensions = True
+
+    # outside control of a running search
+    # stopSearch is set from another thread to end the search, nodeLimit ends it after that many nodes
+    # neither, nor the deadline, can end it before the first iteration is done
+    stopSearch = False
+    nodeLimit = None
+    abortable = False
+
+    # pondering, searching the position after the reply we expect while the opponent thinks
+    # pondering is set by whoever starts a ponder search and cleared by ponderHit, the search then carries on as
+    # a normal search with the clock it was given, counted from the hit
+    pondering = False
+    ponderBudget = None
+    ponderHitTime = None
+    # PV of the last search that finished, its second move is the reply to ponder on
+    lastPV = []
+
+    # helper processes in a parallel search are stopped through an event shared with the main process,
+    # and shuffle their root moves with their own random generator so they don't all search the same tree
+    stopEvent = None
+    rootShuffle = None
+
+    # selectivity
+    # each of these can be switched off to measure what it is worth in nodes and solved positions
+    nullMove = True
+    lateMoveReductions = True
+    futilityPruning = True
+    checkExtensions = True
+    searchFeatures = ["nullMove", "lateMoveReductions", "futilityPruning", "checkExtensions"]
+    # the null move search is this much shallower than a normal one
+    nullMoveReduction = 2
+    # a side with this many or fewer pieces besides pawns and the king is likely to be in zugzwang,
+    # so a null move cutoff there is only trusted once a normal search agrees
+    nullMoveVerifyPieces = 1
+    # how far the static evaluation has to be below alpha, by remaining depth, before quiet moves are pruned
+    futilityMargins = [0, 200, 350]
+    # how far, per ply of remaining depth, the static evaluation has to be above beta to return early
+    reverseFutilityMargin = 120
+    reverseFutilityDepth = 3
+    # moves searched at full depth before late move reductions start
+    lmrFullMoves = 3
+    # late move reductions by remaining depth and move number
+    lmrTable = [[int(0.75 + math.log(depth) * math.log(index) / 2.25) if depth and index else 0
+                 for index in range(64)] for depth in range(64)]
+    # quiet moves with at least this much history are reduced a ply less
+    lmrHistory = 200
+
+    # mate scores
+    # a mate is worth MATE_SCORE less the number of plies from the root it takes, so shorter mates score higher
+    # anything beyond MATE_BOUND is a mate, windows are clamped to INFINITE
+    MATE_SCORE = 30000
+    MATE_BOUND = MATE_SCORE - 1000
+    INFINITE = MATE_SCORE + 1
+    # a tablebase win, less the plies from the root, below every mate and above every evaluation
+    TABLEBASE_WIN = MATE_BOUND - 1000
+    # length of the move stack at the root of the current search
+    rootPly = 0
+
+    # base values for all the pieces, indexed by piece type
+    pieceValues = [0, 100, 320, 300, 500, 900, 20000]
 
     # piece square tables
-    blackPawnSquareTable = [[0, 0, 0, 0, 0, 0, 0, 0],
-                            [50, 50, 50, 50, 50, 50, 50, 50],
-                            [10, 10, 20, 30, 30, 20, 10, 10],
-                            [5, 5, 10, 25, 25, 10, 5, 5],
-                            [0, 0, 0, 20, 20, 0, 0, 0],
-                            [-5, -5, 10, 0, 0, 10, -5, -5],
-                            [5, 10, 5, -20, -20, 5, 10, 5],
-                            [0, 0, 0, 0, 0, 0, 0, 0]]
-    whitePawnSquareTable = blackPawnSquareTable.copy()
-    whitePawnSquareTable.reverse()
-    blackKnightSquareTable = [[-50, -40, -30, -30, -30, -30, -40, -50],
-                              [-40, -20, 0, 0, 0, 0, -20, -40],
-                              [-30, 0, 10, 15, 15, 10, 0, -30],
-                              [-30, 5, 15, 20, 20, 15, 5, -30],
-                              [-30, 0, 15, 20, 20, 15, 0, -30],
-                              [-30, 5, 10, 15, 15, 10, 5, -30],
-                              [-40, -20, 0, 5, 5, 0, -20, -40],
-                              [-50, -10, -30, -30, -30, -30, -10, -50]]
-    whiteKnightSquareTable = blackKnightSquareTable.copy()
-    whiteKnightSquareTable.reverse()
-    blackBishopSquareTable = [[-20, -10, -10, -10, -10, -10, -10, -20],
-                              [-10, 0, 0, 0, 0, 0, 0, -10],
-                              [-10, 0, 5, 10, 10, 5, 0, -10],
-                              [-10, 5, 5, 10, 10, 5, 5, -10],
-                              [-10, 0, 10, 10, 10, 10, 0, -10],
-                              [-10, 10, 10, 10, 10, 10, 10, -10],
-                              [-10, 5, 0, 0, 0, 0, 5, -10],
-                              [-20, -10, -10, -10, -10, -10, -10, -20]]
-    whiteBishopSquareTable = blackBishopSquareTable.copy()
-    whiteBishopSquareTable.reverse()
-    blackRookSquareTable = [[0, 0, 0, 0, 0, 0, 0, 0],
-                            [5, 10, 10, 10, 10, 10, 10, 5],
-                            [-5, 0, 0, 0, 0, 0, 0, -5],
-                            [-5, 0, 0, 0, 0, 0, 0, -5],
-                            [-5, 0, 0, 0, 0, 0, 0, -5],
-                            [-5, 0, 0, 0, 0, 0, 0, -5],
-                            [-5, 0, 0, 0, 0, 0, 0, -5],
-                            [0, 0, 0, 5, 5, 5, 0, 0]]
-    whiteRookSquareTable = blackRookSquareTable.copy()
-    whiteRookSquareTable.reverse()
-    blackQueenSquareTable = [[-20, -10, -10, -5, -5, -10, -10, -20],
-                             [-10, 0, 0, 0, 0, 0, 0, -10],
-                             [-10, 0, 5, 5, 5, 5, 0, -10],
-                             [-5, 0, 5, 5, 5, 5, 0, -5],
-                             [0, 0, 5, 5, 5, 5, 0, -5],
-                             [-10, 5, 5, 5, 5, 5, 0, -10],
-                             [-10, 0, 5, 0, 0, 0, 0, -10],
-                             [-20, -10, -10, -5, -5, -10, -10, -20]]
-    whiteQueenSquareTable = blackQueenSquareTable.copy()
-    whiteQueenSquareTable.reverse()
-    blackKingSquareTable = [[-30, -40, -40, -50, -50, -40, -40, -30],
-                            [-30, -40, -40, -50, -50, -40, -40, -30],
-                            [-30, -40, -40, -50, -50, -40, -40, -30],
-                            [-30, -40, -40, -50, -50, -40, -40, -30],
-                            [-20, -30, -30, -40, -40, -30, -30, -20],
-                            [-10, -20, -20, -20, -20, -20, -20, -10],
-                            [20, 20, 0, 0, 0, 0, 20, 20],
-                            [20, 30, 10, 0, 0, 10, 30, 20]]
-    whiteKingSquareTable = blackKingSquareTable.copy()
-    whiteKingSquareTable.reverse()
+    # written from white's point of view with the eighth rank at the top, so they read like a board,
+    # black uses them mirrored
+    # the middlegame and endgame tables get blended by how much material is left, see taper
+    pawnTable = [[0, 0, 0, 0, 0, 0, 0, 0],
+                 [50, 50, 50, 50, 50, 50, 50, 50],
+                 [10, 10, 20, 30, 30, 20, 10, 10],
+                 [5, 5, 10, 25, 25, 10, 5, 5],
+                 [0, 0, 0, 20, 20, 0, 0, 0],
+                 [-5, -5, 10, 0, 0, 10, -5, -5],
+                 [5, 10, 5, -20, -20, 5, 10, 5],
+                 [0, 0, 0, 0, 0, 0, 0, 0]]
+    knightTable = [[-50, -40, -30, -30, -30, -30, -40, -50],
+                   [-40, -20, 0, 0, 0, 0, -20, -40],
+                   [-30, 0, 10, 15, 15, 10, 0, -30],
+                   [-30, 5, 15, 20, 20, 15, 5, -30],
+                   [-30, 0, 15, 20, 20, 15, 0, -30],
+                   [-30, 5, 10, 15, 15, 10, 5, -30],
+                   [-40, -20, 0, 5, 5, 0, -20, -40],
+                   [-50, -10, -30, -30, -30, -30, -10, -50]]
+    bishopTable = [[-20, -10, -10, -10, -10, -10, -10, -20],
+                   [-10, 0, 0, 0, 0, 0, 0, -10],
+                   [-10, 0, 5, 10, 10, 5, 0, -10],
+                   [-10, 5, 5, 10, 10, 5, 5, -10],
+                   [-10, 0, 10, 10, 10, 10, 0, -10],
+                   [-10, 10, 10, 10, 10, 10, 10, -10],
+                   [-10, 5, 0, 0, 0, 0, 5, -10],
+                   [-20, -10, -10, -10, -10, -10, -10, -20]]
+    rookTable = [[0, 0, 0, 0, 0, 0, 0, 0],
+                 [5, 10, 10, 10, 10, 10, 10, 5],
+                 [-5, 0, 0, 0, 0, 0, 0, -5],
+                 [-5, 0, 0, 0, 0, 0, 0, -5],
+                 [-5, 0, 0, 0, 0, 0, 0, -5],
+                 [-5, 0, 0, 0, 0, 0, 0, -5],
+                 [-5, 0, 0, 0, 0, 0, 0, -5],
+                 [0, 0, 0, 5, 5, 5, 0, 0]]
+    queenTable = [[-20, -10, -10, -5, -5, -10, -10, -20],
+                  [-10, 0, 0, 0, 0, 0, 0, -10],
+                  [-10, 0, 5, 5, 5, 5, 0, -10],
+                  [-5, 0, 5, 5, 5, 5, 0, -5],
+                  [0, 0, 5, 5, 5, 5, 0, -5],
+                  [-10, 5, 5, 5, 5, 5, 0, -10],
+                  [-10, 0, 5, 0, 0, 0, 0, -10],
+                  [-20, -10, -10, -5, -5, -10, -10, -20]]
+    kingTable = [[-30, -40, -40, -50, -50, -40, -40, -30],
+                 [-30, -40, -40, -50, -50, -40, -40, -30],
+                 [-30, -40, -40, -50, -50, -40, -40, -30],
+                 [-30, -40, -40, -50, -50, -40, -40, -30],
+                 [-20, -30, -30, -40, -40, -30, -30, -20],
+                 [-10, -20, -20, -20, -20, -20, -20, -10],
+                 [20, 20, 0, 0, 0, 0, 20, 20],
+                 [20, 30, 10, 0, 0, 10, 30, 20]]
+    # in the endgame pawns are worth more the closer they are to promoting, and the king belongs in the middle
+    pawnEndgameTable = [[0, 0, 0, 0, 0, 0, 0, 0],
+                        [80, 80, 80, 80, 80, 80, 80, 80],
+                        [50, 50, 50, 50, 50, 50, 50, 50],
+                        [30, 30, 30, 30, 30, 30, 30, 30],
+                        [20, 20, 20, 20, 20, 20, 20, 20],
+                        [10, 10, 10, 10, 10, 10, 10, 10],
+                        [10, 10, 10, 10, 10, 10, 10, 10],
+                        [0, 0, 0, 0, 0, 0, 0, 0]]
+    kingEndgameTable = [[-50, -40, -30, -20, -20, -30, -40, -50],
+                        [-30, -20, -10, 0, 0, -10, -20, -30],
+                        [-30, -10, 20, 30, 30, 20, -10, -30],
+                        [-30, -10, 30, 40, 40, 30, -10, -30],
+                        [-30, -10, 30, 40, 40, 30, -10, -30],
+                        [-30, -10, 20, 30, 30, 20, -10, -30],
+                        [-30, -30, 0, 0, 0, 0, -30, -30],
+                        [-50, -30, -30, -30, -30, -30, -30, -50]]
+
+    # middlegame and endgame tables by piece type
+    middlegameTables = [None, pawnTable, knightTable, bishopTable, rookTable, queenTable, kingTable]
+    endgameTables = [None, pawnEndgameTable, knightTable, bishopTable, rookTable, queenTable, kingEndgameTable]
+
+    # game phase, 24 with all the pieces on the board down to 0 with only pawns and kings
+    phaseWeights = [0, 0, 1, 1, 2, 4, 0]
+    maxPhase = 24
+
+    # material + piece square values, built from the tables above by buildTables
+    # indexed by piece * 64 + square, with white's pieces 0 to 5 and black's 6 to 11, from white's point of view
+    # squareTable holds the middlegame and endgame values together as one int, see scorePair
+    middlegameValues = [0] * 768
+    endgameValues = [0] * 768
+    squareTable = [0] * 768
+
+    # central squares each side gets a bonus for controlling
+    whiteSpace = (chess.BB_FILE_C | chess.BB_FILE_D | chess.BB_FILE_E | chess.BB_FILE_F) & \
+                 (chess.BB_RANK_2 | chess.BB_RANK_3 | chess.BB_RANK_4)
+    blackSpace = (chess.BB_FILE_C | chess.BB_FILE_D | chess.BB_FILE_E | chess.BB_FILE_F) & \
+                 (chess.BB_RANK_7 | chess.BB_RANK_6 | chess.BB_RANK_5)
+
+    # pawn structure terms, as (middlegame, endgame)
+    isolatedPawn = (-5, -10)
+    # once per file with more than one pawn of a side on it
+    doubledPawn = (-20, -20)
+    # defended by a friendly pawn
+    defendedPawn = (10, 10)
+    # no friendly pawn beside or behind it on the next files over, and the square in front is covered by an enemy pawn
+    backwardPawn = (-8, -12)
+    # no enemy pawn in front of it on its own file or the next files over, by rank from the pawn's own side
+    passedPawn = [(0, 0), (5, 10), (5, 15), (10, 25), (20, 45), (35, 70), (60, 110), (0, 0)]
+    # pawns in front of their king, one and two ranks ahead on its file or the next files over
+    pawnShield = [(10, 0), (5, 0)]
+
+    # having both bishops
+    bishopPair = 25
+    # penalty for the queen leaving its square in the first moves of the game
+    earlyQueen = 15
+    # per central square a side can move to without being attacked, see whiteSpace
+    spaceBonus = 5
+
+    # tuned weights, see Tuner, loaded over the values above when the engine starts if the file is there
+    weightsPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), "weights.json")
+
+    # masks for the pawn terms, indexed by color and square
+    adjacentFiles = [(chess.BB_FILES[file - 1] if file > 0 else 0) | (chess.BB_FILES[file + 1] if file < 7 else 0)
+                     for file in range(8)]
+    passedMasks = [[0] * 64, [0] * 64]
+    supportMasks = [[0] * 64, [0] * 64]
+    shieldMasks = [[[0] * 64, [0] * 64], [[0] * 64, [0] * 64]]
+    for color in chess.COLORS:
+        for square in chess.SQUARES:
+            rank = chess.square_rank(square)
+            ahead = 0
+            for other in range(8):
+                if (other > rank) if color else (other < rank):
+                    ahead |= chess.BB_RANKS[other]
+            span = chess.BB_FILES[chess.square_file(square)] | adjacentFiles[chess.square_file(square)]
+            passedMasks[color][square] = span & ahead
+            supportMasks[color][square] = adjacentFiles[chess.square_file(square)] & ~ahead
+            for distance in (1, 2):
+                other = rank + distance if color else rank - distance
+                if 0 <= other < 8:
+                    shieldMasks[color][distance - 1][square] = span & chess.BB_RANKS[other]
+    del color, square, rank, ahead, other, span, distance
+
+    # running material + piece square score of the position being searched
+    # it is updated by pushMove and popMove so the evaluation never has to rebuild it mid-search
+    materialStack = []
+
+    # set this to true to check the running score against a full recompute on every evaluation
+    verifyEval = False
+
+    # running zobrist hash of the position being searched, kept alongside the running score
+    hashStack = []
+
+    # running pawn key, a zobrist hash of only the pawns and kings
+    pawnKeyStack = []
+
+    # set this to true to check the running hashes against full recomputes on every lookup
+    verifyHash = False
+
+    # polyglot random numbers, so the running hash matches chess.polyglot.zobrist_hash
+    zobristArray = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+    zobristHasher = chess.polyglot.ZobristHasher(chess.polyglot.POLYGLOT_RANDOM_ARRAY)
+
+    # fills in the material + piece square values from the piece values and tables
+    @staticmethod
+    def buildTables():
+        for color in chess.COLORS:
+            for pieceType in chess.PIECE_TYPES:
+                for square in chess.SQUARES:
+                    index = (pieceType - 1 + (0 if color else 6)) * 64 + square
+                    # the tables have the eighth rank first, which is black's first rank
+                    row = 7 - chess.square_rank(square) if color else chess.square_rank(square)
+                    file = chess.square_file(square)
+                    sign = 1 if color else -1
+                    value = AI.pieceValues[pieceType]
+                    AI.middlegameValues[index] = sign * (value + AI.middlegameTables[pieceType][row][file])
+                    AI.endgameValues[index] = sign * (value + AI.endgameTables[pieceType][row][file])
+                    AI.squareTable[index] = (AI.endgameValues[index] << 32) + AI.middlegameValues[index]
+
+    # every tunable weight of the evaluation, as plain lists and numbers
+    # tables are by piece type from the pawn to the king, pawn terms are [middlegame, endgame]
+    @staticmethod
+    def weights():
+        return {"pieceValues": AI.pieceValues[1:6],
+                "middlegameTables": [[list(row) for row in table] for table in AI.middlegameTables[1:]],
+                "endgameTables": [[list(row) for row in table] for table in AI.endgameTables[1:]],
+                "isolatedPawn": list(AI.isolatedPawn), "doubledPawn": list(AI.doubledPawn),
+                "defendedPawn": list(AI.defendedPawn), "backwardPawn": list(AI.backwardPawn),
+                "passedPawn": [list(term) for term in AI.passedPawn],
+                "pawnShield": [list(term) for term in AI.pawnShield],
+                "bishopPair": AI.bishopPair, "earlyQueen": AI.earlyQueen, "spaceBonus": AI.spaceBonus}
+
+    # replaces the weights with the ones given, any left out keep their values
+    # the pawn hash is cleared, its scores came from the old pawn terms
+    @staticmethod
+    def setWeights(weights):
+        if "pieceValues" in weights:
+            AI.pieceValues = [0] + [int(value) for value in weights["pieceValues"]] + [AI.pieceValues[chess.KING]]
+        for name in ("middlegameTables", "endgameTables"):
+            if name in weights:
+                setattr(AI, name, [None] + [[[int(value) for value in row] for row in table]
+                                            for table in weights[name]])
+        for name in ("isolatedPawn", "doubledPawn", "defendedPawn", "backwardPawn"):
+            if name in weights:
+                setattr(AI, name, tuple(int(value) for value in weights[name]))
+        for name in ("passedPawn", "pawnShield"):
+            if name in weights:
+                setattr(AI, name, [tuple(int(value) for value in term) for term in weights[name]])
+        for name in ("bishopPair", "earlyQueen", "spaceBonus"):
+            if name in weights:
+                setattr(AI, name, int(weights[name]))
+        AI.buildTables()
+        AI.pawnHash.clear()
+
+    # loads a weights file written by saveWeights, returns false if there is none
+    @staticmethod
+    def loadWeights(path):
+        if not os.path.exists(path):
+            return False
+        with open(path) as file:
+            AI.setWeights(json.load(file))
+        return True
+
+    # writes weights, the current ones if none are given, in the form loadWeights reads
+    @staticmethod
+    def saveWeights(path, weights=None):
+        with open(path, "w") as file:
+            json.dump(weights or AI.weights(), file)
 
-    # statically evaluates and gives a score to the current board
+    # material + piece square value of a single piece, from white's point of view
+    # the middlegame and endgame values come packed together, see scorePair
+    @staticmethod
+    def pieceSquareValue(pieceType, color, square):
+        return AI.squareTable[(pieceType - 1 + (0 if color else 6)) * 64 + square]
+
+    # full material + piece square score of a board, packed like pieceSquareValue
+    @staticmethod
+    def materialScore(board):
+        score = 0
+        for square, piece in board.piece_map().items():
+            score += AI.pieceSquareValue(piece.piece_type, piece.color, square)
+        return score
+
+    # a middlegame and endgame score in one int, the endgame score in the high 32 bits
+    # packed scores can be added and subtracted as they are, which is what lets the running score stay one number
     @staticmethod
-    def evaluateBoard(board):
-        # evaluates pawn structure
-        def pawnStructure():
-            pawnScore = 0
-            whitePawns = board.pieces(chess.PAWN, chess.WHITE)
-            blackPawns = board.pieces(chess.PAWN, chess.BLACK)
-            combined = whitePawns.union(blackPawns)
-
-            if combined.mask in AI.pawnTranspoTable.keys():
-                return AI.pawnTranspoTable[combined.mask]
-
-            for square in whitePawns:
-                # isolated pawns
-                file = chess.square_file(square)
-                if file == 0:
-                    if whitePawns.isdisjoint(chess.BB_FILES[file + 1]):
-                        pawnScore -= 5
-                elif file == 7:
-                    if whitePawns.isdisjoint(chess.BB_FILES[file - 1]):
-                        pawnScore -= 5
-                elif whitePawns.isdisjoint(chess.BB_FILES[file + 1]) and whitePawns.isdisjoint(
-                        chess.BB_FILES[file - 1]):
-                    pawnScore -= 5
-
-                # defended pawns
-                if len(board.attackers(chess.WHITE, square).intersection(whitePawns)) > 0:
-                    pawnScore += 10
-
-                # passed pawns
-                if blackPawns.isdisjoint(chess.BB_FILES[file]):
-                    pawnScore += 15
-
-            for square in blackPawns:
-                # isolated pawns
-                file = chess.square_file(square)
-                if file == 0:
-                    if blackPawns.isdisjoint(chess.BB_FILES[file + 1]):
-                        pawnScore += 5
-                elif file == 7:
-                    if blackPawns.isdisjoint(chess.BB_FILES[file - 1]):
-                        pawnScore += 5
-                elif blackPawns.isdisjoint(chess.BB_FILES[file + 1]) and blackPawns.isdisjoint(
-                        chess.BB_FILES[file - 1]):
-                    pawnScore += 5
-
-                # defended pawns
-                if len(board.attackers(chess.BLACK, square).intersection(blackPawns)) > 0:
-                    pawnScore -= 10
-
-                # passed pawns
-                if whitePawns.isdisjoint(chess.BB_FILES[file]):
-                    pawnScore -= 15
-
-            # find doubled pawns
-            for file in chess.BB_FILES:
-                fileSet = chess.SquareSet(file)
-                whiteInter = fileSet.intersection(whitePawns)
-                blackInter = fileSet.intersection(blackPawns)
-
-                if len(whiteInter) > 1:
-                    pawnScore -= 20
-
-                if len(blackInter) > 1:
-                    pawnScore += 20
-
-            AI.pawnTranspoTable[combined.mask] = pawnScore
-            return pawnScore
+    def scorePair(middlegame, endgame):
+        return (endgame << 32) + middlegame
+
+    @staticmethod
+    def splitPair(score):
+        endgame = (score + 0x80000000) >> 32
+        return score - (endgame << 32), endgame
+
+    # game phase of a board, see phaseWeights
+    @staticmethod
+    def gamePhase(board):
+        phase = chess.popcount(board.knights | board.bishops) + 2 * chess.popcount(board.rooks) + \
+                4 * chess.popcount(board.queens)
+        return min(phase, AI.maxPhase)
+
+    # blends a packed score into a single one by the game phase
+    @staticmethod
+    def taper(board, score):
+        middlegame, endgame = AI.splitPair(score)
+        phase = AI.gamePhase(board)
+        return (middlegame * phase + endgame * (AI.maxPhase - phase)) // AI.maxPhase
+
+    # change in the material + piece square score that a move will cause
+    # must be called before the move is pushed
+    @staticmethod
+    def moveDelta(board, move):
+        color = board.turn
+        pieceType = board.piece_type_at(move.from_square)
+
+        # lift the piece off its square and put it down on the target square
+        delta = -AI.pieceSquareValue(pieceType, color, move.from_square)
+        delta += AI.pieceSquareValue(move.promotion or pieceType, color, move.to_square)
+
+        # captures, en passant takes the pawn behind the target square
+        if board.is_en_passant(move):
+            captured = move.to_square - 8 if color else move.to_square + 8
+            delta -= AI.pieceSquareValue(chess.PAWN, not color, captured)
+        else:
+            capturedType = board.piece_type_at(move.to_square)
+            if capturedType:
+                delta -= AI.pieceSquareValue(capturedType, not color, move.to_square)
+
+        # castling also moves the rook
+        if pieceType == chess.KING and abs(move.to_square - move.from_square) == 2:
+            if move.to_square > move.from_square:
+                rookFrom, rookTo = move.to_square + 1, move.to_square - 1
+            else:
+                rookFrom, rookTo = move.to_square - 2, move.to_square + 1
+            delta -= AI.pieceSquareValue(chess.ROOK, color, rookFrom)
+            delta += AI.pieceSquareValue(chess.ROOK, color, rookTo)
+
+        return delta
+
+    # zobrist number of a single piece
+    @staticmethod
+    def zobristPiece(pieceType, color, square):
+        return AI.zobristArray[64 * ((pieceType - 1) * 2 + color) + square]
+
+    # zobrist numbers of a set of castling rights
+    @staticmethod
+    def zobristCastling(rights):
+        key = 0
+        if rights & chess.BB_H1:
+            key ^= AI.zobristArray[768]
+        if rights & chess.BB_A1:
+            key ^= AI.zobristArray[769]
+        if rights & chess.BB_H8:
+            key ^= AI.zobristArray[770]
+        if rights & chess.BB_A8:
+            key ^= AI.zobristArray[771]
+        return key
+
+    # the pieces part of the change in zobrist hash that a move will cause
+    # must be called before the move is pushed
+    @staticmethod
+    def zobristDelta(board, move):
+        color = board.turn
+        pieceType = board.piece_type_at(move.from_square)
+
+        delta = AI.zobristPiece(pieceType, color, move.from_square) ^ \
+                AI.zobristPiece(move.promotion or pieceType, color, move.to_square)
 
+        if board.is_en_passant(move):
+            delta ^= AI.zobristPiece(chess.PAWN, not color, move.to_square - 8 if color else move.to_square + 8)
+        else:
+            capturedType = board.piece_type_at(move.to_square)
+            if capturedType:
+                delta ^= AI.zobristPiece(capturedType, not color, move.to_square)
+
+        if pieceType == chess.KING and abs(move.to_square - move.from_square) == 2:
+            if move.to_square > move.from_square:
+                rookFrom, rookTo = move.to_square + 1, move.to_square - 1
+            else:
+                rookFrom, rookTo = move.to_square - 2, move.to_square + 1
+            delta ^= AI.zobristPiece(chess.ROOK, color, rookFrom) ^ AI.zobristPiece(chess.ROOK, color, rookTo)
+
+        return delta
+
+    # zobrist hash of the pawns and kings, the key of the pawn hash
+    @staticmethod
+    def pawnKey(board):
+        key = 0
+        for square in chess.scan_forward(board.pawns | board.kings):
+            key ^= AI.zobristPiece(board.piece_type_at(square), board.color_at(square), square)
+        return key
+
+    # change in the pawn key that a move will cause
+    # must be called before the move is pushed
+    @staticmethod
+    def pawnKeyDelta(board, move):
+        color = board.turn
+        pieceType = board.piece_type_at(move.from_square)
+        delta = 0
+        if pieceType == chess.PAWN or pieceType == chess.KING:
+            delta = AI.zobristPiece(pieceType, color, move.from_square)
+            if not move.promotion:
+                delta ^= AI.zobristPiece(pieceType, color, move.to_square)
+            if board.is_en_passant(move):
+                captured = move.to_square - 8 if color else move.to_square + 8
+                return delta ^ AI.zobristPiece(chess.PAWN, not color, captured)
+        if board.piece_type_at(move.to_square) == chess.PAWN:
+            delta ^= AI.zobristPiece(chess.PAWN, not color, move.to_square)
+        return delta
+
+    # starts tracking the running scores and hashes from the current board
+    @staticmethod
+    def resetIncremental(board):
+        AI.materialStack = [AI.materialScore(board)]
+        AI.hashStack = [chess.polyglot.zobrist_hash(board)]
+        AI.pawnKeyStack = [AI.pawnKey(board)]
+
+    # makes a move on the board and updates the running scores and hash
+    @staticmethod
+    def pushMove(board, move):
+        AI.materialStack.append(AI.materialStack[-1] + AI.moveDelta(board, move))
+        AI.hashedPush(board, move)
+
+    # makes a move on the board and updates only the running hashes
+    @staticmethod
+    def hashedPush(board, move):
+        # pieces, side to move, and the en passant file and castling rights that are about to go away
+        key = AI.hashStack[-1] ^ AI.zobristDelta(board, move) ^ AI.zobristArray[780] ^ \
+              AI.zobristHasher.hash_ep_square(board)
+        rights = board.clean_castling_rights()
+        AI.pawnKeyStack.append(AI.pawnKeyStack[-1] ^ AI.pawnKeyDelta(board, move))
+
+        board.push(move)
+
+        # the en passant file and castling rights of the new position
+        key ^= AI.zobristHasher.hash_ep_square(board)
+        if board.castling_rights != rights:
+            key ^= AI.zobristCastling(rights) ^ AI.zobristCastling(board.clean_castling_rights())
+        AI.hashStack.append(key)
+
+    # passes the turn, for null move pruning
+    @staticmethod
+    def pushNullMove(board):
+        AI.materialStack.append(AI.materialStack[-1])
+        AI.hashStack.append(AI.hashStack[-1] ^ AI.zobristArray[780] ^ AI.zobristHasher.hash_ep_square(board))
+        AI.pawnKeyStack.append(AI.pawnKeyStack[-1])
+        board.push(chess.Move.null())
+
+    # undoes the last move on the board and the running scores and hash
+    @staticmethod
+    def popMove(board):
+        AI.materialStack.pop()
+        return AI.hashedPop(board)
+
+    # undoes the last move made with hashedPush
+    @staticmethod
+    def hashedPop(board):
+        AI.hashStack.pop()
+        AI.pawnKeyStack.pop()
+        return board.pop()
+
+    # zobrist hash of the position being searched
+    @staticmethod
+    def positionHash(board):
+        if AI.verifyHash:
+            assert AI.hashStack[-1] == chess.polyglot.zobrist_hash(board), \
+                f"running hash {AI.hashStack[-1]} != polyglot hash {chess.polyglot.zobrist_hash(board)} " \
+                f"for {board.fen()}"
+        return AI.hashStack[-1]
+
+    # every square a side attacks
+    @staticmethod
+    def attackedSquares(board, color):
+        pawns = board.pawns & board.occupied_co[color]
+        if color:
+            attacked = chess.shift_up_left(pawns) | chess.shift_up_right(pawns)
+        else:
+            attacked = chess.shift_down_left(pawns) | chess.shift_down_right(pawns)
+        for square in chess.scan_reversed(board.occupied_co[color] & ~board.pawns):
+            attacked |= board.attacks_mask(square)
+        return attacked
+
+    # what a version takes from a function's code, the bytecode, the names it uses, and its constants, so a
+    # changed literal counts as well as a changed instruction
+    # comprehensions and nested functions are code objects among the constants and are taken apart the same way,
+    # sets of constants are sorted since their order changes with the hash seed
+    @staticmethod
+    def codeBytes(code):
+        parts = [code.co_code, repr(code.co_names).encode()]
+        for constant in code.co_consts:
+            if isinstance(constant, types.CodeType):
+                parts.append(AI.codeBytes(constant))
+            elif isinstance(constant, frozenset):
+                parts.append(repr(sorted(constant, key=repr)).encode())
+            else:
+                parts.append(repr(constant).encode())
+        return b"".join(parts)
+
+    # version of the pawn terms, saved pawn tables are only loaded if it matches
+    @staticmethod
+    def pawnTermsVersion():
+        terms = (AI.isolatedPawn, AI.doubledPawn, AI.defendedPawn, AI.backwardPawn, AI.passedPawn, AI.pawnShield)
+        return zlib.crc32(repr(terms).encode() + AI.codeBytes(AI.pawnStructure.__code__))
+
+    # version of the whole evaluation, the weights and the code that uses them
+    # any edit to the code counts as a new evaluation, see codeBytes
+    @staticmethod
+    def evaluationVersion():
+        weights = (AI.pieceValues, AI.middlegameTables, AI.endgameTables, AI.phaseWeights, AI.pawnTermsVersion(),
+                   AI.bishopPair, AI.earlyQueen, AI.spaceBonus)
+        code = b"".join(AI.codeBytes(function.__code__) for function in
+                        (AI.evaluateBoard, AI.pawnStructure, AI.materialScore, AI.taper))
+        return zlib.crc32(repr(weights).encode() + code)
+
+    # pawn structure and king shelter, packed like the material score
+    # only depends on the pawns and kings, so it is cached in the pawn hash by pawn key
+    @staticmethod
+    def pawnStructure(board, key):
+        score = AI.pawnHash.probe(key)
+        if score is not None:
+            return score
+
+        middlegame = endgame = 0
+        for color in chess.COLORS:
+            pawns = board.pawns & board.occupied_co[color]
+            enemyPawns = board.pawns & board.occupied_co[not color]
+            sign = 1 if color else -1
+            terms = []
+
+            for square in chess.scan_forward(pawns):
+                file = square & 7
+                if not AI.adjacentFiles[file] & pawns:
+                    terms.append(AI.isolatedPawn)
+                if chess.BB_PAWN_ATTACKS[not color][square] & pawns:
+                    terms.append(AI.defendedPawn)
+                if not AI.passedMasks[color][square] & enemyPawns:
+                    terms.append(AI.passedPawn[square >> 3 if color else 7 - (square >> 3)])
+                stop = square + 8 if color else square - 8
+                if not AI.supportMasks[color][square] & pawns and chess.BB_PAWN_ATTACKS[color][stop] & enemyPawns:
+                    terms.append(AI.backwardPawn)
+
+            for fileMask in chess.BB_FILES:
+                if chess.popcount(pawns & fileMask) > 1:
+                    terms.append(AI.doubledPawn)
+
+            king = board.king(color)
+            if king is not None:
+                for distance in (0, 1):
+                    shield = chess.popcount(AI.shieldMasks[color][distance][king] & pawns)
+                    terms.append((AI.pawnShield[distance][0] * shield, AI.pawnShield[distance][1] * shield))
+
+            for termMiddlegame, termEndgame in terms:
+                middlegame += sign * termMiddlegame
+                endgame += sign * termEndgame
+
+        score = AI.scorePair(middlegame, endgame)
+        AI.pawnHash.store(key, score)
+        return score
+
+    # statically evaluates and gives a score to the current board
+    # material and pawnKey are the running material + piece square score and pawn key when called from the search
+    @staticmethod
+    def evaluateBoard(board, material=None, pawnKey=None):
         # set the score to zero
         score = 0
 
         # returns a value if the current board state is a finished game
         if board.is_game_over():
-            # if the game ended in checkmate, return infinity if white won, and negative infinity if black won
+            # if the game ended in checkmate, return a mate score for whoever won
             if board.outcome().termination == chess.Termination.CHECKMATE:
                 if board.outcome().winner:
-                    return math.inf
+                    return AI.MATE_SCORE
                 else:
-                    return -math.inf
+                    return -AI.MATE_SCORE
             # if the game ended from any kind of stalemate, return a zero
             else:
                 return 0
 
-        # get a dictionary of all the pieces with their squares as keys
-        pieces = board.piece_map()
-
-        # loop through the dictionary and add all the piece values together
-        for square in pieces.keys():
-            if pieces[square].color:
-                if pieces[square].piece_type == chess.PAWN:
-                    score += AI.pieceScores[pieces[square].symbol()] + \
-                             AI.whitePawnSquareTable[chess.square_rank(square)][chess.square_file(square)]
-                elif pieces[square].piece_type == chess.KNIGHT:
-                    score += AI.pieceScores[pieces[square].symbol()] + \
-                             AI.whiteKnightSquareTable[chess.square_rank(square)][chess.square_file(square)]
-                elif pieces[square].piece_type == chess.BISHOP:
-                    score += AI.pieceScores[pieces[square].symbol()] + \
-                             AI.whiteBishopSquareTable[chess.square_rank(square)][chess.square_file(square)]
-                elif pieces[square].piece_type == chess.ROOK:
-                    score += AI.pieceScores[pieces[square].symbol()] + \
-                             AI.whiteRookSquareTable[chess.square_rank(square)][chess.square_file(square)]
-                elif pieces[square].piece_type == chess.QUEEN:
-                    score += AI.pieceScores[pieces[square].symbol()] + \
-                             AI.whiteQueenSquareTable[chess.square_rank(square)][chess.square_file(square)]
-                elif pieces[square].piece_type == chess.KING:
-                    score += AI.pieceScores[pieces[square].symbol()] + \
-                             AI.whiteKingSquareTable[chess.square_rank(square)][chess.square_file(square)]
-            else:
-                if pieces[square].piece_type == chess.PAWN:
-                    score += AI.pieceScores[pieces[square].symbol()] - \
-                             AI.blackPawnSquareTable[chess.square_rank(square)][chess.square_file(square)]
-                elif pieces[square].piece_type == chess.KNIGHT:
-                    score += AI.pieceScores[pieces[square].symbol()] - \
-                             AI.blackKnightSquareTable[chess.square_rank(square)][chess.square_file(square)]
-                elif pieces[square].piece_type == chess.BISHOP:
-                    score += AI.pieceScores[pieces[square].symbol()] - \
-                             AI.blackBishopSquareTable[chess.square_rank(square)][chess.square_file(square)]
-                elif pieces[square].piece_type == chess.ROOK:
-                    score += AI.pieceScores[pieces[square].symbol()] - \
-                             AI.blackRookSquareTable[chess.square_rank(square)][chess.square_file(square)]
-                elif pieces[square].piece_type == chess.QUEEN:
-                    score += AI.pieceScores[pieces[square].symbol()] - \
-                             AI.blackQueenSquareTable[chess.square_rank(square)][chess.square_file(square)]
-                elif pieces[square].piece_type == chess.KING:
-                    score += AI.pieceScores[pieces[square].symbol()] - \
-                             AI.blackKingSquareTable[chess.square_rank(square)][chess.square_file(square)]
+        # material and piece square values, taken from the running total when the search supplies one
+        if material is None:
+            material = AI.materialScore(board)
+        elif AI.verifyEval:
+            assert material == AI.materialScore(board), \
+                f"incremental material {material} != full recompute {AI.materialScore(board)} for {board.fen()}"
+        if pawnKey is None:
+            pawnKey = AI.pawnKey(board)
+        elif AI.verifyHash:
+            assert pawnKey == AI.pawnKey(board), \
+                f"running pawn key {pawnKey} != full recompute {AI.pawnKey(board)} for {board.fen()}"
+
+        # material, piece square values, and pawn structure, blended by game phase
+        score += AI.taper(board, material + AI.pawnStructure(board, pawnKey))
 
         # add bonus for bishop pair
         if len(board.pieces(chess.BISHOP, chess.WHITE)) == 2:
-            score += 25
+            score += AI.bishopPair
         if len(board.pieces(chess.BISHOP, chess.BLACK)) == 2:
-            score -= 25
-
-        # add pawn structure bonus
-        score += pawnStructure()
+            score -= AI.bishopPair
 
         # give the AI a slap for moving the queen too early
         if board.fullmove_number < 8 and board.piece_type_at(chess.D1) is not chess.QUEEN:
-            score -= 15
+            score -= AI.earlyQueen
         if board.fullmove_number < 8 and board.piece_type_at(chess.D8) is not chess.QUEEN:
-            score += 15
+            score += AI.earlyQueen
 
         # space advantages
         # the basic idea is to reward each side for being able to move to central squares safely
-        files = chess.SquareSet(chess.BB_FILE_C | chess.BB_FILE_D | chess.BB_FILE_E | chess.BB_FILE_F)
-
-        # white
-        whiteSpace = chess.SquareSet((files & chess.BB_RANK_2) | (files & chess.BB_RANK_3) | (files & chess.BB_RANK_4))
-        whiteSafeCount = 0
-        for square in whiteSpace:
-            if not board.is_attacked_by(chess.BLACK, square):
-                whiteSafeCount += 1
-        score += whiteSafeCount * 5
-
-        # black
-        blackSpace = chess.SquareSet((files & chess.BB_RANK_7) | (files & chess.BB_RANK_6) | (files & chess.BB_RANK_5))
-        blackSafeCount = 0
-        for square in blackSpace:
-            if not board.is_attacked_by(chess.WHITE, square):
-                blackSafeCount += 1
-        score -= blackSafeCount * 5
+        score += chess.popcount(AI.whiteSpace & ~AI.attackedSquares(board, chess.BLACK)) * AI.spaceBonus
+        score -= chess.popcount(AI.blackSpace & ~AI.attackedSquares(board, chess.WHITE)) * AI.spaceBonus
 
         return score
 
+    # evaluation from inside the search, from the side to move's point of view, timed when the stats ask for it
+    # a mate on the board is scored by its distance from the root
     @staticmethod
-    def moveOrder(moves, board, PV, depth, node):
-        # Most Valuable Victim Least Valuable Attacker function
-        def MVVLVA(move):
-            if board.is_en_passant(move):
-                return -(abs(AI.pieceScores[board.piece_at(board.peek().to_square).symbol()]) - abs(
-                    AI.pieceScores[board.piece_at(move.from_square).symbol()]))
-            return -(abs(AI.pieceScores[board.piece_at(move.to_square).symbol()]) - abs(
-                AI.pieceScores[board.piece_at(move.from_square).symbol()]))
-
-        orderedMoves = []
-
-        if PV[-depth] != 0 and chess.Move.from_uci(PV[-depth]) in moves:
-            orderedMoves.append(chess.Move.from_uci(PV[-depth]))
-            moves.remove(orderedMoves[0])
-        if node.bestMove is not None and node.bestMove not in orderedMoves:
-            orderedMoves.append(node.bestMove)
-            moves.remove(node.bestMove)
-
-        attackers = SortedKeyList(key=MVVLVA)
-        lCaptures = SortedKeyList(key=MVVLVA)
-        wCaptures = SortedKeyList(key=MVVLVA)
-        eCaptures = SortedKeyList(key=MVVLVA)
-        checks = []
-        killers = []
-        other = []
-
-        # I wrapped this in a try except for when board.pop()
-        # throws an error for there being no moves in the stack.
-        # This only happens when either the board is loaded from a FEN, or
-        # when it is the very first move of the game
-        try:
-            lastMove = board.pop()
-            if board.is_capture(lastMove):
-                board.push(lastMove)
-                if board.is_attacked_by(board.turn, board.peek().to_square):
-                    for retaliation in board.attackers(board.turn, board.peek().to_square):
-                        MAD = chess.Move(retaliation, board.peek().to_square)
-                        if board.is_legal(MAD) and MAD not in orderedMoves:
-                            attackers.add(MAD)
-                            moves.remove(MAD)
-            else:
-                board.push(lastMove)
-        except:
-            pass
+    def searchEval(board):
+        if AI.stats.timing:
+            start = time.perf_counter()
+            score = AI.evaluateBoard(board, AI.materialStack[-1], AI.pawnKeyStack[-1])
+            AI.stats.evalTime += time.perf_counter() - start
+        else:
+            score = AI.evaluateBoard(board, AI.materialStack[-1], AI.pawnKeyStack[-1])
+        if not board.turn:
+            score = -score
+        if abs(score) >= AI.MATE_BOUND:
+            score = -(AI.MATE_SCORE - (len(board.move_stack) - AI.rootPly))
+        return score
 
-        for move in moves:
-            if board.is_capture(move):
-                if MVVLVA(move) < -20:
-                    wCaptures.add(move)
-                elif MVVLVA(move) > 20:
-                    lCaptures.add(move)
-                else:
-                    eCaptures.add(move)
-            elif int(str(move.from_square) + str(move.to_square)) in AI.killer[board.ply()]:
-                killers.append(move)
-            elif board.gives_check(move):
-                checks.append(move)
-            else:
-                other.append(move)
+    # mate scores go into the transposition table as distance from the node rather than from the root,
+    # so they are still right when the position is reached at a different ply
+    @staticmethod
+    def scoreToTT(score, ply):
+        if score >= AI.MATE_BOUND:
+            return score + ply
+        if score <= -AI.MATE_BOUND:
+            return score - ply
+        return score
 
-        orderedMoves.extend(attackers)
-        orderedMoves.extend(wCaptures)
-        orderedMoves.extend(eCaptures)
-        orderedMoves.extend(checks)
-        orderedMoves.extend(killers)
-        orderedMoves.extend(lCaptures)
-        orderedMoves.extend(other)
+    @staticmethod
+    def scoreFromTT(score, ply):
+        if score >= AI.MATE_BOUND:
+            return score - ply
+        if score <= -AI.MATE_BOUND:
+            return score + ply
+        return score
 
-        return orderedMoves
+    # score of a tablebase result, side to move relative
+    # wins under the fifty move rule are a little better than a draw, nothing more
+    @staticmethod
+    def tablebaseScore(wdl, ply):
+        if wdl == 2:
+            return AI.TABLEBASE_WIN - ply
+        if wdl == -2:
+            return -AI.TABLEBASE_WIN + ply
+        return wdl
+
+    # pseudo legal moves from inside the search, timed when the stats ask for it
+    # the search makes them and takes back the ones that turn out to leave its king attacked
+    # in check almost none of them are legal, so there it only gets the evasions
+    # captures includes en passant, quiets is everything else, including quiet promotions
+    @staticmethod
+    def searchMoves(board, captures=True, quiets=True):
+        if AI.stats.timing:
+            start = time.perf_counter()
+        if board.is_check():
+            generate, generateCaptures = board.generate_legal_moves, board.generate_legal_captures
+        else:
+            generate, generateCaptures = board.generate_pseudo_legal_moves, board.generate_pseudo_legal_captures
+        if captures and quiets:
+            moves = list(generate())
+        elif captures:
+            moves = list(generateCaptures())
+        else:
+            moves = [move for move in generate(chess.BB_ALL, ~board.occupied_co[not board.turn])
+                     if not board.is_en_passant(move)]
+        if AI.stats.timing:
+            AI.stats.movegenTime += time.perf_counter() - start
+        return moves
+
+    # ordering key of a capture, most valuable victim first and least valuable attacker second
+    @staticmethod
+    def captureKey(board, move, lastTo):
+        victim = board.piece_type_at(move.to_square) or chess.PAWN
+        key = AI.orderValues[victim] * 8 - board.piece_type_at(move.from_square)
+        if move.to_square == lastTo:
+            key += AI.recaptureBonus * 8
+        if move.promotion:
+            key += AI.orderValues[move.promotion] * 8
+        return key
+
+    # static exchange evaluation
+    # material the side to move wins or loses on the target square if both sides keep recapturing there with
+    # their least valuable piece, and either can stop when carrying on would lose more, pins are ignored
+    @staticmethod
+    def see(board, move):
+        values = AI.orderValues
+        target = move.to_square
+        occupied = board.occupied ^ chess.BB_SQUARES[move.from_square]
+        if board.is_en_passant(move):
+            occupied ^= chess.BB_SQUARES[target - 8 if board.turn else target + 8]
+            gains = [values[chess.PAWN]]
+        else:
+            gains = [values[board.piece_type_at(target) or 0]]
+        onSquare = board.piece_type_at(move.from_square)
+        if move.promotion:
+            gains[0] += values[move.promotion] - values[chess.PAWN]
+            onSquare = move.promotion
+
+        color = not board.turn
+        while True:
+            attackers = board.attackers_mask(color, target, occupied) & occupied
+            if not attackers:
+                break
+            for pieceType in range(chess.PAWN, chess.KING + 1):
+                candidates = attackers & board.pieces_mask(pieceType, color)
+                if candidates:
+                    break
+            # each entry is what the capture wins if the other side stops there
+            gains.append(values[onSquare] - gains[-1])
+            onSquare = pieceType
+            occupied ^= candidates & -candidates
+            color = not color
+
+        # work back from the end, each side only captures if it comes out ahead
+        for index in range(len(gains) - 1, 0, -1):
+            gains[index - 1] = -max(-gains[index - 1], gains[index])
+        return gains[0]
+
+    # a capture can only lose material if the attacker is worth more than the victim, and then only if SEE says so
+    @staticmethod
+    def losingCapture(board, move):
+        if move.promotion:
+            return False
+        victim = board.piece_type_at(move.to_square) or chess.PAWN
+        if AI.orderValues[victim] >= AI.orderValues[board.piece_type_at(move.from_square)]:
+            return False
+        return AI.see(board, move) < 0
+
+    # captures sorted by captureKey
+    @staticmethod
+    def orderCaptures(board, captures):
+        if AI.stats.timing:
+            start = time.perf_counter()
+        lastTo = board.peek().to_square if board.move_stack else None
+        captures.sort(key=lambda move: AI.captureKey(board, move, lastTo), reverse=True)
+        if AI.stats.timing:
+            AI.stats.orderingTime += time.perf_counter() - start
+        return captures
+
+    # staged move picker
+    # yields the PV and hash moves, then captures that win or trade material, then killers, then the quiet moves
+    # by history, then captures that lose material
+    # each stage is only generated and sorted when the one before it runs out, so a cutoff in an early stage
+    # never pays for the later ones
+    @staticmethod
+    def moveOrder(board, PV, ply, ttMove):
+        tried = []
+        if ply < len(PV) and PV[ply] != 0:
+            pvMove = chess.Move.from_uci(PV[ply])
+            if board.is_pseudo_legal(pvMove):
+                tried.append(pvMove)
+                yield pvMove
+        if ttMove is not None and ttMove not in tried and board.is_pseudo_legal(ttMove):
+            tried.append(ttMove)
+            yield ttMove
+
+        # captures, the ones that lose material by SEE wait until after the quiet moves
+        losing = []
+        for move in AI.orderCaptures(board, AI.searchMoves(board, quiets=False)):
+            if move in tried:
+                continue
+            if AI.losingCapture(board, move):
+                losing.append(move)
+            else:
+                yield move
+
+        killers = AI.killer.get(board.ply(), ())
+        for move in killers:
+            if move not in tried and not board.is_capture(move) and board.is_pseudo_legal(move):
+                tried.append(move)
+                yield move
+
+        quiets = AI.searchMoves(board, captures=False)
+        if AI.stats.timing:
+            start = time.perf_counter()
+        side = board.turn * 4096
+        history = AI.history
+        quiets.sort(key=lambda move: history[side + move.from_square * 64 + move.to_square] +
+                    (1 << 30 if move.promotion == chess.QUEEN else 0), reverse=True)
+        if AI.stats.timing:
+            AI.stats.orderingTime += time.perf_counter() - start
+        for move in quiets:
+            if move not in tried:
+                yield move
+
+        yield from losing
+
+    # a quiet move caused a cutoff, make it a killer at this ply and bump its history
+    @staticmethod
+    def recordCutoff(board, move, depth):
+        if board.is_capture(move):
+            return
+        killers = AI.killer.setdefault(board.ply(), [])
+        if move not in killers:
+            killers.insert(0, move)
+            del killers[2:]
+        AI.history[board.turn * 4096 + move.from_square * 64 + move.to_square] += depth * depth
+
+    # halves the history between searches, so old results count for less without being forgotten
+    @staticmethod
+    def ageHistory():
+        AI.history = [value >> 1 for value in AI.history]
 
+    # forgets what earlier searches learned, the table, killers, history, and last PV
+    # everything that plays or analyses many positions calls it before each one, so a result doesn't depend on
+    # what the process searched before, or on which worker of a pool it ran in
+    @staticmethod
+    def newGame():
+        AI.transpoTable.clear()
+        AI.killer.clear()
+        AI.history = [0] * 8192
+        AI.lastPV = []
+
+    # quiescence search, scores from the side to move's point of view
+    # searches captures until the position is quiet, with no depth limit
+    # captures that lose material by SEE, or can't lift the score to alpha even winning a margin on top, are skipped,
+    # which is what keeps it from exploding
+    # in check there is no standing pat, every evasion is searched, and no evasions is mate
     @staticmethod
-    def quiesce(board, alpha, beta, Qdepth):
-        if Qdepth <= 0:
-            if board.turn:
-                return AI.evaluateBoard(board)
-            return -AI.evaluateBoard(board)
+    def quiesce(board, alpha, beta):
+        AI.checkTime()
 
         # transposition lookup
-        hash = chess.polyglot.zobrist_hash(board)
-        if hash in AI.transpoTable.keys():
-            node = AI.transpoTable[hash]
-            if node.nodeType == 1:
-                AI.movesTransposed += 1
-                return node.nodeScore
+        # quiescence results are stored at depth 0 so the main search never mistakes them for its own
+        # a zero window search mostly fails, so the bounds have to be kept as bounds
+        ply = len(board.move_stack) - AI.rootPly
+        hash = AI.positionHash(board)
+        entry = AI.transpoTable.probe(hash)
+        if entry is not None and entry[2] == 0:
+            ttScore = AI.scoreFromTT(entry[1], ply)
+            if entry[3] == TranspositionTable.EXACT or \
+                    (entry[3] == TranspositionTable.LOWER and ttScore >= beta) or \
+                    (entry[3] == TranspositionTable.UPPER and ttScore <= alpha):
+                AI.stats.ttCutoffs += 1
+                return max(alpha, min(beta, ttScore))
+
+        alphaOrig = alpha
+        inCheck = board.is_check()
+        if inCheck:
+            standPat = None
+            moves = AI.orderCaptures(board, AI.searchMoves(board, quiets=False)) + \
+                AI.searchMoves(board, captures=False)
         else:
-            node = Node(1)
-            AI.transpoTable[hash] = node
+            standPat = AI.searchEval(board)
+            if standPat >= beta:
+                AI.transpoTable.store(hash, 0, TranspositionTable.LOWER, AI.scoreToTT(standPat, ply), None)
+                return beta
+            if standPat > alpha:
+                alpha = standPat
+            moves = AI.orderCaptures(board, AI.searchMoves(board, quiets=False))
+
+        legalMoves = 0
+        for move in moves:
+            if standPat is not None:
+                # delta pruning
+                if not move.promotion:
+                    victim = board.piece_type_at(move.to_square) or chess.PAWN
+                    if standPat + AI.orderValues[victim] + AI.deltaMargin <= alpha:
+                        AI.stats.deltaPrunes += 1
+                        continue
+                if AI.losingCapture(board, move):
+                    AI.stats.seePrunes += 1
+                    continue
+
+            AI.pushMove(board, move)
+            if board.kingLeftInCheck():
+                AI.popMove(board)
+                continue
+            legalMoves += 1
+            AI.stats.nodes += 1
+            AI.stats.qnodes += 1
+            score = -AI.quiesce(board, -beta, -alpha)
+            AI.popMove(board)
+
+            if score >= beta:
+                AI.transpoTable.store(hash, 0, TranspositionTable.LOWER, AI.scoreToTT(score, ply), move)
+                return beta
+            if score > alpha:
+                alpha = score
+
+        # in check with no evasions is mate
+        if inCheck and not legalMoves:
+            return max(alpha, min(beta, -(AI.MATE_SCORE - ply)))
+
+        bound = TranspositionTable.EXACT if alpha > alphaOrig else TranspositionTable.UPPER
+        AI.transpoTable.store(hash, 0, bound, AI.scoreToTT(alpha, ply), None)
+        return alpha
+
+    # negamax principal variation search
+    # scores are from the side to move's point of view
+    # the first move is searched with the full window, the rest with a zero window scout that only proves
+    # they are no better, and a scout that beats alpha is searched again with the full window
+    # lines are indexed by ply, and have room for twice the iteration depth so check extensions fit
+    # nullAllowed is turned off for the search that verifies a null move cutoff
+    @staticmethod
+    def negamax(depth, board, alpha, beta, PV, currentLine, finalDepth, nullAllowed=True):
+        AI.checkTime()
 
-        if board.turn:
-            standPat = AI.evaluateBoard(board)
-            node.nodeScore = standPat
-        else:
-            standPat = -AI.evaluateBoard(board)
-            node.nodeScore = standPat
-
-        if standPat >= beta:
-            node.nodeType = 2
-            return beta
-        if standPat > alpha:
-            alpha = standPat
-
-        captures = [move for move in board.legal_moves if board.is_capture(move)]
-
-        if captures != []:
-            for move in captures:
-                board.push(move)
-                AI.quiesceExplored += 1
-                AI.movesExplored += 1
-                score = -AI.quiesce(board, -beta, -alpha, Qdepth - 1)
-                board.pop()
-
-                if score >= beta:
-                    node.nodeType = 2
-                    return beta
-                if score > alpha:
-                    node.nodeScore = score
-                    alpha = score
-            return alpha
-        else:
-            return standPat
+        ply = len(board.move_stack) - AI.rootPly
+        inCheck = board.is_check()
+
+        # check extension, never past the end of the line
+        if inCheck and AI.checkExtensions and ply > 0 and ply + depth < len(currentLine):
+            depth += 1
+            AI.stats.extensions += 1
 
-    @staticmethod
-    def minimax(depth, isMaximizer, board,  alpha, beta, PV, currentLine, finalDepth, searchDepth):
         if depth <= 0:
             # do a Qsearch if we are at the final depth
             if finalDepth:
-                if board.turn:
-                    return AI.quiesce(board, alpha, beta, 3), currentLine
-                else:
-                    return -AI.quiesce(board, alpha, beta, 3), currentLine
-            return AI.evaluateBoard(board), currentLine
-
-        # create an index for killer moves if there isn't one already
-        if board.ply() not in AI.killer.keys():
-            AI.killer[board.ply()] = set()
+                return AI.quiesce(board, alpha, beta), AI.ttLine(currentLine, ply, None)
+            return AI.searchEval(board), AI.ttLine(currentLine, ply, None)
 
         # transposition lookup
-        hash = chess.polyglot.zobrist_hash(board)
-        if hash in AI.transpoTable.keys():
-            node = AI.transpoTable[hash]
-            if node.nodeDepth == searchDepth:
-                if node.nodeType == 1:
-                    AI.movesTransposed += 1
-                    return node.nodeScore, node.PV
-                elif node.nodeType == 2:
-                    alpha = max(node.nodeScore, alpha)
-                elif node.nodeType == 3:
-                    beta = min(node.nodeScore, beta)
-            else:
-                node.nodeDepth = searchDepth
-        else:
-            if board.turn:
-                node = Node(1, depth=searchDepth, score=-math.inf)
+        # entries are only trusted if they were searched at least as deep as we are about to search,
+        # and never at the root, so the root always returns a full PV
+        hash = AI.positionHash(board)
+        alphaOrig = alpha
+        betaOrig = beta
+        ttMove = None
+        entry = AI.transpoTable.probe(hash)
+        cached = AI.searchCache is not None and ply <= AI.searchCacheMaxPly and depth >= AI.searchCacheMinDepth
+        # the table usually has the position from the last iteration, one ply too shallow to use
+        if cached and (entry is None or entry[2] < depth):
+            cacheEntry = AI.searchCache.probe(hash)
+            if cacheEntry is not None and (entry is None or cacheEntry[2] > entry[2]):
+                entry = cacheEntry
+        if entry is not None:
+            ttMove, ttScore, ttDepth, ttBound = entry
+            ttScore = AI.scoreFromTT(ttScore, ply)
+            if ttDepth >= depth and ply > 0:
+                if ttBound == TranspositionTable.EXACT:
+                    AI.stats.ttCutoffs += 1
+                    return ttScore, AI.ttLine(currentLine, ply, ttMove)
+                elif ttBound == TranspositionTable.LOWER:
+                    alpha = max(ttScore, alpha)
+                elif ttBound == TranspositionTable.UPPER:
+                    beta = min(ttScore, beta)
+                if alpha >= beta:
+                    AI.stats.ttCutoffs += 1
+                    return ttScore, AI.ttLine(currentLine, ply, ttMove)
+
+        # tablebase positions have an exact result, so there is nothing left to search
+        if AI.tablebase and ply > 0 and board.halfmove_clock == 0 and AI.tablebase.covers(board):
+            wdl = AI.tablebase.wdl(board, hash)
+            if wdl is not None:
+                AI.stats.tablebaseHits += 1
+                score = AI.tablebaseScore(wdl, ply)
+                AI.transpoTable.store(hash, depth, TranspositionTable.EXACT, AI.scoreToTT(score, ply), None)
+                return score, AI.ttLine(currentLine, ply, None)
+
+        # forward pruning, only in zero window nodes that are not in check
+        # the static evaluation is only worked out when one of them might use it
+        pvNode = beta - alpha > 1
+        futile = False
+        if not pvNode and not inCheck and abs(beta) < AI.MATE_BOUND:
+            staticEval = None
+
+            # reverse futility pruning, so far above beta that nothing this close to the leaves will bring it down
+            if AI.futilityPruning and depth <= AI.reverseFutilityDepth:
+                staticEval = AI.searchEval(board)
+                if staticEval - AI.reverseFutilityMargin * depth >= beta:
+                    AI.stats.futilityPrunes += 1
+                    return staticEval, AI.ttLine(currentLine, ply, None)
+
+            # null move pruning, if passing still beats beta then a real move will too
+            # skipped without pieces to move besides pawns, where passing is often the best move there is
+            pieces = chess.popcount(board.occupied_co[board.turn] & ~board.pawns & ~board.kings)
+            if AI.nullMove and nullAllowed and depth > AI.nullMoveReduction and pieces and board.move_stack \
+                    and board.move_stack[-1]:
+                if staticEval is None:
+                    staticEval = AI.searchEval(board)
+                if staticEval >= beta:
+                    reduction = AI.nullMoveReduction + (depth > 6)
+                    AI.pushNullMove(board)
+                    AI.stats.nodes += 1
+                    score = -AI.negamax(depth - 1 - reduction, board, -beta, -beta + 1, PV, currentLine, finalDepth)[0]
+                    AI.popMove(board)
+                    if score >= beta and pieces <= AI.nullMoveVerifyPieces:
+                        score = AI.negamax(depth - reduction, board, beta - 1, beta, PV, currentLine,
+                                           finalDepth, False)[0]
+                    if score >= beta:
+                        AI.stats.nullMoveCuts += 1
+                        # a mate found by passing can't be trusted
+                        if score >= AI.MATE_BOUND:
+                            score = beta
+                        return score, AI.ttLine(currentLine, ply, None)
+
+            # futility pruning, too far below alpha for a quiet move to make it up
+            if AI.futilityPruning and depth < len(AI.futilityMargins):
+                if staticEval is None:
+                    staticEval = AI.searchEval(board)
+                futile = staticEval + AI.futilityMargins[depth] <= alpha
+
+        moveList = AI.moveOrder(board, PV, ply, ttMove)
+        if AI.rootShuffle is not None and ply == 0:
+            moveList = list(moveList)
+            rest = moveList[1:]
+            AI.rootShuffle.shuffle(rest)
+            moveList[1:] = rest
+        bestScore = -AI.INFINITE
+        bestMove = None
+        # a position with no moves returns the line that led to it
+        bestLine = AI.ttLine(currentLine, ply, None)
+        killers = AI.killer.get(board.ply(), ())
+        side = board.turn * 4096
+
+        # loop through the moves, make the move, score it, then undo the move
+        # index counts the legal moves, moves that leave the king attacked are taken straight back
+        index = -1
+        for move in moveList:
+            quiet = not move.promotion and not board.is_capture(move)
+            AI.pushMove(board, move)
+            if board.kingLeftInCheck():
+                AI.popMove(board)
+                continue
+            index += 1
+            currentLine[ply] = chess.Move.uci(move)
+            givesCheck = board.is_check()
+
+            # the first move is always searched, so there is a score even if everything else gets pruned
+            if futile and index > 0 and quiet and not givesCheck:
+                AI.popMove(board)
+                AI.stats.futilityPrunes += 1
+                continue
+
+            AI.stats.nodes += 1
+            if index == 0:
+                score, line = AI.negamax(depth - 1, board, -beta, -alpha, PV, currentLine, finalDepth)
+                score = -score
             else:
-                node = Node(1, depth=searchDepth, score=math.inf)
-            AI.transpoTable[hash] = node
-
-        moveList = AI.moveOrder(list(board.legal_moves), board, PV, depth, node)
-
-        # if it is whites turn
-        if isMaximizer:
-            # initial max score
-            maxScore = -math.inf
-
-            # loop through all the legal moves, make the move, score it, then undo the move
-            for move in moveList:
-                currentLine[-depth] = chess.Move.uci(move)
-                board.push(move)
-                AI.movesExplored += 1
-                depth -= 1
-                score, PVreturn = AI.minimax(depth, False, board, alpha, beta, PV, currentLine, finalDepth, searchDepth)
-                depth += 1
-                if score > maxScore:
-                    maxScore = score
-                    node.nodeScore = score
-                    node.bestMove = move
-                    node.PV = copy.copy(PVreturn)
-                alpha = max(score, alpha)
-                board.pop()
-                if maxScore >= beta:
-                    AI.killer[board.ply()].add(int(str(move.from_square) + str(move.to_square)))
-                    AI.cutNodes += 1
-                    AI.betaCuts += 1
-                    node.nodeType = 2
-                    break
-            return maxScore, node.PV
+                # late move reductions, quiet moves late in the list are searched shallower first
+                # every root move gets a full depth search, so the move that gets played was never reduced
+                reduction = 0
+                if AI.lateMoveReductions and ply > 0 and depth >= 3 and index >= AI.lmrFullMoves and quiet \
+                        and not inCheck and not givesCheck and move not in killers:
+                    reduction = AI.lmrTable[min(depth, 63)][min(index, 63)]
+                    if pvNode or AI.history[side + move.from_square * 64 + move.to_square] >= AI.lmrHistory:
+                        reduction -= 1
+                    reduction = max(0, min(reduction, depth - 2))
+                    if reduction:
+                        AI.stats.reductions += 1
+
+                score, line = AI.negamax(depth - 1 - reduction, board, -alpha - 1, -alpha, PV, currentLine, finalDepth)
+                score = -score
+                if reduction and score > alpha:
+                    score, line = AI.negamax(depth - 1, board, -alpha - 1, -alpha, PV, currentLine, finalDepth)
+                    score = -score
+                if alpha < score < beta:
+                    AI.stats.researches += 1
+                    score, line = AI.negamax(depth - 1, board, -beta, -alpha, PV, currentLine, finalDepth)
+                    score = -score
+            AI.popMove(board)
+
+            if score > bestScore:
+                bestScore = score
+                bestMove = move
+                bestLine = copy.copy(line)
+            alpha = max(score, alpha)
+            if alpha >= beta:
+                AI.recordCutoff(board, move, depth)
+                AI.stats.cutNodes += 1
+                if index == 0:
+                    AI.stats.firstMoveCuts += 1
+                break
 
-        # if it is blacks turn
-        else:
-            # initial min score
-            minScore = math.inf
-
-            # loop through all the legal moves, make the move, score it, then undo the move
-            for move in moveList:
-                currentLine[-depth] = chess.Move.uci(move)
-                board.push(move)
-                AI.movesExplored += 1
-                depth -= 1
-                score, PVreturn = AI.minimax(depth, True, board, alpha, beta, PV, currentLine, finalDepth, searchDepth)
-                depth += 1
-                if score < minScore:
-                    minScore = score
-                    node.nodeScore = score
-                    node.bestMove = move
-                    node.PV = copy.copy(PVreturn)
-                beta = min(score, beta)
-                board.pop()
-                if minScore <= alpha:
-                    AI.killer[board.ply()].add(int(str(move.from_square) + str(move.to_square)))
-                    AI.cutNodes += 1
-                    AI.alphaCuts += 1
-                    node.nodeType = 3
-                    break
-            return minScore, node.PV
+        # no moves is checkmate or stalemate
+        if bestMove is None:
+            bestScore = -(AI.MATE_SCORE - ply) if inCheck else 0
 
-    # starts the minimax algorithm and actually keeps track of and makes the best move
+        if bestScore >= betaOrig:
+            bound = TranspositionTable.LOWER
+        elif bestScore <= alphaOrig:
+            bound = TranspositionTable.UPPER
+        else:
+            bound = TranspositionTable.EXACT
+        AI.transpoTable.store(hash, depth, bound, AI.scoreToTT(bestScore, ply), bestMove)
+        if cached:
+            AI.searchCache.store(hash, depth, bound, AI.scoreToTT(bestScore, ply), bestMove)
+        return bestScore, bestLine
+
+    # line returned for a transposition table hit, the stored best move followed by nothing
+    # without a move it is just the line that led to this position
+    @staticmethod
+    def ttLine(currentLine, ply, ttMove):
+        line = currentLine[:ply] + [0] * (len(currentLine) - ply)
+        if ttMove is not None:
+            line[ply] = ttMove.uci()
+        return line
+
+    # aborts the search once it is told to stop, or runs past its deadline or node limit
+    # the clock is only read every 1024 nodes
+    @staticmethod
+    def checkTime():
+        nodes = AI.stats.nodes
+        if AI.stopEvent is not None and nodes & 1023 == 0 and AI.stopEvent.is_set():
+            raise SearchTimeout()
+        if AI.abortable:
+            if AI.stopSearch or (AI.nodeLimit is not None and nodes >= AI.nodeLimit):
+                raise SearchTimeout()
+            if AI.deadline is not None and nodes & 1023 == 0 and time.time() > AI.deadline:
+                raise SearchTimeout()
+
+    # how long the engine can spend on a move, in seconds
+    # returns a soft budget, after which no new iteration is started, and a hard budget,
+    # after which the search is aborted
+    # all the times passed in are in milliseconds, like the uci go command
     @staticmethod
-    def go(depth, board, alpha, beta):
+    def timeBudget(board, movetime=None, wtime=None, btime=None, winc=0, binc=0, movestogo=None):
+        if movetime is not None:
+            budget = max(movetime - AI.moveOverhead, 1) / 1000
+            return budget, budget
+
+        remaining = wtime if board.turn else btime
+        increment = (winc if board.turn else binc) or 0
+        if remaining is None:
+            remaining = btime if board.turn else wtime
+        remaining = max(remaining - AI.moveOverhead, 1)
+
+        soft = remaining / (movestogo or AI.defaultMovesToGo) + increment * 0.75
+        hard = min(remaining / 5, soft * 3)
+        return min(soft, hard) / 1000, hard / 1000
+
+    # the opponent played the move being pondered on
+    # can be called from any thread, while the ponder search runs or before it has started
+    # the iteration running at the hit only gets the soft budget, everything before it was searched for free
+    @staticmethod
+    def ponderHit():
+        AI.ponderHitTime = time.time()
+        if AI.ponderBudget is not None and AI.abortable:
+            AI.deadline = AI.ponderHitTime + AI.ponderBudget[0]
+        AI.pondering = False
+
+    # runs the iterative deepening search and returns the best move, its score, the PV, and its SearchStats
+    # the score and the alpha beta window are from white's point of view
+    # the board is left as it was found
+    # depth is the fixed search depth, or the depth limit when searching on a clock or without a limit
+    # movetime, or wtime/btime with their increments, switch the search to time management
+    # nodes limits the number of nodes searched, infinite searches until stopSearch is set
+    # ponder searches without a clock until ponderHit, set AI.pondering before starting it
+    # info is called with (depth, score, elapsed seconds, PV) after every finished iteration
+    # stats can be a SearchStats set up with timing or sampling turned on
+    @staticmethod
+    def search(board, depth=None, alpha=-math.inf, beta=math.inf, movetime=None, wtime=None, btime=None, winc=0,
+               binc=0, movestogo=None, nodes=None, infinite=False, ponder=False, info=None, stats=None):
 
-        bestScore = math.inf
+        bestScore = None
         bestMove = None
         PV = []
         finalDepth = False
@@ -491,69 +1246,185 @@ class AI:
         aspMisses = 0
         misses = []
 
+        # time management
+        # the deadline only goes live once the first iteration is done, so there is always a move to play
+        timed = movetime is not None or wtime is not None or btime is not None
+        start = time.time()
+        softTime = hardTime = None
+        if timed:
+            softTime, hardTime = AI.timeBudget(board, movetime, wtime, btime, winc, binc, movestogo)
+        if timed or infinite or not depth:
+            depth = depth or AI.maxDepth
+        AI.deadline = None
+        AI.nodeLimit = nodes
+        AI.abortable = False
+        AI.rootPly = len(board.move_stack)
+
+        # until the ponder hit the search has no clock, the limits it was given only apply from the hit on
+        if ponder:
+            AI.ponderBudget = (softTime, hardTime) if timed else None
+            ponderTimed, ponderInfinite = timed, infinite
+            timed, infinite = False, True
+
+        # the search itself works from the side to move's point of view
+        if not board.turn:
+            alpha, beta = -beta, -alpha
+        alpha = max(alpha, -AI.INFINITE)
+        beta = min(beta, AI.INFINITE)
+
+        # results of the last iteration that finished inside the aspiration window
+        completedMove = None
+        completedScore = None
+        completedPV = None
+
         # prepare the move list
         # for redundancy if we need to grab a random move
         moveListRaw = list(board.legal_moves)
 
+        # the search runs on its own board, which makes and takes back moves far faster than a chess.Board
+        board = SearchBoard(board)
+
+        # start the running evaluation from the root position
+        AI.resetIncremental(board)
+
+        # entries from earlier moves stay in the table, but become the first to be replaced
+        AI.transpoTable.newSearch()
+        AI.transpoTable.resetStats()
+        AI.pawnHash.resetStats()
+        AI.ageHistory()
+
+        AI.stats = stats or SearchStats()
+        AI.stats.startSampling()
+
+        # the tables already know the best move of a tablebase position, the search would only be slower at it
+        rootMove = AI.tablebase.rootMove(board) if AI.tablebase else None
+        if rootMove is not None:
+            completedMove, wdl = rootMove
+            completedScore = AI.tablebaseScore(wdl, 0)
+            completedPV = [completedMove.uci()]
+            AI.lastPV = completedPV
+            AI.stats.tablebaseHits += 1
+            AI.stats.finish(AI.transpoTable, AI.pawnHash)
+            if info is not None:
+                info(1, completedScore if board.turn else -completedScore, time.time() - start, completedPV)
+            return completedMove, completedScore if board.turn else -completedScore, completedPV, AI.stats
+
         # iterative deepening loop
         while not finalDepth:
-            currentLine = [0 for x in range(deep)]
+            currentLine = [0 for x in range(2 * deep)]
 
             # sets final depth flag
             if deep == depth:
                 finalDepth = True
 
-            if len(PV) != deep:
-                PV.append(0)
+            PV = PV + [0] * (2 * deep - len(PV))
+
+            # perform negamax search
+            # timed searches can stop at any depth, so they always finish with a quiescence search
+            try:
+                bestScore, PV = AI.negamax(deep, board, alpha, beta, PV, currentLine,
+                                           finalDepth or timed or infinite or nodes is not None)
+            except SearchTimeout:
+                # take back whatever the aborted iteration left on the board
+                while len(board.move_stack) > AI.rootPly:
+                    AI.popMove(board)
+                AI.stats.endIteration(deep, AI.transpoTable, AI.pawnHash)
+                break
+            AI.stats.endIteration(deep, AI.transpoTable, AI.pawnHash)
+
+            # the ponder hit came, from here on this is a normal search that started at the hit
+            if ponder and not AI.pondering:
+                ponder = False
+                timed, infinite = ponderTimed, ponderInfinite
+                if timed:
+                    start = AI.ponderHitTime
 
-            # perform minimax search
-            bestScore, PV = AI.minimax(deep, False, board, alpha, beta, PV, currentLine, finalDepth, deep)
             # If there is checkmate, there will be no best move, so an error will be raised
             # in that case, just pick a random one
             try:
                 bestMove = chess.Move.from_uci(PV[0])
             except:
-                bestMove = random.choice(moveListRaw)
+                bestMove = random.choice(moveListRaw) if moveListRaw else None
 
             # check to see if we found mate
-            if bestScore == math.inf or bestScore == -math.inf:
+            if abs(bestScore) >= AI.MATE_BOUND:
+                completedMove, completedScore, completedPV = bestMove, bestScore, copy.copy(PV)
+                if info is not None:
+                    info(deep, bestScore if board.turn else -bestScore, time.time() - start, PV)
                 break
 
             # set the aspiration window
             # search was outside the window, need to redo the search
             if bestScore <= alpha or bestScore >= beta:
-                alpha = -math.inf
-                beta = math.inf
+                alpha = -AI.INFINITE
+                beta = AI.INFINITE
                 finalDepth = False
                 aspMisses += 1
                 misses.append(deep)
             # the search didn't fall outside the window, we can move on to the next depth
             else:
+                # give the search more time when it changes its mind or the score drops
+                if timed and AI.timeExtensions and completedMove is not None:
+                    if bestMove != completedMove:
+                        softTime = min(softTime * 1.3, hardTime)
+                    if completedScore - bestScore >= 30:
+                        softTime = min(softTime * 1.5, hardTime)
+
+                completedMove, completedScore, completedPV = bestMove, bestScore, copy.copy(PV)
+                AI.abortable = True
+                if info is not None:
+                    info(deep, bestScore if board.turn else -bestScore, time.time() - start, PV)
                 alpha = bestScore - 50 * (aspMisses + 1)
                 beta = bestScore + 50 * (aspMisses + 1)
                 deep += 1
+
+                # the next iteration usually takes longer than every previous one put together,
+                # so don't start one that can't finish inside the soft budget
+                if timed:
+                    if time.time() - start > softTime / 2:
+                        break
+                    AI.deadline = start + hardTime
             # best move and best score need to be reset at the end of each loop
             # the move list will also need to be sorted
             # otherwise the next iteration will have out of date data comparing to new data
             if not finalDepth:
-                bestScore = math.inf
+                bestScore = None
                 bestMove = None
 
-        print("Total moves explored: ", AI.movesExplored)
-        print(f"Total Quiescence Moves Searched: {AI.quiesceExplored}")
-        print("Moves transposed: ", AI.movesTransposed)
+        AI.deadline = None
+        AI.nodeLimit = None
+        AI.abortable = False
+        AI.stats.aspirationMisses = misses
+        AI.stats.finish(AI.transpoTable, AI.pawnHash)
+        if AI.searchCache is not None:
+            AI.searchCache.flush()
+        AI.killer.pop(board.ply(), None)
+        # if the AI finds a mate in one, there will only be one killer set to delete
+        AI.killer.pop(board.ply() + 1, None)
+        AI.lastPV = completedPV or []
+        if completedScore is not None and not board.turn:
+            completedScore = -completedScore
+        return completedMove, completedScore, completedPV, AI.stats
+
+    # starts the search and actually keeps track of and makes the best move
+    # takes the same search limits as search, and returns its SearchStats
+    # result is the result of a search that already ran, like a ponder search that got its ponder hit
+    @staticmethod
+    def go(depth, board, alpha, beta, result=None, **limits):
+        bestMove, bestScore, PV, stats = result or AI.search(board, depth, alpha, beta, **limits)
+
+        print("Total moves explored: ", stats.nodes)
+        print(f"Total Quiescence Moves Searched: {stats.qnodes}")
+        print("Moves transposed: ", stats.ttCutoffs)
         print(f"Moving: {bestMove} with a score of {bestScore / 100}")
-        print(f"Cut nodes: {AI.cutNodes}, Alpha cuts: {AI.alphaCuts}, Beta cuts: {AI.betaCuts}")
-        print(f"Aspiration Window Misses: {aspMisses}, at depth(s): {misses}")
+        print(f"Cut nodes: {stats.cutNodes}, First move cuts: {stats.firstMoveCutRate():.1%}, "
+              f"PVS re-searches: {stats.researches}")
+        print(f"Aspiration Window Misses: {len(stats.aspirationMisses)}, at depth(s): {stats.aspirationMisses}")
         print(f"PV: {PV}")
-        AI.quiesceExplored = 0
-        AI.movesTransposed = 0
-        AI.cutNodes = 0
-        AI.alphaCuts = 0
-        AI.betaCuts = 0
-        AI.transpoTable.clear()
-        del AI.killer[board.ply()]
-        # if the AI finds a mate in one, there will only be one killer set to delete
-        if board.ply() + 1 in AI.killer.keys():
-            del AI.killer[board.ply() + 1]
+        print(f"Transposition table: {AI.transpoTable.stats()}")
         board.push(bestMove)
+        return stats
+
+
+AI.buildTables()
+AI.loadWeights(AI.weightsPath)
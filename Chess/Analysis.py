@@ -0,0 +1,81 @@
+import time
+
+import chess
+from AI import *
+from WorkerPool import *
+
+
+# result of analysing one position
+class AnalysisResult:
+    def __init__(self, index=None, fen=None, id=None, bestMove=None, score=None, PV=None, depth=None, nodes=0,
+                 seconds=0.0, operations=None, iterations=None, stats=None):
+        # position in the input, results from a pool come back in the order they finish
+        self.index = index
+        self.fen = fen
+        # the id opcode of an epd, if it had one
+        self.id = id
+        self.bestMove = bestMove
+        # centipawns from the side to move's point of view
+        self.score = score
+        self.PV = PV
+        self.depth = depth
+        self.nodes = nodes
+        self.seconds = seconds
+        # every epd opcode, like bm and am
+        self.operations = operations or {}
+        # (depth, seconds, best move) after every finished iteration
+        self.iterations = iterations or []
+        # SearchStats.toDict of the search
+        self.stats = stats or {}
+
+    def toDict(self):
+        return {"index": self.index, "fen": self.fen, "id": self.id,
+                "bestMove": self.bestMove.uci() if self.bestMove else None, "score": self.score, "PV": self.PV,
+                "depth": self.depth, "nodes": self.nodes, "seconds": self.seconds,
+                "iterations": [list(iteration) for iteration in self.iterations], "stats": self.stats}
+
+
+# class wrapping offline analysis of many positions
+class Analysis:
+    # reads a fen or epd line into a board and its epd opcodes
+    @staticmethod
+    def parsePosition(position):
+        if isinstance(position, chess.Board):
+            return position.copy(), {}
+        try:
+            return chess.Board(position), {}
+        except ValueError:
+            return chess.Board.from_epd(position)
+
+    # a search with neither a depth nor a move time would run to AI.maxDepth, which never finishes
+    @staticmethod
+    def checkLimits(depth, movetime):
+        if depth is None and movetime is None:
+            raise ValueError("analysis needs a depth or a move time")
+
+    # analyses a single position without touching the input, from empty tables, see AI.newGame
+    @staticmethod
+    def analyze(position, depth=None, movetime=None, index=None):
+        Analysis.checkLimits(depth, movetime)
+        board, operations = Analysis.parsePosition(position)
+        AI.newGame()
+
+        iterations = []
+        start = time.time()
+        bestMove, score, PV, stats = AI.search(board, depth, movetime=movetime,
+                                               info=lambda deep, score, elapsed, PV:
+                                               iterations.append((deep, elapsed, PV[0])))
+        seconds = time.time() - start
+
+        if score is not None and not board.turn:
+            score = -score
+        return AnalysisResult(index, board.fen(), operations.get("id"), bestMove, score,
+                              [move for move in PV or [] if move != 0], iterations[-1][0] if iterations else None,
+                              stats.nodes, seconds, operations, iterations, stats.toDict())
+
+    # analyses fens or epds across a pool of processes, yielding results as they finish, see WorkerPool.run
+    @staticmethod
+    def analyzeMany(positions, depth=None, movetime=None, workers=1, inFlight=4):
+        Analysis.checkLimits(depth, movetime)
+        tasks = ((Analysis.analyze, (position, depth, movetime, index)) for index, position in enumerate(positions))
+        yield from WorkerPool.run(tasks, workers, inFlight)
@@ -0,0 +1,327 @@
+import random
+import sys
+import time
+
+import chess
+from AI import *
+
+# numpy is optional, only the batch evaluator needs it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# AI.evaluateBoard over arrays of bitboards, with numpy
+# every term is worked out from the 12 piece bitboards with shifts, masks and popcounts, so a batch of thousands of
+# positions costs about the same number of numpy calls as a single one
+# the per call overhead makes it far slower than evaluateBoard for one position, it is meant for scoring
+# positions in bulk, like labelling datasets
+# scores match AI.evaluateBoard exactly, running this file checks that on a corpus of random game positions
+class BatchEval:
+    # order of the bitboards in a packed position, white pawn to king then black pawn to king
+    pieces = [(color, pieceType) for color in (chess.WHITE, chess.BLACK) for pieceType in chess.PIECE_TYPES]
+
+    # positions unpacked to single squares at once when summing piece square values, bounds the memory used
+    chunkSize = 4096
+
+    if np is not None:
+        notA = np.uint64(~chess.BB_FILE_A & chess.BB_ALL)
+        notAB = np.uint64(~(chess.BB_FILE_A | chess.BB_FILE_B) & chess.BB_ALL)
+        notH = np.uint64(~chess.BB_FILE_H & chess.BB_ALL)
+        notGH = np.uint64(~(chess.BB_FILE_G | chess.BB_FILE_H) & chess.BB_ALL)
+        full = np.uint64(chess.BB_ALL)
+        files = np.array(chess.BB_FILES, dtype=np.uint64)
+        ranks = np.array(chess.BB_RANKS, dtype=np.uint64)
+        d1 = np.uint64(chess.BB_D1)
+        d8 = np.uint64(chess.BB_D8)
+        whiteSpace = np.uint64(AI.whiteSpace)
+        blackSpace = np.uint64(AI.blackSpace)
+
+        # (shift, mask of squares the shift can land on without wrapping around the board)
+        orthogonal = [(8, full), (-8, full), (1, notA), (-1, notH)]
+        diagonal = [(9, notA), (7, notH), (-7, notA), (-9, notH)]
+
+        phaseWeights = np.array(AI.phaseWeights[1:] * 2, dtype=np.int64)
+
+    @staticmethod
+    def available():
+        return np is not None
+
+    # boards to a (positions, 12) array of piece bitboards and an array of full move numbers
+    @staticmethod
+    def pack(boards):
+        pieces = np.array([[board.pieces_mask(pieceType, color) for color, pieceType in BatchEval.pieces]
+                           for board in boards], dtype=np.uint64).reshape(len(boards), 12)
+        fullmoves = np.array([board.fullmove_number for board in boards], dtype=np.int64)
+        return pieces, fullmoves
+
+    @staticmethod
+    def shift(bitboards, amount):
+        if amount > 0:
+            return bitboards << np.uint64(amount)
+        return bitboards >> np.uint64(-amount)
+
+    @staticmethod
+    def popcount(bitboards):
+        x = bitboards - ((bitboards >> np.uint64(1)) & np.uint64(0x5555555555555555))
+        x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+        x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+        return ((x * np.uint64(0x0101010101010101)) >> np.uint64(56)).astype(np.int64)
+
+    # squares attacked by sliders moving in the given directions, stopping at the first piece in the way
+    # a kogge-stone fill, three doubling steps per direction instead of a loop over squares
+    @staticmethod
+    def slidingAttacks(sliders, empty, directions):
+        shift = BatchEval.shift
+        attacks = np.zeros_like(sliders)
+        for amount, mask in directions:
+            generator = sliders
+            propagator = empty & mask
+            generator = generator | (propagator & shift(generator, amount))
+            propagator = propagator & shift(propagator, amount)
+            generator = generator | (propagator & shift(generator, 2 * amount))
+            propagator = propagator & shift(propagator, 2 * amount)
+            generator = generator | (propagator & shift(generator, 4 * amount))
+            attacks |= shift(generator, amount) & mask
+        return attacks
+
+    @staticmethod
+    def pawnAttacks(pawns, color):
+        shift = BatchEval.shift
+        if color:
+            return (shift(pawns, 7) & BatchEval.notH) | (shift(pawns, 9) & BatchEval.notA)
+        return (shift(pawns, -9) & BatchEval.notH) | (shift(pawns, -7) & BatchEval.notA)
+
+    @staticmethod
+    def knightAttacks(knights):
+        shift = BatchEval.shift
+        one = (shift(knights, -1) & BatchEval.notH) | (shift(knights, 1) & BatchEval.notA)
+        two = (shift(knights, -2) & BatchEval.notGH) | (shift(knights, 2) & BatchEval.notAB)
+        return shift(one, 16) | shift(one, -16) | shift(two, 8) | shift(two, -8)
+
+    @staticmethod
+    def kingAttacks(kings):
+        shift = BatchEval.shift
+        row = kings | (shift(kings, -1) & BatchEval.notH) | (shift(kings, 1) & BatchEval.notA)
+        return (row | shift(row, 8) | shift(row, -8)) ^ kings
+
+    # every square a side attacks, the same as AI.attackedSquares
+    # pieces is the (positions, 12) array of packed positions, occupied every piece of each
+    @staticmethod
+    def attackedSquares(pieces, color, occupied):
+        offset = 0 if color else 6
+        empty = ~occupied
+        queens = pieces[:, offset + 4]
+        attacked = BatchEval.pawnAttacks(pieces[:, offset], color)
+        attacked |= BatchEval.knightAttacks(pieces[:, offset + 1])
+        attacked |= BatchEval.slidingAttacks(pieces[:, offset + 2] | queens, empty, BatchEval.diagonal)
+        attacked |= BatchEval.slidingAttacks(pieces[:, offset + 3] | queens, empty, BatchEval.orthogonal)
+        attacked |= BatchEval.kingAttacks(pieces[:, offset + 5])
+        return attacked
+
+    # every square on or in front of a pawn along its file, north is towards the eighth rank
+    @staticmethod
+    def northFill(bitboards):
+        bitboards = bitboards | (bitboards << np.uint64(8))
+        bitboards = bitboards | (bitboards << np.uint64(16))
+        return bitboards | (bitboards << np.uint64(32))
+
+    @staticmethod
+    def southFill(bitboards):
+        bitboards = bitboards | (bitboards >> np.uint64(8))
+        bitboards = bitboards | (bitboards >> np.uint64(16))
+        return bitboards | (bitboards >> np.uint64(32))
+
+    # the squares beside each square, on the files either side of it
+    @staticmethod
+    def eastWest(bitboards):
+        return (BatchEval.shift(bitboards, 1) & BatchEval.notA) | (BatchEval.shift(bitboards, -1) & BatchEval.notH)
+
+    # how often each pawn structure and king shelter term applies, white's count less black's
+    # a list of arrays in the order of pawnTermWeights, isolated, doubled, defended and backward pawns, passed pawns
+    # by rank, and pawns one and two ranks in front of the king
+    @staticmethod
+    def pawnTermCounts(pieces):
+        popcount = BatchEval.popcount
+        shift = BatchEval.shift
+        eastWest = BatchEval.eastWest
+        whitePawns, blackPawns = pieces[:, 0], pieces[:, 6]
+        whiteFiles = popcount(whitePawns[:, None] & BatchEval.files[None, :])
+        blackFiles = popcount(blackPawns[:, None] & BatchEval.files[None, :])
+        whiteAttacks = BatchEval.pawnAttacks(whitePawns, chess.WHITE)
+        blackAttacks = BatchEval.pawnAttacks(blackPawns, chess.BLACK)
+
+        # pawns on a file with no friendly pawns on either side
+        def isolated(counts):
+            neighbours = np.zeros_like(counts)
+            neighbours[:, 1:] += counts[:, :-1]
+            neighbours[:, :-1] += counts[:, 1:]
+            return (counts * (neighbours == 0)).sum(axis=1)
+
+        # pawns with no enemy pawn in front of them on their own file or the next files over
+        whitePassed = whitePawns & ~(BatchEval.southFill(blackPawns) >> np.uint64(8))
+        whitePassed &= ~eastWest(BatchEval.southFill(blackPawns) >> np.uint64(8))
+        blackPassed = blackPawns & ~(BatchEval.northFill(whitePawns) << np.uint64(8))
+        blackPassed &= ~eastWest(BatchEval.northFill(whitePawns) << np.uint64(8))
+        whitePassed = popcount(whitePassed[:, None] & BatchEval.ranks[None, :])
+        blackPassed = popcount(blackPassed[:, None] & BatchEval.ranks[None, ::-1])
+
+        # pawns with no friendly pawn beside or behind them on the next files over, whose stop square is covered
+        whiteBackward = whitePawns & ~eastWest(BatchEval.northFill(whitePawns)) & shift(blackAttacks, -8)
+        blackBackward = blackPawns & ~eastWest(BatchEval.southFill(blackPawns)) & shift(whiteAttacks, 8)
+
+        # pawns one and two ranks in front of the king, on its file or the next files over
+        whiteKing = pieces[:, 5] | eastWest(pieces[:, 5])
+        blackKing = pieces[:, 11] | eastWest(pieces[:, 11])
+        shields = [popcount(whitePawns & shift(whiteKing, 8)) - popcount(blackPawns & shift(blackKing, -8)),
+                   popcount(whitePawns & shift(whiteKing, 16)) - popcount(blackPawns & shift(blackKing, -16))]
+
+        return [isolated(whiteFiles) - isolated(blackFiles),
+                (whiteFiles > 1).sum(axis=1) - (blackFiles > 1).sum(axis=1),
+                popcount(whitePawns & whiteAttacks) - popcount(blackPawns & blackAttacks),
+                popcount(whiteBackward) - popcount(blackBackward)] + \
+            list((whitePassed - blackPassed).T) + shields
+
+    # the (middlegame, endgame) weight of every term of pawnTermCounts
+    @staticmethod
+    def pawnTermWeights():
+        return [AI.isolatedPawn, AI.doubledPawn, AI.defendedPawn, AI.backwardPawn] + AI.passedPawn + AI.pawnShield
+
+    # pawn structure and king shelter as (middlegame, endgame) arrays, the same terms as AI.pawnStructure
+    @staticmethod
+    def pawnStructure(pieces):
+        middlegame = np.zeros(len(pieces), dtype=np.int64)
+        endgame = np.zeros(len(pieces), dtype=np.int64)
+        for count, (termMiddlegame, termEndgame) in zip(BatchEval.pawnTermCounts(pieces),
+                                                        BatchEval.pawnTermWeights()):
+            middlegame += termMiddlegame * count
+            endgame += termEndgame * count
+        return middlegame, endgame
+
+    # packed positions unpacked to a (positions, 12, 64) array of ones on the squares each piece is on
+    @staticmethod
+    def squares(pieces):
+        return np.unpackbits(pieces.astype('<u8').view(np.uint8).reshape(len(pieces), 12, 8), axis=2,
+                             bitorder='little')
+
+    # material and piece square values as (middlegame, endgame) arrays, the same as AI.materialScore
+    @staticmethod
+    def materialScore(pieces):
+        # material + piece square value of every piece on every square, in the order of the packed positions,
+        # read from AI every time so weights loaded later are used
+        middlegameValues = np.array(AI.middlegameValues, dtype=np.int64).reshape(12, 64)
+        endgameValues = np.array(AI.endgameValues, dtype=np.int64).reshape(12, 64)
+        middlegame = np.empty(len(pieces), dtype=np.int64)
+        endgame = np.empty(len(pieces), dtype=np.int64)
+        for start in range(0, len(pieces), BatchEval.chunkSize):
+            squares = BatchEval.squares(pieces[start:start + BatchEval.chunkSize])
+            middlegame[start:start + len(squares)] = np.einsum('nps,ps->n', squares, middlegameValues)
+            endgame[start:start + len(squares)] = np.einsum('nps,ps->n', squares, endgameValues)
+        return middlegame, endgame
+
+    # blends middlegame and endgame scores by game phase, the same as AI.taper
+    @staticmethod
+    def taper(pieces, middlegame, endgame):
+        phase = np.minimum(BatchEval.popcount(pieces) @ BatchEval.phaseWeights, AI.maxPhase)
+        return (middlegame * phase + endgame * (AI.maxPhase - phase)) // AI.maxPhase
+
+    # bishop pair, queens moved too early, and space, white minus black, for every position
+    @staticmethod
+    def extraTermCounts(pieces, fullmoves):
+        popcount = BatchEval.popcount
+        white = np.bitwise_or.reduce(pieces[:, :6], axis=1)
+        black = np.bitwise_or.reduce(pieces[:, 6:], axis=1)
+        occupied = white | black
+
+        bishopPair = (popcount(pieces[:, 2]) == 2).astype(np.int64) - (popcount(pieces[:, 8]) == 2)
+
+        queens = pieces[:, 4] | pieces[:, 10]
+        early = fullmoves < 8
+        earlyQueen = (early & ((queens & BatchEval.d8) == 0)).astype(np.int64) - \
+            (early & ((queens & BatchEval.d1) == 0))
+
+        space = popcount(BatchEval.whiteSpace & ~BatchEval.attackedSquares(pieces, chess.BLACK, occupied)) - \
+            popcount(BatchEval.blackSpace & ~BatchEval.attackedSquares(pieces, chess.WHITE, occupied))
+        return [bishopPair, earlyQueen, space]
+
+    # the weights of extraTermCounts, in the same order
+    @staticmethod
+    def extraTermWeights():
+        return [AI.bishopPair, AI.earlyQueen, AI.spaceBonus]
+
+    # static scores of packed positions from white's point of view
+    # finished games aren't recognised here, that takes move generation, see evaluateMany
+    @staticmethod
+    def evaluateBitboards(pieces, fullmoves):
+        middlegame, endgame = BatchEval.materialScore(pieces)
+        pawnMiddlegame, pawnEndgame = BatchEval.pawnStructure(pieces)
+        score = BatchEval.taper(pieces, middlegame + pawnMiddlegame, endgame + pawnEndgame)
+
+        for counts, weight in zip(BatchEval.extraTermCounts(pieces, fullmoves), BatchEval.extraTermWeights()):
+            score += weight * counts
+        return score
+
+    # scores of a list of boards from white's point of view, the same as AI.evaluateBoard on each
+    # terminal checks each board for a finished game, which is most of the cost, and can be turned off for
+    # positions known to have moves
+    @staticmethod
+    def evaluateMany(boards, terminal=True):
+        if np is None:
+            raise ImportError("the batch evaluator needs numpy")
+        pieces, fullmoves = BatchEval.pack(boards)
+        scores = BatchEval.evaluateBitboards(pieces, fullmoves)
+        if terminal:
+            for index, board in enumerate(boards):
+                if board.is_game_over():
+                    outcome = board.outcome()
+                    if outcome.termination == chess.Termination.CHECKMATE:
+                        scores[index] = AI.MATE_SCORE if outcome.winner else -AI.MATE_SCORE
+                    else:
+                        scores[index] = 0
+        return scores
+
+    @staticmethod
+    def evaluate(board):
+        return int(BatchEval.evaluateMany([board])[0])
+
+    # positions from random games, a corpus for comparing evaluators
+    @staticmethod
+    def randomPositions(count, seed=0):
+        generator = random.Random(seed)
+        positions = []
+        while len(positions) < count:
+            board = chess.Board()
+            while not board.is_game_over() and len(positions) < count:
+                board.push(generator.choice(list(board.legal_moves)))
+                positions.append(board.copy(stack=False))
+        return positions
+
+    # compares the batch evaluator against AI.evaluateBoard, returns the boards where they differ
+    @staticmethod
+    def check(boards):
+        start = time.time()
+        expected = [AI.evaluateBoard(board) for board in boards]
+        scalarTime = time.time() - start
+
+        start = time.time()
+        scores = BatchEval.evaluateMany(boards)
+        batchTime = time.time() - start
+
+        start = time.time()
+        BatchEval.evaluateMany(boards, terminal=False)
+        staticTime = time.time() - start
+
+        print(f"{len(boards)} positions, evaluateBoard {scalarTime:.2f}s, batch {batchTime:.2f}s, "
+              f"batch without finished game checks {staticTime:.2f}s")
+        return [board for board, score, expect in zip(boards, scores, expected) if score != expect]
+
+
+if __name__ == "__main__":
+    boards = BatchEval.randomPositions(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
+    boards += [chess.Board(fen) for fen in ["r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                                            "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1"]]
+    mismatches = BatchEval.check(boards)
+    for board in mismatches[:10]:
+        print(f"mismatch: {board.fen()}")
+    print(f"{len(mismatches)} mismatches")
@@ -0,0 +1,200 @@
+import json
+import time
+
+import chess
+import chess.polyglot
+from AI import *
+from Analysis import *
+from LazySMP import *
+
+
+# class wrapping the benchmarks used to measure engine performance
+class Benchmark:
+    # positions used by the micro benchmarks, a mix of openings, middlegames, and endgames
+    positions = [chess.STARTING_FEN,
+                 "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                 "3r2k1/p2r1p1p/1p2p1p1/q4n2/3P4/PQ5P/1P1RNPP1/3R2K1 b - - 0 1",
+                 "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                 "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8"]
+
+    # depth the bench signature is searched to
+    # the signature is the total node count over the positions above, so changing either changes it
+    benchDepth = 3
+
+    # compares the cost per node of hashing every position from scratch against the running hash
+    # both walk the same move tree to the given depth, only the hashing differs
+    @staticmethod
+    def hashing(depth=3, fens=None):
+        def walkFull(board, depth):
+            chess.polyglot.zobrist_hash(board)
+            if depth == 0:
+                return 1
+            nodes = 1
+            for move in board.legal_moves:
+                board.push(move)
+                nodes += walkFull(board, depth - 1)
+                board.pop()
+            return nodes
+
+        def walkRunning(board, depth):
+            AI.positionHash(board)
+            if depth == 0:
+                return 1
+            nodes = 1
+            for move in board.legal_moves:
+                AI.hashedPush(board, move)
+                nodes += walkRunning(board, depth - 1)
+                AI.hashedPop(board)
+            return nodes
+
+        def walkNone(board, depth):
+            if depth == 0:
+                return 1
+            nodes = 1
+            for move in board.legal_moves:
+                board.push(move)
+                nodes += walkNone(board, depth - 1)
+                board.pop()
+            return nodes
+
+        results = {}
+        for name, walk in (("none", walkNone), ("full", walkFull), ("running", walkRunning)):
+            nodes = 0
+            start = time.perf_counter()
+            for fen in fens or Benchmark.positions:
+                board = chess.Board(fen)
+                AI.resetIncremental(board)
+                nodes += walk(board, depth)
+            results[name] = (nodes, time.perf_counter() - start)
+
+        nodes, baseTime = results["none"]
+        fullCost = (results["full"][1] - baseTime) / nodes * 1e6
+        runningCost = (results["running"][1] - baseTime) / nodes * 1e6
+        print(f"Nodes walked: {nodes}")
+        print(f"chess.polyglot.zobrist_hash: {fullCost:.2f} microseconds per node")
+        print(f"Running hash: {runningCost:.2f} microseconds per node")
+        return fullCost, runningCost
+
+    # time to reach a fixed depth with different numbers of lazy smp processes
+    # every run starts from an empty table, so only the parallel search itself is measured
+    @staticmethod
+    def smpScaling(depth=4, workers=(1, 2, 4, 8), fens=None, sizeMB=16):
+        results = {}
+        for threads in workers:
+            smp = LazySMP(threads, sizeMB)
+            elapsed = 0
+            nodes = 0
+            try:
+                for fen in fens or Benchmark.positions:
+                    smp.table.clear()
+                    start = time.perf_counter()
+                    smp.search(chess.Board(fen), depth)
+                    elapsed += time.perf_counter() - start
+                    nodes += smp.nodes
+            finally:
+                smp.close()
+            results[threads] = (elapsed, nodes)
+
+        baseTime = results[workers[0]][0]
+        for threads, (elapsed, nodes) in results.items():
+            print(f"{threads} worker(s): {elapsed:.2f} seconds to depth {depth}, {nodes} nodes, "
+                  f"speedup {baseTime / elapsed:.2f}")
+        return results
+
+    # reads the positions of an epd file, skipping blank lines and comments
+    @staticmethod
+    def loadEPD(path):
+        with open(path) as file:
+            return [line.strip() for line in file if line.strip() and not line.startswith("#")]
+
+    # whether a move solves an epd, bm lists the right moves and am the wrong ones
+    @staticmethod
+    def solves(operations, move):
+        if move is None or ("bm" not in operations and "am" not in operations):
+            return False
+        if "bm" in operations and move not in operations["bm"]:
+            return False
+        if "am" in operations and move in operations["am"]:
+            return False
+        return True
+
+    # seconds until the search settled on a solving move for good, None if it never did
+    @staticmethod
+    def timeToSolution(result):
+        solvedAt = None
+        for depth, seconds, move in result.iterations:
+            if Benchmark.solves(result.operations, chess.Move.from_uci(move)):
+                if solvedAt is None:
+                    solvedAt = seconds
+            else:
+                solvedAt = None
+        return solvedAt
+
+    # totals over a list of analysis results
+    @staticmethod
+    def summarize(results):
+        nodes = sum(result.nodes for result in results)
+        seconds = sum(result.seconds for result in results)
+        qnodes = sum(result.stats.get("qnodes", 0) for result in results)
+        probes = sum(result.stats.get("ttProbes", 0) for result in results)
+        hits = sum(result.stats.get("ttHits", 0) for result in results)
+        cutNodes = sum(result.stats.get("cutNodes", 0) for result in results)
+        pawnProbes = sum(result.stats.get("pawnProbes", 0) for result in results)
+        pawnHits = sum(result.stats.get("pawnHits", 0) for result in results)
+        return {"positions": len(results), "nodes": nodes, "qnodes": qnodes, "seconds": seconds,
+                "nps": int(nodes / seconds) if seconds else 0, "ttHitRate": hits / probes if probes else 0.0,
+                "pawnHitRate": pawnHits / pawnProbes if pawnProbes else 0.0,
+                "cutRatio": cutNodes / (nodes - qnodes) if nodes > qnodes else 0.0,
+                "researches": sum(result.stats.get("researches", 0) for result in results)}
+
+    # runs every position of an epd suite at a fixed depth or move time
+    # prints the solve rate and search totals, and writes everything to a json file if given one
+    @staticmethod
+    def runSuite(path, depth=None, movetime=None, workers=1, output=None):
+        results = sorted(Analysis.analyzeMany(Benchmark.loadEPD(path), depth, movetime, workers),
+                         key=lambda result: result.index)
+
+        positions = []
+        solved = 0
+        for result in results:
+            record = result.toDict()
+            record["solved"] = Benchmark.solves(result.operations, result.bestMove)
+            record["timeToSolution"] = Benchmark.timeToSolution(result)
+            solved += record["solved"]
+            positions.append(record)
+            print(f"{result.id or result.index}: {'solved' if record['solved'] else 'failed'} with "
+                  f"{result.bestMove} at depth {result.depth}, {result.nodes} nodes in {result.seconds:.2f} seconds")
+
+        summary = Benchmark.summarize(results)
+        summary["solved"] = solved
+        summary["solveRate"] = solved / len(results) if results else 0.0
+        print(f"Solved {solved} of {len(results)} ({summary['solveRate']:.0%})")
+        print(f"Nodes: {summary['nodes']}, NPS: {summary['nps']}, TT hit rate: {summary['ttHitRate']:.1%}, "
+              f"cut ratio: {summary['cutRatio']:.1%}")
+
+        if output is not None:
+            with open(output, "w") as file:
+                json.dump({"suite": path, "depth": depth, "movetime": movetime, "summary": summary,
+                           "positions": positions}, file, indent=2)
+        return summary
+
+    # the bench signature, a fixed search over fixed positions
+    # the node count only changes when the search does, so it catches changes that were meant to be speed only
+    @staticmethod
+    def bench(depth=None, output=None):
+        depth = depth or Benchmark.benchDepth
+        results = list(Analysis.analyzeMany(Benchmark.positions, depth))
+        summary = Benchmark.summarize(results)
+        print(f"Nodes searched: {summary['nodes']}")
+        print(f"Nodes/second: {summary['nps']}")
+
+        if output is not None:
+            with open(output, "w") as file:
+                json.dump({"bench": summary["nodes"], "depth": depth, "summary": summary,
+                           "positions": [result.toDict() for result in results]}, file, indent=2)
+        return summary["nodes"]
+
+
+if __name__ == "__main__":
+    Benchmark.hashing()
+    Benchmark.smpScaling()
@@ -1,67 +1,270 @@
-import time
-
-from AI import *
-import chess
-import chess.engine
-import chess.polyglot
-from Game import *
-
-
-if __name__ == "__main__":
-
-    # the chess board
-    board = chess.Board()
-    # test positions
-    #board.set_epd("3r2k1/p2r1p1p/1p2p1p1/q4n2/3P4/PQ5P/1P1RNPP1/3R2K1 b - - bm Nxd4; id \"position 02\";")
-
-    # set this to true if you want to use an opening book
-    opening = False
-
-    #board.push(chess.Move.from_uci("d2d4"))
-    Game.displayBoard(board)
-    print(f"Current board evaluation: {AI.evaluateBoard(board) / 100}")
-
-    # stockfish engine for playing the AI against
-    # this exists because I don't want to have to play full
-    # games against it myself to test how good it is
-    # stockfish will also give me a more repeatable performance
-    stockfish = chess.engine.SimpleEngine.popen_uci("C:\\Users\\Hughe\\Desktop\\arena_3.5.1\\Engines\\stockfish_14_win_x64_avx2\\stockfish_14_x64_avx2.exe")
-    stockfish.configure({"UCI_LimitStrength": True, "UCI_Elo": 1350})
-
-    # game loop
-    while not board.is_game_over():
-        if board.turn:
-            #Game.turn(board)
-            Game.fishMove(stockfish, 5, board)
-
-        else:
-            print("Black to move")
-            if opening:
-                try:
-                    with chess.polyglot.open_reader("C:\\Users\\Hughe\\Desktop\\VSCode Projects\\Chess-Engine\\Chess\\Opening Books\\codekiddy.bin") as reader:
-                        move = reader.choice(board).move
-                        print(f"Moving {move} from opening book")
-                        board.push(move)
-                except IndexError:
-                    print("Reached end of opening book\nStarting AI")
-                    opening = False
-            if not opening:
-                start = time.time()
-                AI.go(5, board, -math.inf, math.inf)
-                end = time.time()
-                print(f"Time spent searching: {end - start} seconds")
-                print(f"Nodes per second: {AI.movesExplored / (end - start)}")
-                AI.movesExplored = 0
-        Game.displayBoard(board)
-        print(f"Current board evaluation: {AI.evaluateBoard(board) / 100}")
-        print(f"Current board FEN: {board.fen()}")
-
-    # show who won
-    if board.outcome().termination == chess.Termination.CHECKMATE:
-        if board.outcome().winner:
-            print("Checkmate.  White wins.")
-        else:
-            print("Checkmate.  Black wins.")
-
-    else:
-        print("Stalemate.  Its a draw.")
+import argparse
+import threading
+import time
+
+from AI import *
+import chess
+import chess.engine
+import chess.polyglot
+from Benchmark import *
+from Game import *
+from Match import *
+from OpeningBook import *
+from Perft import *
+from TrainingData import *
+from Tuner import *
+from UCI import *
+
+
+# searches the position after the reply the last search expects, on a background thread
+# returns the reply, the thread, and a list the thread puts the search result in, or None without a reply to expect
+def startPondering(board, depth):
+    if len(AI.lastPV) < 2 or not AI.lastPV[1]:
+        return None
+    reply = chess.Move.from_uci(AI.lastPV[1])
+    if not board.is_legal(reply):
+        return None
+    ponderBoard = board.copy()
+    ponderBoard.push(reply)
+    result = []
+    AI.stopSearch = False
+    AI.pondering = True
+    thread = threading.Thread(target=lambda: result.append(AI.search(ponderBoard, depth, ponder=True)), daemon=True)
+    thread.start()
+    return reply, thread, result
+
+
+# ends pondering once the opponent has played move
+# returns the finished search on a ponder hit, otherwise stops it and returns None
+# either way the transposition table, killers, and history it filled are still there for the next search
+def stopPondering(pondering, move):
+    if pondering is None:
+        return None
+    reply, thread, result = pondering
+    if move == reply:
+        print("Ponder hit")
+        AI.ponderHit()
+        thread.join()
+        return result[0]
+    AI.stopSearch = True
+    thread.join()
+    AI.stopSearch = False
+    AI.pondering = False
+    return None
+
+
+# plays a game against stockfish, or against a human if stockfish is None
+# black plays from the opening book while it has the position, book is an OpeningBook, empty for no book
+# with ponder on, black searches the reply it expects while white thinks
+def play(stockfishPath, book, ponder=False):
+    # the chess board
+    board = chess.Board()
+    # test positions
+    #board.set_epd("3r2k1/p2r1p1p/1p2p1p1/q4n2/3P4/PQ5P/1P1RNPP1/3R2K1 b - - bm Nxd4; id \"position 02\";")
+
+    #board.push(chess.Move.from_uci("d2d4"))
+    Game.displayBoard(board)
+    print(f"Current board evaluation: {AI.evaluateBoard(board) / 100}")
+
+    # stockfish engine for playing the AI against
+    # this exists because I don't want to have to play full
+    # games against it myself to test how good it is
+    # stockfish will also give me a more repeatable performance
+    stockfish = None
+    if stockfishPath is not None:
+        stockfish = chess.engine.SimpleEngine.popen_uci(stockfishPath)
+        stockfish.configure({"UCI_LimitStrength": True, "UCI_Elo": 1350})
+
+    # finished search of black's next move, from a ponder hit
+    pondered = None
+
+    # game loop
+    while not board.is_game_over():
+        if board.turn:
+            pondering = startPondering(board, 5) if ponder else None
+            if stockfish is None:
+                Game.turn(board)
+            else:
+                Game.fishMove(stockfish, 5, board)
+            pondered = stopPondering(pondering, board.peek())
+
+        else:
+            print("Black to move")
+            move = book.choose(board)
+            if move is not None:
+                print(f"Moving {move} from opening book")
+                board.push(move)
+                # nothing was searched, so there is no reply to ponder on
+                AI.lastPV = []
+            else:
+                stats = AI.go(5, board, -math.inf, math.inf, pondered)
+                print(f"Time spent searching: {stats.seconds} seconds")
+                print(f"Nodes per second: {stats.nps()}")
+        Game.displayBoard(board)
+        print(f"Current board evaluation: {AI.evaluateBoard(board) / 100}")
+        print(f"Current board FEN: {board.fen()}")
+
+    if stockfish is not None:
+        stockfish.quit()
+    book.close()
+
+    # show who won
+    if board.outcome().termination == chess.Termination.CHECKMATE:
+        if board.outcome().winner:
+            print("Checkmate.  White wins.")
+        else:
+            print("Checkmate.  Black wins.")
+
+    else:
+        print("Stalemate.  Its a draw.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python chess engine made with python-chess")
+    parser.add_argument("--pawn-hash", metavar="FILE",
+                        help="pawn hash file, loaded at start if it matches the pawn terms and saved on exit")
+    parser.add_argument("--syzygy", action="append", default=[], metavar="DIR",
+                        help="directory of syzygy endgame tablebases, can be given more than once")
+    parser.add_argument("--search-cache", metavar="FILE",
+                        help="sqlite file of deep search results to keep between runs")
+    parser.add_argument("--search-cache-size", type=int, default=200000, metavar="ENTRIES",
+                        help="positions kept in the search cache before the least recently used are dropped")
+    commands = parser.add_subparsers(dest="command")
+
+    playParser = commands.add_parser("play", help="play a game in the console (the default)")
+    playParser.add_argument("--stockfish",
+                            default="C:\\Users\\Hughe\\Desktop\\arena_3.5.1\\Engines\\stockfish_14_win_x64_avx2\\"
+                                    "stockfish_14_x64_avx2.exe",
+                            help="stockfish binary to play white, 'none' to play white yourself")
+
+    playParser.add_argument("--book", nargs="+", default=[], metavar="FILE",
+                            help="polyglot opening books for black, probed in order")
+    playParser.add_argument("--book-selection", default="weighted", choices=OpeningBook.selections,
+                            help="how a move is picked from the book's moves")
+    playParser.add_argument("--ponder", action="store_true", help="think about black's reply on white's time")
+
+    uciParser = commands.add_parser("uci", help="speak the uci protocol on stdin/stdout")
+    uciParser.add_argument("--book", nargs="+", default=[], metavar="FILE",
+                           help="polyglot opening books, probed in order, turns OwnBook on")
+
+    bookParser = commands.add_parser("book", help="build a polyglot opening book from pgn files")
+    bookParser.add_argument("pgn", nargs="+", help="pgn files of games to take the openings from")
+    bookParser.add_argument("--output", required=True, help="polyglot book file to write")
+    bookParser.add_argument("--plies", type=int, default=20, help="moves of each game to put in the book")
+    bookParser.add_argument("--min-games", type=int, default=2,
+                            help="leave out moves played in fewer games than this")
+
+    benchParser = commands.add_parser("bench", help="run the bench signature, or an epd suite if given one")
+    benchParser.add_argument("suite", nargs="?", help="epd file with bm/am/id opcodes")
+    benchParser.add_argument("--depth", type=int, help="fixed search depth")
+    benchParser.add_argument("--movetime", type=int, help="search time per position in milliseconds")
+    benchParser.add_argument("--workers", type=int, default=1, help="processes to spread the suite across")
+    benchParser.add_argument("--output", help="json file to write the results to")
+    benchParser.add_argument("--disable", nargs="+", default=[], metavar="FEATURE",
+                             choices=AI.searchFeatures,
+                             help="search features to switch off, to measure what they are worth")
+
+    perftParser = commands.add_parser("perft", help="count the move tree of the reference positions, or of a fen")
+    perftParser.add_argument("fen", nargs="?", help="position to count instead of the reference positions")
+    perftParser.add_argument("--depth", type=int, default=3, help="deepest depth to count")
+    perftParser.add_argument("--divide", action="store_true", help="break the deepest count down by root move")
+    perftParser.add_argument("--workers", type=int, default=1, help="processes to split the root moves across")
+
+    matchParser = commands.add_parser("match", help="play a match against another engine, across a pool of processes")
+    matchParser.add_argument("--opponent", required=True,
+                             help="uci command line of the opponent, like a stockfish binary or "
+                                  "'python /path/to/baseline/Chess/Chess.py uci', or 'engine' for self play")
+    matchParser.add_argument("--engine", default=Match.ENGINE,
+                             help="uci command line of the first player, 'engine' for this engine (the default)")
+    matchParser.add_argument("--engine-option", nargs="+", default=[], metavar="NAME=VALUE",
+                             help="uci options of the first player")
+    matchParser.add_argument("--opponent-option", nargs="+", default=[], metavar="NAME=VALUE",
+                             help="uci options of the opponent, like UCI_LimitStrength=true UCI_Elo=1350")
+    matchParser.add_argument("--games", type=int, default=100, help="games to play, every opening is played twice")
+    matchParser.add_argument("--workers", type=int, default=1, help="games played at once")
+    matchParser.add_argument("--depth", type=int, help="fixed search depth")
+    matchParser.add_argument("--nodes", type=int, help="fixed node count per move")
+    matchParser.add_argument("--movetime", type=int, help="search time per move in milliseconds")
+    matchParser.add_argument("--tc", help="time control in seconds, base+increment like 10+0.1")
+    matchParser.add_argument("--openings", help="pgn, epd, or fen file of openings, or lines of uci moves")
+    matchParser.add_argument("--opening-plies", type=int, default=8, help="plies of each pgn game to open with")
+    matchParser.add_argument("--pgn", help="pgn file the games are added to")
+    matchParser.add_argument("--sprt", nargs=2, type=float, metavar=("ELO0", "ELO1"),
+                             help="stop once an sprt decides between the two elo differences")
+
+    datagenParser = commands.add_parser("datagen", help="label positions from self play or pgn files with the search")
+    datagenParser.add_argument("--output", required=True, help="directory the chunk files are written to")
+    datagenParser.add_argument("--pgn", nargs="+", default=[], help="pgn files to label instead of playing games")
+    datagenParser.add_argument("--games", type=int, help="games to play or read, 100 self play games by default")
+    datagenParser.add_argument("--depth", type=int, help="fixed search depth of every label")
+    datagenParser.add_argument("--nodes", type=int, help="fixed node count of every label")
+    datagenParser.add_argument("--workers", type=int, default=1, help="processes to spread the games across")
+    datagenParser.add_argument("--random-plies", type=int, default=8,
+                               help="random moves each self play game starts with")
+    datagenParser.add_argument("--skip-plies", type=int, default=8, help="opening plies of pgn games left out")
+    datagenParser.add_argument("--all", action="store_true",
+                               help="keep positions in check, with a tactical best move, or with a mate score")
+    datagenParser.add_argument("--seed", type=int, default=0, help="seed of the random self play openings")
+    datagenParser.add_argument("--chunk-size", type=int, default=1 << 20, help="positions per chunk file")
+
+    tuneParser = commands.add_parser("tune", help="tune the evaluation weights against training data")
+    tuneParser.add_argument("data", nargs="+", help="training data directories or chunk files")
+    tuneParser.add_argument("--output", help="weights file to write, by default the one the engine loads at startup")
+    tuneParser.add_argument("--positions", type=int, help="positions picked at random, all of them by default")
+    tuneParser.add_argument("--iterations", type=int, default=1000, help="gradient steps")
+    tuneParser.add_argument("--learning-rate", type=float, default=1.0, help="step size in centipawns")
+    tuneParser.add_argument("--score-weight", type=float, default=0.0,
+                            help="share of the search scores in the targets, the rest is the game results")
+
+    args = parser.parse_args()
+
+    if args.pawn_hash is not None:
+        AI.pawnHash.load(args.pawn_hash, AI.pawnTermsVersion())
+    for directory in args.syzygy:
+        AI.tablebase.addDirectory(directory)
+    if args.search_cache is not None:
+        AI.searchCache = SearchCache(args.search_cache, AI.evaluationVersion(), args.search_cache_size)
+
+    try:
+        if args.command == "uci":
+            UCI(book=OpeningBook(args.book)).loop()
+        elif args.command == "book":
+            entries = OpeningBook.build(args.pgn, args.output, args.plies, args.min_games)
+            print(f"Wrote {entries} entries to {args.output}")
+        elif args.command == "match":
+            limits = {name: getattr(args, name) for name in ("depth", "nodes", "movetime")
+                      if getattr(args, name) is not None}
+            if args.tc is not None:
+                limits["tc"] = Match.parseTimeControl(args.tc)
+            options = tuple(dict(option.split("=", 1) for option in playerOptions)
+                            for playerOptions in (args.engine_option, args.opponent_option))
+            openings = Match.loadOpenings(args.openings, args.opening_plies) if args.openings else None
+            Match((args.engine, args.opponent), options, limits, args.games, args.workers, openings, args.pgn,
+                  args.sprt).run()
+        elif args.command == "datagen":
+            limits = {name: getattr(args, name) for name in ("depth", "nodes") if getattr(args, name) is not None}
+            TrainingData.generate(args.output, limits or {"depth": 4}, args.games, args.pgn, args.workers,
+                                  args.random_plies, skipPlies=args.skip_plies, quiet=not args.all, seed=args.seed,
+                                  chunkRecords=args.chunk_size)
+        elif args.command == "tune":
+            Tuner.run(args.data, args.output, args.positions, args.iterations, args.learning_rate, args.score_weight)
+        elif args.command == "perft":
+            Perft.run(args.depth, [("position", args.fen, [])] if args.fen else None, args.workers, args.divide)
+        elif args.command == "bench":
+            for feature in args.disable:
+                setattr(AI, feature, False)
+            if args.suite is None:
+                Benchmark.bench(args.depth, args.output)
+            elif args.depth is None and args.movetime is None:
+                benchParser.error("a suite needs --depth or --movetime")
+            else:
+                Benchmark.runSuite(args.suite, args.depth, args.movetime, args.workers, args.output)
+        else:
+            path = getattr(args, "stockfish", playParser.get_default("stockfish"))
+            book = OpeningBook(getattr(args, "book", []), getattr(args, "book_selection", "weighted"))
+            play(None if path.lower() == "none" else path, book, getattr(args, "ponder", False))
+    finally:
+        if args.pawn_hash is not None:
+            AI.pawnHash.save(args.pawn_hash, AI.pawnTermsVersion())
+        if AI.searchCache is not None:
+            AI.searchCache.close()
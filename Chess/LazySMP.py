@@ -0,0 +1,100 @@
+import multiprocessing
+import random
+from multiprocessing import shared_memory
+
+from AI import *
+
+
+# runs in each helper process
+# helpers search the same root as the main process, sharing its transposition table, until told to stop
+def helper(index, memoryName, sizeMB, tablebases, jobs, results, stopEvent):
+    memory = shared_memory.SharedMemory(name=memoryName)
+    AI.transpoTable = TranspositionTable(sizeMB, memory.buf)
+    AI.tablebase = Tablebase(tablebases)
+    # only the main process writes to the search cache
+    AI.searchCache = None
+    AI.stopEvent = stopEvent
+    AI.rootShuffle = random.Random(index)
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        board, depth, age = job
+
+        # search moves the age on by one, so start one behind the main process
+        AI.transpoTable.age = (age - 1) & 63
+
+        # odd helpers go one ply deeper than the main process, so their results are waiting for it
+        # without a depth the main process is on a clock, and the helpers run until it stops them
+        # a helper that fails still has to report back, or the main process would wait on it forever
+        try:
+            if depth:
+                AI.search(board, depth + index % 2)
+            else:
+                AI.search(board, infinite=True)
+        finally:
+            results.put(AI.stats.nodes)
+
+    # the table has to let go of the buffer before the memory can be closed
+    AI.transpoTable = None
+    memory.close()
+
+
+# lazy smp parallel search
+# the main process and its helpers all search the same position, the helpers only exist to fill the shared
+# transposition table with results the main process can use
+class LazySMP:
+    def __init__(self, threads, sizeMB=16):
+        self.threads = threads
+        self.sizeMB = sizeMB
+        self.memory = shared_memory.SharedMemory(create=True, size=TranspositionTable.bytesNeeded(sizeMB))
+        self.memory.buf[:] = bytes(self.memory.size)
+        self.table = TranspositionTable(sizeMB, self.memory.buf)
+        self.stopEvent = multiprocessing.Event()
+        self.results = multiprocessing.Queue()
+        self.jobs = []
+        self.helpers = []
+        self.nodes = 0
+
+        for index in range(1, threads):
+            jobs = multiprocessing.Queue()
+            process = multiprocessing.Process(target=helper, daemon=True,
+                                              args=(index, self.memory.name, sizeMB, AI.tablebase.directories,
+                                                    jobs, self.results, self.stopEvent))
+            process.start()
+            self.jobs.append(jobs)
+            self.helpers.append(process)
+
+    # searches with every process, takes the same arguments as AI.search and returns its result
+    # the main process's result is the one reported, the total node count of all processes is left in self.nodes
+    def search(self, board, depth=None, **limits):
+        previousTable = AI.transpoTable
+        AI.transpoTable = self.table
+        self.stopEvent.clear()
+
+        # the main process moves the age on when it starts, so hand the helpers the new age
+        age = (self.table.age + 1) & 63
+        for jobs in self.jobs:
+            jobs.put((board.copy(), depth, age))
+
+        try:
+            result = AI.search(board, depth, **limits)
+        finally:
+            self.stopEvent.set()
+            self.nodes = AI.stats.nodes
+            for _ in self.helpers:
+                self.nodes += self.results.get()
+            AI.transpoTable = previousTable
+
+        return result
+
+    # stops the helpers and frees the shared memory
+    def close(self):
+        for jobs in self.jobs:
+            jobs.put(None)
+        for process in self.helpers:
+            process.join()
+        self.table = None
+        self.memory.close()
+        self.memory.unlink()
@@ -0,0 +1,377 @@
+import datetime
+import math
+import os
+import shlex
+import sys
+import time
+
+import chess
+import chess.engine
+import chess.pgn
+from AI import *
+from Benchmark import *
+from UCI import *
+from WorkerPool import *
+
+
+# plays matches between this engine and uci engines, or between two uci engines, across a pool of processes
+# every opening is played twice with the colours swapped, and results are counted for the first player
+# the games go to a pgn file as they finish, every searched move with its score, depth, time, and nodes as a
+# comment, and the match can be stopped early by an sprt once it has shown the first player is or isn't stronger
+# by the elo bounds given
+class Match:
+    # the player that means this engine, searching in the worker process itself
+    # with uci options it runs as a uci engine of its own instead, see command
+    ENGINE = "engine"
+
+    # openings used when none are given, a few plies of the main openings, all close to equal
+    openings = ["e2e4 e7e5 g1f3 b8c6", "e2e4 c7c5 g1f3 d7d6", "e2e4 e7e6 d2d4 d7d5", "e2e4 c7c6 d2d4 d7d5",
+                "d2d4 d7d5 c2c4 e7e6", "d2d4 g8f6 c2c4 e7e6", "d2d4 g8f6 c2c4 g7g6", "d2d4 d7d5 c2c4 c7c6",
+                "c2c4 e7e5 b1c3 g8f6", "g1f3 d7d5 g2g3 g8f6", "e2e4 e7e5 f1c4 g8f6", "e2e4 d7d5 e4d5 d8d5"]
+
+    # plies after which a game still going is scored as a draw
+    maxPlies = 300
+
+    # sprt error rates, the chance of accepting either hypothesis when the other one is true
+    sprtAlpha = 0.05
+    sprtBeta = 0.05
+
+    # players are Match.ENGINE or the command line of a uci engine, options are uci options for each player
+    # limits are any of depth, nodes, movetime in milliseconds, and tc, a base time and increment in seconds
+    # sprt is the (elo0, elo1) pair to test between, or None to play every game
+    def __init__(self, players, options=({}, {}), limits=None, games=100, workers=1, openings=None, pgnPath=None,
+                 sprt=None):
+        self.names = [UCI.name if player == Match.ENGINE else player for player in players]
+        self.players = tuple(Match.command() if player == Match.ENGINE and playerOptions else player
+                             for player, playerOptions in zip(players, options))
+        self.options = tuple(dict(Match.engineOptions(), **playerOptions) if player == Match.ENGINE and playerOptions
+                             else playerOptions for player, playerOptions in zip(players, options))
+        self.limits = limits or {"depth": 4}
+        self.games = games
+        self.workers = workers
+        self.openings = openings or [Match.parseOpening(line) for line in Match.openings]
+        self.pgnPath = pgnPath
+        self.sprt = sprt
+
+        # results from the first player's point of view
+        self.wins = 0
+        self.losses = 0
+        self.draws = 0
+
+    # command line of this engine speaking uci
+    # the options of the engine in the worker process would be set on the one AI both sides of a game search with,
+    # so a player with options gets a process of its own, set up by setoption like in any gui
+    @staticmethod
+    def command():
+        return shlex.join([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Chess.py"), "uci"])
+
+    # uci options that set this engine in a process of its own up like this one, any given to the player win
+    @staticmethod
+    def engineOptions():
+        options = {}
+        if AI.tablebase.directories:
+            options["SyzygyPath"] = ";".join(AI.tablebase.directories)
+        if AI.searchCache is not None:
+            options["SearchCache"] = AI.searchCache.path
+        return options
+
+    # an opening as a board with its moves on the move stack, from a fen, an epd, or uci moves from the start
+    @staticmethod
+    def parseOpening(line):
+        try:
+            return chess.Board(line)
+        except ValueError:
+            pass
+        try:
+            return chess.Board.from_epd(line)[0]
+        except ValueError:
+            pass
+        board = chess.Board()
+        for move in line.split():
+            board.push_uci(move)
+        return board
+
+    # openings from a file, the first plies of every game of a pgn, or one fen, epd, or line of uci moves per line
+    @staticmethod
+    def loadOpenings(path, plies=8):
+        if not path.endswith(".pgn"):
+            return [Match.parseOpening(line) for line in Benchmark.loadEPD(path)]
+        openings = []
+        with open(path, encoding="utf-8-sig", errors="replace") as pgn:
+            while True:
+                game = chess.pgn.read_game(pgn)
+                if game is None:
+                    break
+                board = game.board()
+                for ply, move in enumerate(game.mainline_moves()):
+                    if ply >= plies:
+                        break
+                    board.push(move)
+                openings.append(board)
+        return openings
+
+    # score of a move from the mover's point of view, in pawns or as a mate in moves
+    @staticmethod
+    def formatScore(centipawns=None, mate=None):
+        if mate is not None:
+            return f"{'+' if mate > 0 else '-'}M{abs(mate)}"
+        if centipawns is None:
+            return "?"
+        return f"{centipawns / 100:+.2f}"
+
+    # this engine's move, with the comment that goes with it in the pgn
+    @staticmethod
+    def engineMove(board, limits, clocks):
+        depths = []
+        clock = {}
+        if clocks is not None:
+            clock = {"wtime": clocks[chess.WHITE] * 1000, "btime": clocks[chess.BLACK] * 1000,
+                     "winc": limits["tc"][1] * 1000, "binc": limits["tc"][1] * 1000}
+        move, score, PV, stats = AI.search(board, limits.get("depth"), movetime=limits.get("movetime"),
+                                           nodes=limits.get("nodes"),
+                                           info=lambda deep, score, elapsed, PV: depths.append(deep), **clock)
+        if score is None:
+            text = "?"
+        else:
+            score = score if board.turn else -score
+            if abs(score) >= AI.MATE_BOUND:
+                mate = (AI.MATE_SCORE - abs(score) + 1) // 2
+                text = Match.formatScore(mate=mate if score > 0 else -mate)
+            else:
+                text = Match.formatScore(score)
+        return move, f"{text}/{depths[-1] if depths else 0} {stats.seconds:.2f}s {stats.nodes} nodes"
+
+    # a uci engine's move, with the comment that goes with it in the pgn
+    @staticmethod
+    def uciMove(engine, board, limits, clocks):
+        limit = chess.engine.Limit(depth=limits.get("depth"), nodes=limits.get("nodes"),
+                                   time=limits["movetime"] / 1000 if limits.get("movetime") else None)
+        if clocks is not None:
+            limit.white_clock, limit.black_clock = clocks[chess.WHITE], clocks[chess.BLACK]
+            limit.white_inc = limit.black_inc = limits["tc"][1]
+        result = engine.play(board, limit, info=chess.engine.INFO_BASIC | chess.engine.INFO_SCORE)
+        score = result.info.get("score")
+        if score is None:
+            text = "?"
+        elif score.relative.is_mate():
+            text = Match.formatScore(mate=score.relative.mate())
+        else:
+            text = Match.formatScore(score.relative.score())
+        return result.move, f"{text}/{result.info.get('depth', 0)} {result.info.get('time', 0.0):.2f}s " \
+                            f"{result.info.get('nodes', 0)} nodes"
+
+    # plays one game, what a pool worker runs
+    # players, names, and options are for white and black
+    # returns the round, the result, how the game ended, and the game as pgn
+    @staticmethod
+    def playGame(round, opening, players, options, limits, maxPlies=300):
+        board = opening.copy()
+        engines = {}
+        names = {}
+        result = None
+        termination = None
+        played = []
+        clocks = None
+        if "tc" in limits:
+            clocks = {chess.WHITE: limits["tc"][0], chess.BLACK: limits["tc"][0]}
+
+        AI.newGame()
+
+        try:
+            for color, player, playerOptions in zip(chess.COLORS, players, options):
+                if player == Match.ENGINE:
+                    names[color] = UCI.name
+                else:
+                    engines[color] = chess.engine.SimpleEngine.popen_uci(shlex.split(player))
+                    engines[color].configure(playerOptions)
+                    names[color] = engines[color].id.get("name", player)
+
+            while result is None:
+                outcome = board.outcome(claim_draw=True)
+                if outcome is not None:
+                    result, termination = outcome.result(), outcome.termination.name.lower().replace("_", " ")
+                    break
+                if len(played) >= maxPlies:
+                    result, termination = "1/2-1/2", "move limit"
+                    break
+
+                turn = board.turn
+                loss = "0-1" if turn else "1-0"
+                start = time.perf_counter()
+                try:
+                    if turn in engines:
+                        move, comment = Match.uciMove(engines[turn], board, limits, clocks)
+                    else:
+                        move, comment = Match.engineMove(board, limits, clocks)
+                except (chess.engine.EngineError, chess.engine.EngineTerminatedError):
+                    result, termination = loss, "engine error"
+                    break
+                elapsed = time.perf_counter() - start
+
+                if move is None or not board.is_legal(move):
+                    result, termination = loss, f"illegal move {move}"
+                    break
+                if clocks is not None:
+                    clocks[turn] -= elapsed
+                    if clocks[turn] < 0:
+                        result, termination = loss, "time forfeit"
+                        break
+                    clocks[turn] += limits["tc"][1]
+                board.push(move)
+                played.append((move, comment))
+        finally:
+            for engine in engines.values():
+                engine.quit()
+
+        game = chess.pgn.Game()
+        game.setup(opening.root())
+        node = game
+        for move in opening.move_stack:
+            node = node.add_variation(move, comment="book")
+        for move, comment in played:
+            node = node.add_variation(move, comment=comment)
+        game.headers["Event"] = "Match"
+        game.headers["Date"] = datetime.date.today().strftime("%Y.%m.%d")
+        game.headers["Round"] = str(round)
+        game.headers["White"] = names.get(chess.WHITE, players[0])
+        game.headers["Black"] = names.get(chess.BLACK, players[1])
+        game.headers["Result"] = result
+        game.headers["Termination"] = termination
+        game.headers["TimeControl"] = Match.timeControl(limits)
+        return round, result, termination, str(game)
+
+    # the limits of a game as a pgn time control, or a description of the fixed limit
+    @staticmethod
+    def timeControl(limits):
+        if "tc" in limits:
+            base, increment = limits["tc"]
+            return f"{base:g}+{increment:g}"
+        if "movetime" in limits:
+            return f"{limits['movetime'] / 1000:g}/move"
+        return ", ".join(f"{name} {value}" for name, value in limits.items())
+
+    # a time control written as base+increment in seconds, like 10+0.1
+    @staticmethod
+    def parseTimeControl(text):
+        base, _, increment = text.partition("+")
+        return float(base), float(increment or 0)
+
+    # elo difference for a score, with the 95% error margin, from wins, losses, and draws
+    # a score of 0 or 1 has no finite elo, and gives an infinite difference and margin
+    @staticmethod
+    def elo(wins, losses, draws):
+        games = wins + losses + draws
+        if not games:
+            return 0.0, math.inf
+        score = (wins + draws / 2) / games
+        if score <= 0 or score >= 1:
+            return math.copysign(math.inf, score - 0.5), math.inf
+
+        def toElo(score):
+            score = min(max(score, 1e-9), 1 - 1e-9)
+            return 400 * math.log10(score / (1 - score))
+
+        variance = (wins * (1 - score) ** 2 + losses * score ** 2 + draws * (0.5 - score) ** 2) / games
+        margin = 1.96 * math.sqrt(variance / games)
+        return toElo(score), (toElo(score + margin) - toElo(score - margin)) / 2
+
+    # log likelihood ratio of elo1 against elo0 given the results so far
+    # uses the normal approximation of the trinomial game results that fishtest and cutechess use
+    @staticmethod
+    def llr(wins, losses, draws, elo0, elo1):
+        games = wins + losses + draws
+        if not games:
+            return 0.0
+        score = (wins + draws / 2) / games
+        variance = (wins * (1 - score) ** 2 + losses * score ** 2 + draws * (0.5 - score) ** 2) / games
+        if variance <= 0:
+            return 0.0
+        score0 = 1 / (1 + 10 ** (-elo0 / 400))
+        score1 = 1 / (1 + 10 ** (-elo1 / 400))
+        return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+    # the llr bounds, below the first elo0 is accepted, above the second elo1 is
+    @staticmethod
+    def sprtBounds():
+        return math.log(Match.sprtBeta / (1 - Match.sprtAlpha)), math.log((1 - Match.sprtBeta) / Match.sprtAlpha)
+
+    # "H0" or "H1" once the sprt has decided, otherwise None
+    def sprtResult(self):
+        if self.sprt is None:
+            return None
+        lower, upper = Match.sprtBounds()
+        llr = Match.llr(self.wins, self.losses, self.draws, *self.sprt)
+        if llr <= lower:
+            return "H0"
+        if llr >= upper:
+            return "H1"
+        return None
+
+    # the schedule, every opening twice with the colours swapped, as (round, opening, first player is white)
+    def schedule(self):
+        for round in range(self.games):
+            yield round + 1, self.openings[(round // 2) % len(self.openings)], round % 2 == 0
+
+    # plays the schedule, yielding (first player was white, round, result, termination, pgn) as games finish
+    # only a couple of games per worker are in flight at once, so stopping early wastes little
+    def play(self):
+        # whether the first player has white, by round
+        whites = {}
+
+        def tasks():
+            for round, opening, white in self.schedule():
+                whites[round] = white
+                players, options = (self.players, self.options) if white else \
+                    (self.players[::-1], self.options[::-1])
+                yield Match.playGame, (round, opening, players, options, self.limits, Match.maxPlies)
+
+        for game in WorkerPool.run(tasks(), self.workers):
+            yield (whites.pop(game[0]),) + game
+
+    # plays the match, printing the standing after every game
+    # returns the wins, losses, and draws of the first player, the elo difference and margin, and the sprt result
+    def run(self):
+        names = " vs ".join(self.names)
+        print(f"{names}, {self.games} games, {Match.timeControl(self.limits)}, {self.workers} worker(s)")
+        decision = None
+        pgn = open(self.pgnPath, "a") if self.pgnPath is not None else None
+        try:
+            for white, round, result, termination, game in self.play():
+                if pgn is not None:
+                    pgn.write(game + "\n\n")
+                    pgn.flush()
+                if result == "1/2-1/2":
+                    self.draws += 1
+                elif (result == "1-0") == white:
+                    self.wins += 1
+                else:
+                    self.losses += 1
+
+                elo, margin = Match.elo(self.wins, self.losses, self.draws)
+                line = f"Game {round}: {result} ({termination}), score {self.wins} - {self.losses} - {self.draws}, " \
+                       f"elo {elo:+.1f} +/- {margin:.1f}"
+                if self.sprt is not None:
+                    lower, upper = Match.sprtBounds()
+                    line += f", llr {Match.llr(self.wins, self.losses, self.draws, *self.sprt):.2f} " \
+                            f"({lower:.2f}, {upper:.2f})"
+                print(line)
+
+                decision = self.sprtResult()
+                if decision is not None:
+                    break
+        finally:
+            if pgn is not None:
+                pgn.close()
+
+        elo, margin = Match.elo(self.wins, self.losses, self.draws)
+        games = self.wins + self.losses + self.draws
+        print(f"Score: {self.wins} - {self.losses} - {self.draws} "
+              f"[{(self.wins + self.draws / 2) / games if games else 0:.3f}] {games}")
+        print(f"Elo difference: {elo:+.1f} +/- {margin:.1f}")
+        if self.sprt is not None:
+            elo0, elo1 = self.sprt
+            print(f"SPRT ({elo0:g}, {elo1:g}): " + {"H0": f"H0 accepted, not {elo1:g} elo stronger",
+                                                     "H1": f"H1 accepted, {elo1:g} elo stronger",
+                                                     None: "no decision"}[decision])
+        return {"wins": self.wins, "losses": self.losses, "draws": self.draws, "elo": elo, "margin": margin,
+                "sprt": decision}
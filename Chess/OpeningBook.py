@@ -0,0 +1,193 @@
+import array
+import bisect
+import collections
+import mmap
+import os
+import random
+import struct
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+
+# polyglot opening books, opened once and kept memory mapped for the whole session
+# every book gets a sparse index of the keys in memory, every indexStride-th entry, so a probe is a bisect of the
+# index followed by a short scan of the mapped file instead of a file open and a binary search through the file
+# books are probed in the order they were given, the first book that knows the position answers
+class OpeningBook:
+    # polyglot entry, big endian zobrist key, move, weight, and learn
+    ENTRY = struct.Struct(">QHHI")
+    KEY = struct.Struct(">Q")
+
+    # entries between keys in the in memory index
+    indexStride = 64
+
+    # how a move is picked from a position's entries
+    selections = ("weighted", "best", "uniform")
+
+    # polyglot writes castling as the king taking its own rook
+    castlingMoves = {(chess.E1, chess.H1): chess.G1, (chess.E1, chess.A1): chess.C1,
+                     (chess.E8, chess.H8): chess.G8, (chess.E8, chess.A8): chess.C8}
+    castlingEncodings = {(chess.E1, chess.G1): chess.H1, (chess.E1, chess.C1): chess.A1,
+                         (chess.E8, chess.G8): chess.H8, (chess.E8, chess.C8): chess.A8}
+
+    def __init__(self, paths=(), selection="weighted", minimumWeight=1, seed=None):
+        if selection not in OpeningBook.selections:
+            raise ValueError(f"unknown book selection {selection!r}, expected one of {OpeningBook.selections}")
+        self.selection = selection
+        # entries below this weight are skipped, polyglot uses a weight of zero to delete an entry
+        self.minimumWeight = minimumWeight
+        self.random = random.Random(seed)
+        self.paths = []
+        self.maps = []
+        self.sizes = []
+        self.indexes = []
+
+        # statistics
+        self.probes = 0
+        self.hits = 0
+
+        for path in paths:
+            self.add(path)
+
+    # maps a book and indexes its keys
+    def add(self, path):
+        size = os.path.getsize(path)
+        if size % OpeningBook.ENTRY.size:
+            raise ValueError(f"{path} is not a polyglot book, its size isn't a multiple of {OpeningBook.ENTRY.size}")
+        entries = size // OpeningBook.ENTRY.size
+        # an empty file can't be mapped
+        if entries:
+            with open(path, "rb") as file:
+                bookMap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            bookMap = b""
+
+        index = array.array('Q', [OpeningBook.KEY.unpack_from(bookMap, entry * OpeningBook.ENTRY.size)[0]
+                                  for entry in range(0, entries, OpeningBook.indexStride)])
+        self.paths.append(path)
+        self.maps.append(bookMap)
+        self.sizes.append(entries)
+        self.indexes.append(index)
+
+    def close(self):
+        for bookMap in self.maps:
+            if isinstance(bookMap, mmap.mmap):
+                bookMap.close()
+        self.paths, self.maps, self.sizes, self.indexes = [], [], [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __bool__(self):
+        return bool(self.paths)
+
+    # (raw move, weight) of every entry in one book with the key
+    def findRaw(self, book, key):
+        bookMap, entries, index = self.maps[book], self.sizes[book], self.indexes[book]
+        # the index entry before the first one that isn't below the key is below it, so the key's entries start
+        # somewhere in that block or right at the start of the next one
+        block = max(bisect.bisect_left(index, key) - 1, 0)
+        entry = block * OpeningBook.indexStride
+
+        found = []
+        while entry < entries:
+            entryKey, rawMove, weight, learn = OpeningBook.ENTRY.unpack_from(bookMap, entry * OpeningBook.ENTRY.size)
+            if entryKey > key:
+                break
+            if entryKey == key:
+                found.append((rawMove, weight))
+            entry += 1
+        return found
+
+    # polyglot move to a move on the board
+    @staticmethod
+    def decodeMove(board, rawMove):
+        toSquare = rawMove & 0x3f
+        fromSquare = (rawMove >> 6) & 0x3f
+        promotion = (rawMove >> 12) & 0x7
+        if board.kings & chess.BB_SQUARES[fromSquare]:
+            toSquare = OpeningBook.castlingMoves.get((fromSquare, toSquare), toSquare)
+        return chess.Move(fromSquare, toSquare, promotion + 1 if promotion else None)
+
+    @staticmethod
+    def encodeMove(board, move):
+        toSquare = move.to_square
+        if board.is_castling(move):
+            toSquare = OpeningBook.castlingEncodings[(move.from_square, move.to_square)]
+        return toSquare | (move.from_square << 6) | ((move.promotion - 1 if move.promotion else 0) << 12)
+
+    # every legal book move of a position with its weight, from the first book that has any
+    # key is the polyglot zobrist hash of the board, which the search already has running
+    def probe(self, board, key=None):
+        self.probes += 1
+        if key is None:
+            key = chess.polyglot.zobrist_hash(board)
+        for book in range(len(self.paths)):
+            moves = []
+            for rawMove, weight in self.findRaw(book, key):
+                if weight < self.minimumWeight:
+                    continue
+                move = OpeningBook.decodeMove(board, rawMove)
+                if board.is_legal(move):
+                    moves.append((move, weight))
+            if moves:
+                self.hits += 1
+                return moves
+        return []
+
+    # a book move for the position, or None when it is out of book
+    # missing a position doesn't turn the book off, a later transposition can bring the game back into it
+    def choose(self, board, key=None):
+        moves = self.probe(board, key)
+        if not moves:
+            return None
+        if self.selection == "best":
+            return max(moves, key=lambda entry: entry[1])[0]
+        if self.selection == "uniform":
+            return self.random.choice(moves)[0]
+        return self.random.choices([move for move, weight in moves], [weight for move, weight in moves])[0]
+
+    # builds a polyglot book from pgn files
+    # every move in the first plies of every game gets 2 points for a win and 1 for a draw, for the side that
+    # played it, and moves played in fewer than minimumGames games are left out, which keeps the book to the
+    # lines that actually come up
+    # returns the number of entries written
+    @staticmethod
+    def build(pgnPaths, output, plies=20, minimumGames=2):
+        counts = collections.Counter()
+        points = collections.Counter()
+        for path in pgnPaths:
+            with open(path, encoding="utf-8-sig", errors="replace") as pgn:
+                while True:
+                    game = chess.pgn.read_game(pgn)
+                    if game is None:
+                        break
+                    result = game.headers.get("Result", "*")
+                    board = game.board()
+                    for ply, move in enumerate(game.mainline_moves()):
+                        if ply >= plies:
+                            break
+                        entry = (chess.polyglot.zobrist_hash(board), OpeningBook.encodeMove(board, move))
+                        counts[entry] += 1
+                        if result == "1/2-1/2":
+                            points[entry] += 1
+                        elif result == ("1-0" if board.turn else "0-1"):
+                            points[entry] += 2
+                        board.push(move)
+
+        entries = [(key, rawMove, points[(key, rawMove)]) for (key, rawMove), count in counts.items()
+                   if count >= minimumGames]
+        # weights are 16 bits, scale everything down if the most played move doesn't fit
+        # a move that was played but never scored still gets a weight of 1 so it stays in the book
+        largest = max((weight for key, rawMove, weight in entries), default=0)
+        scale = min(1.0, 0xffff / largest) if largest else 1.0
+        entries.sort(key=lambda entry: (entry[0], -entry[2]))
+        with open(output, "wb") as book:
+            for key, rawMove, weight in entries:
+                book.write(OpeningBook.ENTRY.pack(key, rawMove, max(1, int(weight * scale)), 0))
+        return len(entries)
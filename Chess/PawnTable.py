@@ -0,0 +1,110 @@
+import array
+import os
+import struct
+
+
+# fixed size pawn structure cache
+# one entry per slot, the pawn key in one array and the packed score in another, a new entry always replaces
+# whatever was in its slot
+# the scores only depend on the pawns and kings, so the table can be saved and loaded between sessions, as long
+# as the pawn terms that made them haven't changed
+class PawnTable:
+    ENTRY_BYTES = 16
+
+    # file header, a magic number, a version for the pawn terms, and the number of entries
+    HEADER = struct.Struct("<4sQQ")
+    MAGIC = b"PAWN"
+
+    def __init__(self, sizeMB=1):
+        self.sizeMB = sizeMB
+        self.entries = max(1, (sizeMB * 1024 * 1024) // PawnTable.ENTRY_BYTES)
+        self.keys = array.array('Q', bytes(self.entries * 8))
+        self.scores = array.array('q', bytes(self.entries * 8))
+
+        # statistics
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        # stores that threw out a different position's entry
+        self.evictions = 0
+
+    # throws away every entry and reallocates the table at a new size
+    def resize(self, sizeMB):
+        self.__init__(sizeMB)
+
+    def clear(self):
+        self.keys = array.array('Q', bytes(self.entries * 8))
+        self.scores = array.array('q', bytes(self.entries * 8))
+        self.resetStats()
+
+    def resetStats(self):
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+
+    # returns the stored score of a pawn key, or None if it isn't stored
+    def probe(self, key):
+        self.probes += 1
+        index = key % self.entries
+        if self.keys[index] == key:
+            self.hits += 1
+            return self.scores[index]
+        return None
+
+    def store(self, key, score):
+        self.stores += 1
+        index = key % self.entries
+        if self.keys[index] != 0 and self.keys[index] != key:
+            self.evictions += 1
+        self.keys[index] = key
+        self.scores[index] = score
+
+    # fraction of probes that found their position
+    def hitRate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    # fraction of the slots in use
+    def usage(self):
+        return (self.entries - self.keys.count(0)) / self.entries
+
+    def stats(self):
+        return {"sizeMB": self.sizeMB, "probes": self.probes, "hits": self.hits, "hitRate": self.hitRate(),
+                "stores": self.stores, "evictions": self.evictions, "usage": self.usage()}
+
+    # writes every entry to a file, version identifies the pawn terms the scores came from
+    def save(self, path, version):
+        with open(path, "wb") as file:
+            file.write(PawnTable.HEADER.pack(PawnTable.MAGIC, version, self.entries))
+            self.keys.tofile(file)
+            self.scores.tofile(file)
+
+    # reads the entries of a saved table, returns false and leaves the table alone if the file is missing,
+    # not a pawn table, or from different pawn terms
+    # a file saved at another size has its entries stored one by one into this one
+    def load(self, path, version):
+        if not os.path.exists(path):
+            return False
+        with open(path, "rb") as file:
+            header = file.read(PawnTable.HEADER.size)
+            if len(header) != PawnTable.HEADER.size:
+                return False
+            magic, fileVersion, entries = PawnTable.HEADER.unpack(header)
+            if magic != PawnTable.MAGIC or fileVersion != version:
+                return False
+            keys = array.array('Q')
+            scores = array.array('q')
+            try:
+                keys.fromfile(file, entries)
+                scores.fromfile(file, entries)
+            except EOFError:
+                return False
+
+        if entries == self.entries:
+            self.keys, self.scores = keys, scores
+        else:
+            for key, score in zip(keys, scores):
+                if key != 0:
+                    self.keys[key % self.entries] = key
+                    self.scores[key % self.entries] = score
+        return True
@@ -0,0 +1,118 @@
+import time
+
+import chess
+from AI import *
+from WorkerPool import *
+
+
+# move generation checks, counting the leaves of the full move tree to a fixed depth
+# the walk runs on the search's own board with the search's own move generation, pseudo legal moves with the ones
+# that leave the king attacked taken back after they are made, so a count that matches the known one means the
+# search sees exactly the legal moves
+# the root moves can be split across a pool of processes, each one counts the tree below its moves
+class Perft:
+    # (name, fen, known leaf counts for depth 1 up)
+    # the first six are the usual perft positions, the rest each test one rule that move generators get wrong
+    positions = [
+        ("start", chess.STARTING_FEN, [20, 400, 8902, 197281, 4865609]),
+        ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+         [48, 2039, 97862, 4085603]),
+        ("position 3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1", [14, 191, 2812, 43238, 674624]),
+        ("position 4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1", [6, 264, 9467, 422333]),
+        ("position 4 mirrored", "r2q1rk1/pP1p2pp/Q4n2/bbp1p3/Np6/1B3NBn/pPPP1PPP/R3K2R b KQ - 0 1",
+         [6, 264, 9467, 422333]),
+        ("position 5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8", [44, 1486, 62379, 2103487]),
+        ("position 6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+         [46, 2079, 89890, 3894594]),
+        ("illegal en passant 1", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1", [18, 92, 1670, 10138, 185429, 1134888]),
+        ("illegal en passant 2", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1", [13, 102, 1266, 10276, 135655, 1015133]),
+        ("en passant gives check", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1", [15, 126, 1928, 13931, 206379, 1440467]),
+        ("short castle gives check", "5k2/8/8/8/8/8/8/4K2R w K - 0 1", [15, 66, 1198, 6399, 120330, 661072]),
+        ("long castle gives check", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1", [16, 71, 1286, 7418, 141077, 803711]),
+        ("castling rights", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1", [26, 1141, 27826, 1274206]),
+        ("castling prevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1", [44, 1494, 50509, 1720476]),
+        ("promote out of check", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1", [11, 133, 1442, 19174, 266199, 3821001]),
+        ("discovered check", "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1", [29, 165, 5160, 31961, 1004658]),
+        ("promote to give check", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1", [9, 40, 472, 2661, 38983, 217342]),
+        ("underpromote to check", "8/P1k5/K7/8/8/8/8/8 w - - 0 1", [6, 27, 273, 1329, 18135, 92683]),
+        ("self stalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1", [2, 6, 13, 63, 382, 2217]),
+        ("stalemate and checkmate 1", "8/k1P5/8/1K6/8/8/8/8 w - - 0 1", [10, 25, 268, 926, 10857, 43261, 567584]),
+        ("stalemate and checkmate 2", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1", [37, 183, 6559, 23527]),
+    ]
+
+    # leaves of the move tree below the board, which has to be a SearchBoard
+    @staticmethod
+    def count(board, depth):
+        if depth == 0:
+            return 1
+        nodes = 0
+        for move in AI.searchMoves(board):
+            board.push(move)
+            if not board.kingLeftInCheck():
+                nodes += Perft.count(board, depth - 1)
+            board.pop()
+        return nodes
+
+    # leaves below one root move, what a pool worker runs
+    @staticmethod
+    def countMove(fen, move, depth):
+        board = SearchBoard(chess.Board(fen))
+        board.push(chess.Move.from_uci(move))
+        return Perft.count(board, depth - 1)
+
+    # leaves below every legal move of the board, in the order of the legal moves
+    # with a pool every root move is counted by one of its workers
+    @staticmethod
+    def divide(board, depth, pool=None):
+        board = SearchBoard(board)
+        moves = list(board.legal_moves)
+        if pool is None:
+            counts = {}
+            for move in moves:
+                board.push(move)
+                counts[move] = Perft.count(board, depth - 1)
+                board.pop()
+            return counts
+        futures = {move: pool.submit(Perft.countMove, board.fen(), move.uci(), depth) for move in moves}
+        return {move: future.result() for move, future in futures.items()}
+
+    # counts every depth from 1 up, checks them against the known counts and reports the speed of each
+    # positions are (name, fen, counts) like Perft.positions, depths past the known counts are only reported
+    # with divide the final depth of every position is broken down by root move
+    # returns the number of counts that were wrong
+    @staticmethod
+    def run(depth, positions=None, workers=1, divide=False):
+        mismatches = 0
+        nodes = 0
+        seconds = 0.0
+        pool = WorkerPool.executor(workers) if workers > 1 else None
+        try:
+            for name, fen, counts in positions or Perft.positions:
+                print(f"{name}: {fen}")
+                for deep in range(1, depth + 1):
+                    start = time.perf_counter()
+                    moves = Perft.divide(chess.Board(fen), deep, pool)
+                    elapsed = time.perf_counter() - start
+                    total = sum(moves.values())
+                    nodes += total
+                    seconds += elapsed
+
+                    expected = counts[deep - 1] if deep <= len(counts) else None
+                    if expected is None:
+                        check = ""
+                    elif total == expected:
+                        check = ", ok"
+                    else:
+                        check = f", expected {expected}"
+                        mismatches += 1
+                    print(f"  depth {deep}: {total} nodes in {elapsed:.2f} seconds, "
+                          f"{int(total / elapsed) if elapsed else 0} nodes/second{check}")
+                if divide:
+                    for move, count in moves.items():
+                        print(f"    {move.uci()}: {count}")
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        print(f"Nodes: {nodes}, nodes/second: {int(nodes / seconds) if seconds else 0}, {mismatches} mismatches")
+        return mismatches
@@ -0,0 +1,243 @@
+import chess
+
+
+# board used inside the search
+# the same bitboards as chess.Board, so everything that reads a chess.Board still works on it, plus a mailbox of
+# piece types by square, and a make/unmake that flips bits directly and keeps a small tuple per move to undo it
+# instead of the full board state chess.Board saves on every push
+# only standard chess, it is built from a chess.Board at the root of the search and the caller's board is never
+# touched
+class SearchBoard(chess.Board):
+    # rook squares of a castling move, by the king's target square
+    castlingRooks = {chess.G1: (chess.H1, chess.F1), chess.C1: (chess.A1, chess.D1),
+                     chess.G8: (chess.H8, chess.F8), chess.C8: (chess.A8, chess.D8)}
+
+    def __init__(self, board):
+        # piece type on every square, None for empty squares
+        self.mailbox = [None] * 64
+        # whether the side to move is in check, by ply, None until someone asks
+        self.checks = [None]
+        # what every move on the move stack needs to be taken back, (moved piece type, king or piece target,
+        # captured piece type, square it was captured on, castling rook from, castling rook to) followed by the
+        # castling rights, en passant square, halfmove clock, fullmove number, promoted pieces, and occupancy from
+        # before the move
+        self.undo = []
+        self.rootFen = board.root().fen()
+        super().__init__(self.rootFen)
+        # replay the game so repetitions of positions from before the root are seen
+        for move in board.move_stack:
+            self.push(move)
+
+    # copies are plain chess.Boards of the same game
+    def copy(self, *, stack=True):
+        if not stack:
+            return chess.Board(self.fen())
+        board = chess.Board(self.rootFen)
+        for move in self.move_stack:
+            board.push(move)
+        return board
+
+    def root(self):
+        return chess.Board(self.rootFen)
+
+    # keeps the mailbox right through everything chess.Board does to the pieces
+    def _reset_board(self):
+        super()._reset_board()
+        self.mailbox = [chess.Board.piece_type_at(self, square) for square in chess.SQUARES]
+
+    def _clear_board(self):
+        super()._clear_board()
+        self.mailbox = [None] * 64
+
+    def _remove_piece_at(self, square):
+        pieceType = super()._remove_piece_at(square)
+        self.mailbox[square] = None
+        return pieceType
+
+    def _set_piece_at(self, square, pieceType, color, promoted=False):
+        super()._set_piece_at(square, pieceType, color, promoted)
+        self.mailbox[square] = pieceType
+
+    def piece_type_at(self, square):
+        return self.mailbox[square]
+
+    # flips a piece type's bitboard on a mask of squares
+    def toggle(self, pieceType, mask):
+        if pieceType == chess.PAWN:
+            self.pawns ^= mask
+        elif pieceType == chess.KNIGHT:
+            self.knights ^= mask
+        elif pieceType == chess.BISHOP:
+            self.bishops ^= mask
+        elif pieceType == chess.ROOK:
+            self.rooks ^= mask
+        elif pieceType == chess.QUEEN:
+            self.queens ^= mask
+        else:
+            self.kings ^= mask
+
+    # makes a pseudo legal move or a null move
+    def push(self, move):
+        turn = self.turn
+        mailbox = self.mailbox
+        fromSquare = move.from_square
+        toSquare = move.to_square
+        pieceType = mailbox[fromSquare]
+        captured = captureSquare = rookFrom = rookTo = None
+        state = (self.castling_rights, self.ep_square, self.halfmove_clock, self.fullmove_number, self.promoted,
+                 self.occupied)
+        self.move_stack.append(move)
+        self.checks.append(None)
+
+        epSquare = self.ep_square
+        self.ep_square = None
+        self.halfmove_clock += 1
+        if not turn:
+            self.fullmove_number += 1
+        self.turn = not turn
+        if not move:
+            self.undo.append((None, toSquare, None, None, None, None) + state)
+            return
+
+        fromMask = chess.BB_SQUARES[fromSquare]
+        toMask = chess.BB_SQUARES[toSquare]
+        ours = self.occupied_co[turn]
+        theirs = self.occupied_co[not turn]
+        self.castling_rights &= ~(fromMask | toMask)
+        # promoted pieces stay promoted when they move
+        promoted = self.promoted & fromMask
+        self.promoted &= ~(fromMask | toMask)
+
+        if pieceType == chess.KING:
+            self.castling_rights &= ~(chess.BB_RANK_1 if turn else chess.BB_RANK_8)
+            # castling, written as the king moving two squares, or as the king taking its own rook
+            if toMask & ours:
+                toSquare = (chess.G1 if toSquare > fromSquare else chess.C1) + (0 if turn else 56)
+                toMask = chess.BB_SQUARES[toSquare]
+            if toSquare - fromSquare == 2 or fromSquare - toSquare == 2:
+                rookFrom, rookTo = SearchBoard.castlingRooks[toSquare]
+                rookMask = chess.BB_SQUARES[rookFrom] | chess.BB_SQUARES[rookTo]
+                self.rooks ^= rookMask
+                ours ^= rookMask
+                mailbox[rookFrom] = None
+                mailbox[rookTo] = chess.ROOK
+        elif pieceType == chess.PAWN:
+            self.halfmove_clock = 0
+            if toSquare == epSquare:
+                captured = chess.PAWN
+                captureSquare = toSquare - 8 if turn else toSquare + 8
+            elif toSquare - fromSquare == 16 or fromSquare - toSquare == 16:
+                self.ep_square = (fromSquare + toSquare) >> 1
+
+        if toMask & theirs:
+            captured = mailbox[toSquare]
+            captureSquare = toSquare
+        if captured is not None:
+            captureMask = chess.BB_SQUARES[captureSquare]
+            self.toggle(captured, captureMask)
+            theirs ^= captureMask
+            mailbox[captureSquare] = None
+            self.halfmove_clock = 0
+
+        # move the piece, it turns into the promotion piece if there is one
+        self.toggle(pieceType, fromMask)
+        if move.promotion:
+            self.toggle(move.promotion, toMask)
+            self.promoted |= toMask
+            mailbox[toSquare] = move.promotion
+        else:
+            self.toggle(pieceType, toMask)
+            if promoted:
+                self.promoted |= toMask
+            mailbox[toSquare] = pieceType
+        mailbox[fromSquare] = None
+        ours ^= fromMask | toMask
+
+        self.occupied_co[turn] = ours
+        self.occupied_co[not turn] = theirs
+        self.occupied = ours | theirs
+        self.undo.append((pieceType, toSquare, captured, captureSquare, rookFrom, rookTo) + state)
+
+    # takes back the last move made with push
+    def pop(self):
+        move = self.move_stack.pop()
+        pieceType, toSquare, captured, captureSquare, rookFrom, rookTo, self.castling_rights, self.ep_square, \
+            self.halfmove_clock, self.fullmove_number, self.promoted, occupied = self.undo.pop()
+        self.checks.pop()
+        self.turn = turn = not self.turn
+        if not move:
+            return move
+
+        mailbox = self.mailbox
+        fromSquare = move.from_square
+        fromMask = chess.BB_SQUARES[fromSquare]
+        toMask = chess.BB_SQUARES[toSquare]
+        ours = self.occupied_co[turn] ^ (fromMask | toMask)
+        theirs = self.occupied_co[not turn]
+
+        self.toggle(move.promotion or pieceType, toMask)
+        self.toggle(pieceType, fromMask)
+        mailbox[toSquare] = None
+        mailbox[fromSquare] = pieceType
+
+        if rookFrom is not None:
+            rookMask = chess.BB_SQUARES[rookFrom] | chess.BB_SQUARES[rookTo]
+            self.rooks ^= rookMask
+            ours ^= rookMask
+            mailbox[rookFrom] = chess.ROOK
+            mailbox[rookTo] = None
+
+        if captured is not None:
+            captureMask = chess.BB_SQUARES[captureSquare]
+            self.toggle(captured, captureMask)
+            theirs ^= captureMask
+            mailbox[captureSquare] = captured
+
+        self.occupied_co[turn] = ours
+        self.occupied_co[not turn] = theirs
+        self.occupied = occupied
+        return move
+
+    # whether the move just made left the mover's own king attacked
+    # the search makes pseudo legal moves and throws out the illegal ones here, which is cheaper than proving
+    # every move legal before it is made, most never are because of a cutoff
+    def kingLeftInCheck(self):
+        king = self.kings & self.occupied_co[not self.turn]
+        return bool(king) and bool(self.attackers_mask(self.turn, king.bit_length() - 1))
+
+    # worked out once per position, the search asks at the node and again after making each move
+    def is_check(self):
+        check = self.checks[-1]
+        if check is None:
+            check = self.checks[-1] = super().is_check()
+        return check
+
+    # the same as chess.Board.is_repetition, with the occupancy of earlier positions taken from the undo stack
+    def is_repetition(self, count=3):
+        maybeRepetitions = 1
+        for state in reversed(self.undo):
+            if state[11] == self.occupied:
+                maybeRepetitions += 1
+                if maybeRepetitions >= count:
+                    break
+        if maybeRepetitions < count:
+            return False
+
+        key = self._transposition_key()
+        switchyard = []
+        try:
+            while True:
+                if count <= 1:
+                    return True
+                if len(self.move_stack) < count - 1:
+                    break
+                move = self.pop()
+                switchyard.append(move)
+                if self.is_irreversible(move):
+                    break
+                if self._transposition_key() == key:
+                    count -= 1
+        finally:
+            while switchyard:
+                self.push(switchyard.pop())
+        return False
@@ -0,0 +1,115 @@
+import sqlite3
+
+from TranspositionTable import *
+
+
+# on disk cache of deep results near the root, kept across games and restarts
+# entries look like transposition table entries, and only go to disk when a search finishes
+# the file is opened the first time the cache is used, and is wiped if it was written by a different evaluation
+# once it holds more than maxEntries positions, the ones used least recently are thrown out
+class SearchCache:
+    # changes whenever the layout of the file changes
+    FORMAT = 1
+
+    def __init__(self, path, version, maxEntries=200000):
+        self.path = path
+        # identifies the evaluation the scores came from, see AI.evaluationVersion
+        self.version = version
+        self.maxEntries = maxEntries
+        self.connection = None
+        # results of the current search, key -> (depth, bound, score, packed move)
+        self.pending = {}
+        # keys probed successfully during the current search
+        self.used = set()
+        # every flush moves the clock on, entries remember the last one they were used in
+        self.clock = 0
+
+        # statistics
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.evictions = 0
+
+    # sqlite integers are signed, zobrist keys are not
+    @staticmethod
+    def signed(key):
+        return key - (1 << 64) if key >= 1 << 63 else key
+
+    def connect(self):
+        if self.connection is not None:
+            return self.connection
+        # the uci engine searches on a worker thread, one search at a time
+        connection = sqlite3.connect(self.path, check_same_thread=False)
+        connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)")
+        connection.execute("CREATE TABLE IF NOT EXISTS entries (key INTEGER PRIMARY KEY, depth INTEGER, "
+                           "bound INTEGER, score INTEGER, move INTEGER, used INTEGER)")
+        connection.execute("CREATE INDEX IF NOT EXISTS entriesUsed ON entries (used)")
+        meta = dict(connection.execute("SELECT name, value FROM meta"))
+        if meta.get("format") != SearchCache.FORMAT or meta.get("version") != self.version:
+            connection.execute("DELETE FROM entries")
+            connection.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                   [("format", SearchCache.FORMAT), ("version", self.version)])
+            connection.commit()
+        self.clock = connection.execute("SELECT COALESCE(MAX(used), 0) FROM entries").fetchone()[0] + 1
+        self.connection = connection
+        return connection
+
+    # returns (best move, score, depth, bound) like TranspositionTable.probe, or None
+    def probe(self, key):
+        self.probes += 1
+        if key in self.pending:
+            depth, bound, score, move = self.pending[key]
+        else:
+            row = self.connect().execute("SELECT depth, bound, score, move FROM entries WHERE key = ?",
+                                         (SearchCache.signed(key),)).fetchone()
+            if row is None:
+                return None
+            depth, bound, score, move = row
+            self.used.add(key)
+        self.hits += 1
+        return TranspositionTable.unpackMove(move), score, depth, bound
+
+    # keeps the deepest result of each position until the search is over
+    def store(self, key, depth, bound, score, move):
+        self.stores += 1
+        if key in self.pending and self.pending[key][0] > depth:
+            return
+        self.pending[key] = (depth, bound, score, TranspositionTable.packMove(move))
+
+    # writes the results of the search, marks what it used, and evicts down to the size cap
+    # a stored result only replaces one on disk that wasn't searched as deep
+    def flush(self):
+        if not self.pending and not self.used:
+            return
+        connection = self.connect()
+        connection.executemany("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                               "depth = excluded.depth, bound = excluded.bound, score = excluded.score, "
+                               "move = excluded.move, used = excluded.used WHERE excluded.depth >= entries.depth",
+                               [(SearchCache.signed(key), depth, bound, score, move, self.clock)
+                                for key, (depth, bound, score, move) in self.pending.items()])
+        connection.executemany("UPDATE entries SET used = ? WHERE key = ?",
+                               [(self.clock, SearchCache.signed(key)) for key in self.used])
+
+        excess = connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.maxEntries
+        if excess > 0:
+            connection.execute("DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY used LIMIT ?)",
+                               (excess,))
+            self.evictions += excess
+        connection.commit()
+        self.pending.clear()
+        self.used.clear()
+        self.clock += 1
+
+    def __len__(self):
+        return self.connect().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        self.flush()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def stats(self):
+        return {"path": self.path, "probes": self.probes, "hits": self.hits,
+                "hitRate": self.hits / self.probes if self.probes else 0.0, "stores": self.stores,
+                "evictions": self.evictions}
@@ -0,0 +1,173 @@
+import os
+import sys
+import threading
+import time
+
+
+# statistics for a single search
+# the counters are running totals that the search bumps directly, and every finished iteration
+# records how much they moved into a per depth breakdown
+class SearchStats:
+    # counters that get broken down by depth
+    counters = ("nodes", "qnodes", "ttProbes", "ttHits", "ttCutoffs", "cutNodes", "firstMoveCuts", "researches",
+                "nullMoveCuts", "reductions", "futilityPrunes", "extensions", "deltaPrunes", "seePrunes", "pawnProbes",
+                "pawnHits", "tablebaseHits", "evalTime", "movegenTime", "orderingTime")
+
+    # timing turns on the eval/movegen/ordering clocks, which cost a little on every node
+    # sampleInterval, in seconds, turns on the sampling profiler
+    def __init__(self, timing=False, sampleInterval=None):
+        self.timing = timing
+        self.sampleInterval = sampleInterval
+        self.start = time.perf_counter()
+        self.seconds = 0.0
+
+        # all nodes, including quiescence nodes
+        self.nodes = 0
+        # quiescence nodes only
+        self.qnodes = 0
+        self.ttProbes = 0
+        self.ttHits = 0
+        # transposition table hits that ended the search of a node
+        self.ttCutoffs = 0
+        self.cutNodes = 0
+        # cut nodes where the first move searched caused the cut
+        self.firstMoveCuts = 0
+        # zero window scouts that beat alpha and had to be searched again with the full window
+        self.researches = 0
+        # selectivity, null move cutoffs, late move reductions, moves or nodes cut by either futility pruning,
+        # and check extensions
+        self.nullMoveCuts = 0
+        self.reductions = 0
+        self.futilityPrunes = 0
+        self.extensions = 0
+        # quiescence captures skipped by delta pruning, and for losing material by static exchange evaluation
+        self.deltaPrunes = 0
+        self.seePrunes = 0
+        # pawn hash lookups by the evaluation
+        self.pawnProbes = 0
+        self.pawnHits = 0
+        # nodes given an exact score by the endgame tablebases, and a root move taken straight from them
+        self.tablebaseHits = 0
+        # seconds, only counted with timing on
+        self.evalTime = 0.0
+        self.movegenTime = 0.0
+        self.orderingTime = 0.0
+
+        # depths at which the aspiration window missed
+        self.aspirationMisses = []
+        # depth -> counters for that iteration, aspiration re-searches add to the same depth
+        self.depths = {}
+        # seconds since the start at the end of each depth
+        self.depthTimes = {}
+        self.lastSnapshot = dict.fromkeys(SearchStats.counters, 0)
+
+        # cumulative seconds per function from the sampling profiler
+        self.profile = {}
+        self.sampler = None
+
+    # records what the counters did during the iteration that just finished
+    def endIteration(self, depth, table=None, pawnHash=None):
+        self.readTables(table, pawnHash)
+        record = self.depths.setdefault(depth, dict.fromkeys(SearchStats.counters, 0))
+        for name in SearchStats.counters:
+            value = getattr(self, name)
+            record[name] += value - self.lastSnapshot[name]
+            self.lastSnapshot[name] = value
+        self.depthTimes[depth] = time.perf_counter() - self.start
+
+    # called once the search is over
+    def finish(self, table=None, pawnHash=None):
+        self.readTables(table, pawnHash)
+        self.seconds = time.perf_counter() - self.start
+        self.stopSampling()
+
+    # the tables count their own probes and hits, which are copied over
+    def readTables(self, table, pawnHash):
+        if table is not None:
+            self.ttProbes = table.probes
+            self.ttHits = table.hits
+        if pawnHash is not None:
+            self.pawnProbes = pawnHash.probes
+            self.pawnHits = pawnHash.hits
+
+    def nps(self):
+        return int(self.nodes / self.seconds) if self.seconds else 0
+
+    def ttHitRate(self):
+        return self.ttHits / self.ttProbes if self.ttProbes else 0.0
+
+    def pawnHitRate(self):
+        return self.pawnHits / self.pawnProbes if self.pawnProbes else 0.0
+
+    # fraction of cut nodes that were cut by their first move, a measure of move ordering
+    def firstMoveCutRate(self):
+        return self.firstMoveCuts / self.cutNodes if self.cutNodes else 0.0
+
+    # nodes at a depth divided by nodes at the depth before
+    def branchingFactor(self, depth):
+        if depth not in self.depths or depth - 1 not in self.depths or not self.depths[depth - 1]["nodes"]:
+            return None
+        return self.depths[depth]["nodes"] / self.depths[depth - 1]["nodes"]
+
+    # starts the sampling profiler on the current thread
+    def startSampling(self):
+        if self.sampleInterval:
+            self.sampler = Sampler(threading.get_ident(), self.sampleInterval, self.profile)
+            self.sampler.start()
+
+    def stopSampling(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler = None
+
+    # everything as plain types, ready for json or a dashboard
+    def toDict(self):
+        totals = {name: getattr(self, name) for name in SearchStats.counters}
+        totals.update({"seconds": self.seconds, "nps": self.nps(), "ttHitRate": self.ttHitRate(),
+                       "pawnHitRate": self.pawnHitRate(), "firstMoveCutRate": self.firstMoveCutRate(),
+                       "aspirationMisses": self.aspirationMisses})
+        depths = {}
+        for depth, record in sorted(self.depths.items()):
+            depths[depth] = dict(record)
+            depths[depth]["seconds"] = self.depthTimes[depth]
+            depths[depth]["branchingFactor"] = self.branchingFactor(depth)
+            depths[depth]["firstMoveCutRate"] = \
+                record["firstMoveCuts"] / record["cutNodes"] if record["cutNodes"] else 0.0
+        totals["depths"] = depths
+        if self.profile:
+            totals["profile"] = dict(sorted(self.profile.items(), key=lambda item: -item[1]))
+        return totals
+
+
+# sampling profiler
+# a background thread looks at the searching thread's stack every interval, and every function on the stack
+# is charged the interval, so each function ends up with the time spent inside it and everything it calls
+class Sampler(threading.Thread):
+    def __init__(self, threadId, interval, profile):
+        super().__init__(daemon=True)
+        self.threadId = threadId
+        self.interval = interval
+        self.profile = profile
+        self.running = threading.Event()
+        self.running.set()
+
+    def run(self):
+        last = time.perf_counter()
+        while self.running.is_set():
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            elapsed, last = now - last, now
+
+            frame = sys._current_frames().get(self.threadId)
+            seen = set()
+            while frame is not None:
+                code = frame.f_code
+                name = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+                if name not in seen:
+                    seen.add(name)
+                    self.profile[name] = self.profile.get(name, 0.0) + elapsed
+                frame = frame.f_back
+
+    def stop(self):
+        self.running.clear()
+        self.join()
@@ -0,0 +1,98 @@
+import chess
+import chess.syzygy
+
+
+# syzygy endgame tablebases
+# wdl results are cached by zobrist key, probing a table means walking the captures of the position first, which
+# costs far more than a search node
+# a position is only probed right after a capture or pawn move, which is what the wdl tables assume, and only
+# without castling rights, which the tables leave out
+class Tablebase:
+    def __init__(self, directories=(), cacheSize=65536):
+        self.tables = chess.syzygy.Tablebase()
+        self.directories = []
+        # most pieces in any table that was found, zero with no tables
+        self.maxPieces = 0
+        # zobrist key -> wdl, or None for positions missing from the tables
+        # cleared whenever it fills up, every entry is cheap to work out again compared to a probe that missed it
+        self.cache = {}
+        self.cacheSize = cacheSize
+
+        # statistics
+        self.probes = 0
+        self.hits = 0
+
+        for directory in directories:
+            self.addDirectory(directory)
+
+    # loads every table in a directory, returns how many were found
+    def addDirectory(self, directory):
+        found = self.tables.add_directory(directory)
+        self.directories.append(directory)
+        # table names are the pieces of each side split by a v, like KQvK
+        self.maxPieces = max((len(name) - 1 for name in self.tables.wdl), default=0)
+        self.cache.clear()
+        return found
+
+    def close(self):
+        self.tables.close()
+        self.tables = chess.syzygy.Tablebase()
+        self.directories = []
+        self.maxPieces = 0
+        self.cache.clear()
+
+    def __bool__(self):
+        return self.maxPieces > 0
+
+    # whether the tables can have the position at all
+    def covers(self, board):
+        return chess.popcount(board.occupied) <= self.maxPieces and not board.castling_rights
+
+    # win (2), cursed win (1), draw (0), blessed loss (-1) or loss (-2) for the side to move, or None if the
+    # tables don't have the position
+    def wdl(self, board, key):
+        if key in self.cache:
+            result = self.cache[key]
+        else:
+            self.probes += 1
+            result = self.tables.get_wdl(board)
+            if len(self.cache) >= self.cacheSize:
+                self.cache.clear()
+            self.cache[key] = result
+        if result is not None:
+            self.hits += 1
+        return result
+
+    # the move that keeps the best result and makes the most progress towards it, with its wdl, or None if the
+    # tables don't have the position
+    # winning, it is the quickest move to a capture or pawn move that keeps the win, so the fifty move rule can
+    # never save the opponent; losing, it is the move that holds out longest
+    # dtz is in plies to the next capture or pawn move, a win that can't be reached before the fifty move rule
+    # counts as a cursed win
+    def rootMove(self, board):
+        if not self.covers(board):
+            return None
+        best = None
+        for move in board.legal_moves:
+            zeroing = board.is_zeroing(move)
+            board.push(move)
+            try:
+                if board.is_checkmate():
+                    result, plies = 2, 0
+                else:
+                    result = self.tables.get_wdl(board)
+                    dtz = self.tables.get_dtz(board)
+                    if result is None or dtz is None:
+                        return None
+                    result, plies = -result, 0 if zeroing else abs(dtz)
+                    if result == 2 and plies + board.halfmove_clock > 100:
+                        result = 1
+            finally:
+                board.pop()
+
+            rank = (result, -plies if result > 0 else plies)
+            if best is None or rank > best[0]:
+                best = (rank, move)
+        if best is None:
+            return None
+        return best[1], best[0][0]
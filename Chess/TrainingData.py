@@ -0,0 +1,296 @@
+import glob
+import os
+import random
+import struct
+import time
+
+import chess
+import chess.pgn
+from AI import *
+from BatchEval import *
+from WorkerPool import *
+
+# numpy is optional, only reading the data back needs it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# writes fixed width position records into numbered chunk files of at most chunkRecords records each
+# chunks are never appended to once closed, a new writer on the same directory starts after the last one
+class TrainingWriter:
+    def __init__(self, directory, chunkRecords=1 << 20, version=0):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.chunkRecords = chunkRecords
+        # evaluation the scores came from, see AI.evaluationVersion
+        self.version = version
+        self.chunk = max((TrainingData.chunkIndex(path) for path in TrainingData.chunkPaths(directory)),
+                         default=-1) + 1
+        self.file = None
+        # records in the open chunk, and written by this writer
+        self.records = 0
+        self.total = 0
+
+    def openChunk(self):
+        if self.file is not None:
+            self.file.close()
+        path = os.path.join(self.directory, f"chunk-{self.chunk:05d}.bin")
+        self.chunk += 1
+        # never over an existing chunk, a writer racing another one on the same directory fails instead
+        self.file = open(path, "xb")
+        self.file.write(TrainingData.HEADER.pack(TrainingData.MAGIC, TrainingData.FORMAT, self.version))
+        self.records = 0
+
+    # data is whole records, as packed by TrainingData.pack
+    def write(self, data):
+        view = memoryview(data)
+        size = TrainingData.RECORD.size
+        while view:
+            if self.file is None or self.records >= self.chunkRecords:
+                self.openChunk()
+            records = min(len(view) // size, self.chunkRecords - self.records)
+            self.file.write(view[:records * size])
+            view = view[records * size:]
+            self.records += records
+            self.total += records
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# positions labelled by the search, for tuning and training evaluations
+# every record is the 12 piece bitboards in BatchEval order, the rest of the board state, the search score and
+# best move, and the result of the game, fixed width so a chunk can be memory mapped as a numpy array and any
+# record read without touching the rest
+# scores and results are from white's point of view, results are 1, 0, or -1
+# the data is read through memory maps, so random samples and shuffled batches never load a whole chunk
+class TrainingData:
+    # chunk header, magic, format, and the evaluation version of the scores
+    HEADER = struct.Struct("<4sQQ")
+    MAGIC = b"TRNG"
+    # changes whenever the record layout changes
+    FORMAT = 1
+
+    # pieces, turn, castling rights, en passant square, halfmove clock, fullmove number, score, result, depth,
+    # and best move packed like TranspositionTable.packMove
+    RECORD = struct.Struct("<12QBBBBHhbBH")
+
+    # castling rights, a bit each for white kingside, white queenside, black kingside, and black queenside
+    castlingSquares = [chess.BB_H1, chess.BB_A1, chess.BB_H8, chess.BB_A8]
+
+    # en passant square of a record without one
+    NO_SQUARE = 255
+
+    if np is not None:
+        dtype = np.dtype([("pieces", "<u8", (12,)), ("turn", "u1"), ("castling", "u1"), ("epSquare", "u1"),
+                          ("halfmove", "u1"), ("fullmove", "<u2"), ("score", "<i2"), ("result", "i1"),
+                          ("depth", "u1"), ("move", "<u2")])
+        assert dtype.itemsize == RECORD.size
+
+    # number of a chunk file from its name
+    @staticmethod
+    def chunkIndex(path):
+        return int(os.path.basename(path)[len("chunk-"):-len(".bin")])
+
+    # the chunk files of a directory, or the files given, in order
+    @staticmethod
+    def chunkPaths(paths):
+        if isinstance(paths, str):
+            if not os.path.isdir(paths):
+                return [paths]
+            return sorted(glob.glob(os.path.join(paths, "chunk-*.bin")))
+        return [path for entry in paths for path in TrainingData.chunkPaths(entry)]
+
+    def __init__(self, paths):
+        if np is None:
+            raise ImportError("reading training data needs numpy")
+        self.paths = TrainingData.chunkPaths(paths)
+        self.chunks = []
+        self.versions = []
+        for path in self.paths:
+            with open(path, "rb") as file:
+                magic, fileFormat, version = TrainingData.HEADER.unpack(file.read(TrainingData.HEADER.size))
+            if magic != TrainingData.MAGIC or fileFormat != TrainingData.FORMAT:
+                raise ValueError(f"{path} is not a training data chunk of format {TrainingData.FORMAT}")
+            # a chunk cut short by a crash ends at its last whole record
+            records = (os.path.getsize(path) - TrainingData.HEADER.size) // TrainingData.RECORD.size
+            if records:
+                self.chunks.append(np.memmap(path, dtype=TrainingData.dtype, mode="r",
+                                             offset=TrainingData.HEADER.size, shape=(records,)))
+                self.versions.append(version)
+        # index of the first record of every chunk, and one past the last record
+        self.offsets = np.cumsum([0] + [len(chunk) for chunk in self.chunks])
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    # records by index over all the chunks, as a numpy record array
+    def take(self, indices):
+        indices = np.asarray(indices, dtype=np.int64)
+        chunks = np.searchsorted(self.offsets, indices, side="right") - 1
+        records = np.empty(len(indices), dtype=TrainingData.dtype)
+        for chunk in np.unique(chunks):
+            mask = chunks == chunk
+            records[mask] = self.chunks[chunk][indices[mask] - self.offsets[chunk]]
+        return records
+
+    # count records picked at random, with replacement
+    def sample(self, count, seed=None):
+        return self.take(np.sort(np.random.default_rng(seed).integers(0, len(self), count)))
+
+    # every record once in a random order, in batches
+    # only the order is held in memory, each batch is read sorted by position so the reads stay mostly sequential
+    def batches(self, batchSize, seed=None):
+        order = np.random.default_rng(seed).permutation(len(self))
+        for start in range(0, len(order), batchSize):
+            yield self.take(np.sort(order[start:start + batchSize]))
+
+    # a record as bytes
+    @staticmethod
+    def pack(board, score, result, depth, move):
+        castling = 0
+        for bit, square in enumerate(TrainingData.castlingSquares):
+            if board.castling_rights & square:
+                castling |= 1 << bit
+        return TrainingData.RECORD.pack(
+            *[board.pieces_mask(pieceType, color) for color, pieceType in BatchEval.pieces], board.turn, castling,
+            TrainingData.NO_SQUARE if board.ep_square is None else board.ep_square, min(board.halfmove_clock, 255),
+            min(board.fullmove_number, 0xffff), max(-AI.MATE_SCORE, min(AI.MATE_SCORE, score)), result,
+            min(depth, 255), TranspositionTable.packMove(move))
+
+    # the board of a record
+    @staticmethod
+    def toBoard(record):
+        board = chess.Board(None)
+        for bitboard, (color, pieceType) in zip(record["pieces"], BatchEval.pieces):
+            for square in chess.scan_forward(int(bitboard)):
+                board.set_piece_at(square, chess.Piece(pieceType, color))
+        board.turn = bool(record["turn"])
+        board.castling_rights = 0
+        for bit, square in enumerate(TrainingData.castlingSquares):
+            if record["castling"] & (1 << bit):
+                board.castling_rights |= square
+        board.ep_square = None if record["epSquare"] == TrainingData.NO_SQUARE else int(record["epSquare"])
+        board.halfmove_clock = int(record["halfmove"])
+        board.fullmove_number = int(record["fullmove"])
+        return board
+
+    # 1, 0, or -1 for white
+    @staticmethod
+    def resultValue(result):
+        return {"1-0": 1, "0-1": -1}.get(result, 0)
+
+    # whether a searched position goes into the data
+    # quiet keeps only positions the static evaluation can be expected to get right, not in check, with a quiet
+    # best move, and not a mate
+    @staticmethod
+    def keep(board, score, move, quiet):
+        if move is None or score is None:
+            return False
+        if not quiet:
+            return True
+        return not board.is_check() and not board.is_capture(move) and not move.promotion and \
+            abs(score) < AI.MATE_BOUND
+
+    # search of one position, returns the best move, the score from white's point of view, and the depth reached
+    @staticmethod
+    def label(board, limits):
+        depths = []
+        move, score, PV, stats = AI.search(board, limits.get("depth"), nodes=limits.get("nodes"),
+                                           info=lambda deep, score, elapsed, PV: depths.append(deep))
+        return move, score, depths[-1] if depths else 0
+
+    # plays a game against itself from a few random moves, labelling the positions it searches on the way
+    # what a pool worker runs, returns the packed records
+    @staticmethod
+    def selfPlayGame(seed, limits, randomPlies=8, maxPlies=400, quiet=True):
+        generator = random.Random(seed)
+        AI.newGame()
+        board = chess.Board()
+        for ply in range(randomPlies):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            board.push(generator.choice(moves))
+
+        positions = []
+        while board.outcome(claim_draw=True) is None and len(board.move_stack) < maxPlies:
+            move, score, depth = TrainingData.label(board, limits)
+            if move is None:
+                break
+            if TrainingData.keep(board, score, move, quiet):
+                positions.append((board.copy(stack=False), score, depth, move))
+            board.push(move)
+
+        outcome = board.outcome(claim_draw=True)
+        result = TrainingData.resultValue(outcome.result() if outcome is not None else "1/2-1/2")
+        return b"".join(TrainingData.pack(position, score, result, depth, move)
+                        for position, score, depth, move in positions)
+
+    # labels the positions of a game that was already played, from skipPlies on
+    # what a pool worker runs, returns the packed records
+    @staticmethod
+    def labelGame(fen, moves, result, limits, skipPlies=8, quiet=True):
+        AI.newGame()
+        board = chess.Board(fen)
+        records = []
+        for ply, move in enumerate(moves):
+            if ply >= skipPlies:
+                bestMove, score, depth = TrainingData.label(board, limits)
+                if TrainingData.keep(board, score, bestMove, quiet):
+                    records.append(TrainingData.pack(board, score, result, depth, bestMove))
+            board.push_uci(move)
+        return b"".join(records)
+
+    # (worker function, arguments) for every game of some pgn files, read one game at a time
+    @staticmethod
+    def pgnTasks(pgnPaths, limits, skipPlies, quiet, games=None):
+        count = 0
+        for path in pgnPaths:
+            with open(path, encoding="utf-8-sig", errors="replace") as pgn:
+                while games is None or count < games:
+                    game = chess.pgn.read_game(pgn)
+                    if game is None:
+                        break
+                    count += 1
+                    yield TrainingData.labelGame, (game.board().fen(), [move.uci() for move in game.mainline_moves()],
+                                                   TrainingData.resultValue(game.headers.get("Result", "*")),
+                                                   limits, skipPlies, quiet)
+
+    # labels positions from self play, or from pgn files if any are given, and writes them to chunks in output
+    # games are spread across a pool of processes by WorkerPool.run, so the pgn files are streamed rather than read
+    # up front
+    # returns the number of positions written
+    @staticmethod
+    def generate(output, limits, games=None, pgnPaths=(), workers=1, randomPlies=8, maxPlies=400, skipPlies=8,
+                 quiet=True, seed=0, chunkRecords=1 << 20, inFlight=2):
+        if pgnPaths:
+            tasks = TrainingData.pgnTasks(pgnPaths, limits, skipPlies, quiet, games)
+        else:
+            tasks = ((TrainingData.selfPlayGame, (seed + game, limits, randomPlies, maxPlies, quiet))
+                     for game in range(games or 100))
+
+        start = time.time()
+        played = 0
+        with TrainingWriter(output, chunkRecords, AI.evaluationVersion()) as writer:
+            for data in WorkerPool.run(tasks, workers, inFlight):
+                writer.write(data)
+                played += 1
+                if played % 10 == 0:
+                    elapsed = time.time() - start
+                    print(f"{played} games, {writer.total} positions, "
+                          f"{writer.total / elapsed if elapsed else 0:.1f} positions/second")
+
+        elapsed = time.time() - start
+        print(f"Wrote {writer.total} positions from {played} games to {output} in {elapsed:.1f} seconds")
+        return writer.total
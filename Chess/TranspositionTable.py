@@ -0,0 +1,180 @@
+import array
+
+import chess
+
+
+# fixed size transposition table
+# entries live in one preallocated array of 64 bit words, two words per entry:
+# the zobrist key xor the data, then the packed data
+#   bits  0-15  best move (from square, to square, promotion piece)
+#   bits 16-31  score, offset so it fits unsigned
+#   bits 32-39  depth
+#   bits 40-41  bound type
+#   bits 42-47  age of the search that stored it
+# two entries share a bucket, the first keeps the deepest result and the second is always replaced
+# the table can live in shared memory for parallel search, the key is stored xor the data
+# so an entry torn by two processes writing at once just fails to match instead of returning garbage
+# noinspection SpellCheckingInspection
+class TranspositionTable:
+    # bound types
+    EXACT = 1
+    LOWER = 2
+    UPPER = 3
+
+    # scores are stored in 16 bits, infinite (mate) scores get the ends of the range
+    INF_SCORE = 32767
+    MAX_SCORE = 32000
+
+    WORDS_PER_ENTRY = 2
+    ENTRIES_PER_BUCKET = 2
+    BUCKET_BYTES = WORDS_PER_ENTRY * ENTRIES_PER_BUCKET * 8
+
+    # buffer is an existing block of memory to use instead of allocating one, like a SharedMemory buffer
+    def __init__(self, sizeMB=16, buffer=None):
+        self.sizeMB = sizeMB
+        self.buckets = max(1, (sizeMB * 1024 * 1024) // TranspositionTable.BUCKET_BYTES)
+        if buffer is None:
+            self.table = array.array('Q', bytes(self.buckets * TranspositionTable.BUCKET_BYTES))
+        else:
+            self.table = memoryview(buffer)[:TranspositionTable.bytesNeeded(sizeMB)].cast('Q')
+        self.age = 0
+
+        # statistics
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.collisions = 0
+
+    # bytes needed for a table of the given size
+    @staticmethod
+    def bytesNeeded(sizeMB):
+        return max(1, (sizeMB * 1024 * 1024) // TranspositionTable.BUCKET_BYTES) * TranspositionTable.BUCKET_BYTES
+
+    # throws away every entry and reallocates the table at a new size
+    def resize(self, sizeMB):
+        self.__init__(sizeMB)
+
+    # throws away every entry but keeps the memory
+    def clear(self):
+        if isinstance(self.table, array.array):
+            self.table = array.array('Q', bytes(self.buckets * TranspositionTable.BUCKET_BYTES))
+        else:
+            self.table.cast('B')[:] = bytes(len(self.table) * 8)
+        self.age = 0
+        self.resetStats()
+
+    def resetStats(self):
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        self.collisions = 0
+
+    # marks the start of a new search, entries from older searches become the first to be replaced
+    def newSearch(self):
+        self.age = (self.age + 1) & 63
+
+    @staticmethod
+    def packMove(move):
+        if move is None:
+            return 0
+        return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+    @staticmethod
+    def unpackMove(packed):
+        if packed == 0:
+            return None
+        return chess.Move(packed & 63, (packed >> 6) & 63, (packed >> 12) or None)
+
+    @staticmethod
+    def packScore(score):
+        if score == float('inf'):
+            return TranspositionTable.INF_SCORE
+        if score == -float('inf'):
+            return -TranspositionTable.INF_SCORE
+        return max(-TranspositionTable.MAX_SCORE, min(TranspositionTable.MAX_SCORE, int(score)))
+
+    @staticmethod
+    def unpackScore(score):
+        if score == TranspositionTable.INF_SCORE:
+            return float('inf')
+        if score == -TranspositionTable.INF_SCORE:
+            return -float('inf')
+        return score
+
+    # looks up a position
+    # returns (best move, score, depth, bound) or None if the position is not stored
+    def probe(self, key):
+        self.probes += 1
+        index = (key % self.buckets) * 4
+        table = self.table
+        for slot in (index, index + 2):
+            data = table[slot + 1]
+            if table[slot] ^ data == key:
+                self.hits += 1
+                return (TranspositionTable.unpackMove(data & 0xFFFF),
+                        TranspositionTable.unpackScore(((data >> 16) & 0xFFFF) - 32768),
+                        (data >> 32) & 0xFF,
+                        (data >> 40) & 3)
+        return None
+
+    # stores a position
+    def store(self, key, depth, bound, score, move):
+        self.stores += 1
+        index = (key % self.buckets) * 4
+        table = self.table
+        depth = max(0, min(255, depth))
+        packedMove = TranspositionTable.packMove(move)
+
+        # the same position is already stored, only replace it with something at least as deep
+        for slot in (index, index + 2):
+            old = table[slot + 1]
+            if table[slot] ^ old == key:
+                if depth < (old >> 32) & 0xFF and (old >> 42) == self.age:
+                    return
+                # keep the old best move if we don't have one
+                if packedMove == 0:
+                    packedMove = old & 0xFFFF
+                data = TranspositionTable.packData(packedMove, score, depth, bound, self.age)
+                table[slot] = key ^ data
+                table[slot + 1] = data
+                return
+
+        data = TranspositionTable.packData(packedMove, score, depth, bound, self.age)
+
+        # depth preferred slot, taken if the new result is deeper or the old one is from an earlier search
+        old = table[index + 1]
+        if old == 0 or depth >= (old >> 32) & 0xFF or (old >> 42) != self.age:
+            if old != 0:
+                self.collisions += 1
+            table[index] = key ^ data
+            table[index + 1] = data
+            return
+
+        # always replace slot
+        if table[index + 3] != 0:
+            self.collisions += 1
+        table[index + 2] = key ^ data
+        table[index + 3] = data
+
+    @staticmethod
+    def packData(packedMove, score, depth, bound, age):
+        return (packedMove | ((TranspositionTable.packScore(score) + 32768) << 16) | (depth << 32) |
+                (bound << 40) | (age << 42))
+
+    # permille of the sampled entries that belong to the current search, the same as the uci hashfull value
+    def hashfull(self):
+        sample = min(1000, self.buckets * TranspositionTable.ENTRIES_PER_BUCKET)
+        used = 0
+        for entry in range(sample):
+            data = self.table[entry * 2 + 1]
+            if data != 0 and (data >> 42) == self.age:
+                used += 1
+        return used * 1000 // sample
+
+    # fraction of probes that found their position
+    def hitRate(self):
+        return self.hits / self.probes if self.probes else 0.0
+
+    def stats(self):
+        return {"sizeMB": self.sizeMB, "probes": self.probes, "hits": self.hits, "hitRate": self.hitRate(),
+                "stores": self.stores, "collisions": self.collisions, "hashfull": self.hashfull()}
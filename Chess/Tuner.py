@@ -0,0 +1,221 @@
+import math
+import time
+
+import chess
+from AI import *
+from BatchEval import *
+from TrainingData import *
+
+# numpy is optional, only tuning needs it
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+# texel tuning of the evaluation weights against the results of the games positions came from
+# every weight of AI.weights is one entry of a single vector, and the evaluation is linear in it apart from the
+# rounding of the taper, so every position is turned into a sparse row of feature counts once and the evaluation of
+# all of them is a few numpy calls over those rows
+# the fit is a logistic curve of the evaluation against the results, optionally blended with the search scores of
+# the positions, with full batch adam steps on the mean squared error
+class Tuner:
+    # where every group of weights starts in the vector
+    # piece values from the pawn to the king, middlegame and endgame tables in the order of
+    # BatchEval.middlegameValues for white, pawn terms in the order of BatchEval.pawnTermWeights for the middlegame
+    # and the endgame, and the terms of BatchEval.extraTermWeights
+    PIECES = 0
+    MIDDLEGAME = PIECES + 6
+    ENDGAME = MIDDLEGAME + 384
+    PAWN_MIDDLEGAME = ENDGAME + 384
+    PAWN_ENDGAME = PAWN_MIDDLEGAME + 14
+    EXTRAS = PAWN_ENDGAME + 14
+    SIZE = EXTRAS + 3
+
+    # adam decay rates
+    beta1 = 0.9
+    beta2 = 0.999
+
+    # the weights of AI.weights as a vector
+    @staticmethod
+    def vector(weights):
+        vector = np.zeros(Tuner.SIZE)
+        vector[Tuner.PIECES:Tuner.PIECES + 5] = weights["pieceValues"]
+        vector[Tuner.MIDDLEGAME:Tuner.ENDGAME] = np.ravel(weights["middlegameTables"])
+        vector[Tuner.ENDGAME:Tuner.PAWN_MIDDLEGAME] = np.ravel(weights["endgameTables"])
+        pawnTerms = np.array([weights["isolatedPawn"], weights["doubledPawn"], weights["defendedPawn"],
+                              weights["backwardPawn"]] + weights["passedPawn"] + weights["pawnShield"])
+        vector[Tuner.PAWN_MIDDLEGAME:Tuner.PAWN_ENDGAME] = pawnTerms[:, 0]
+        vector[Tuner.PAWN_ENDGAME:Tuner.EXTRAS] = pawnTerms[:, 1]
+        vector[Tuner.EXTRAS:] = [weights["bishopPair"], weights["earlyQueen"], weights["spaceBonus"]]
+        return vector
+
+    # a vector back as weights for AI.setWeights, rounded to whole centipawns
+    @staticmethod
+    def weights(vector):
+        vector = [int(value) for value in np.rint(vector)]
+        pawnTerms = [list(term) for term in zip(vector[Tuner.PAWN_MIDDLEGAME:Tuner.PAWN_ENDGAME],
+                                                vector[Tuner.PAWN_ENDGAME:Tuner.EXTRAS])]
+
+        def tables(start):
+            return [[vector[start + table * 64 + row * 8:start + table * 64 + row * 8 + 8] for row in range(8)]
+                    for table in range(6)]
+
+        return {"pieceValues": vector[Tuner.PIECES:Tuner.PIECES + 5],
+                "middlegameTables": tables(Tuner.MIDDLEGAME), "endgameTables": tables(Tuner.ENDGAME),
+                "isolatedPawn": pawnTerms[0], "doubledPawn": pawnTerms[1], "defendedPawn": pawnTerms[2],
+                "backwardPawn": pawnTerms[3], "passedPawn": pawnTerms[4:12], "pawnShield": pawnTerms[12:14],
+                "bishopPair": vector[Tuner.EXTRAS], "earlyQueen": vector[Tuner.EXTRAS + 1],
+                "spaceBonus": vector[Tuner.EXTRAS + 2]}
+
+    # probability of a white win from a score, the same curve for the evaluation and the search scores
+    @staticmethod
+    def sigmoid(scores, scale):
+        return 1 / (1 + np.power(10.0, -scale * scores / 400))
+
+    # features of training data records, built once
+    # every piece is a (position, table entry, sign) triple, the entry is the piece type and square as seen from
+    # its own side, so black pieces share white's tables with the sign flipped, the same as AI.buildTables
+    # the pawn and extra terms are dense, a few small counts per position
+    def __init__(self, records):
+        self.count = len(records)
+        pieces = np.ascontiguousarray(records["pieces"])
+        fullmoves = records["fullmove"].astype(np.int64)
+        positions, entries, signs, phases, pawnCounts, extraCounts = [], [], [], [], [], []
+        for start in range(0, self.count, BatchEval.chunkSize):
+            chunk = pieces[start:start + BatchEval.chunkSize]
+            phase = np.minimum(BatchEval.popcount(chunk) @ BatchEval.phaseWeights, AI.maxPhase)
+            phases.append(phase / AI.maxPhase)
+
+            position, piece, square = np.nonzero(BatchEval.squares(chunk))
+            white = piece < 6
+            row = np.where(white, 7 - square // 8, square // 8)
+            positions.append((position + start).astype(np.int32))
+            entries.append(((piece % 6) * 64 + row * 8 + square % 8).astype(np.int16))
+            signs.append(np.where(white, 1, -1).astype(np.int8))
+
+            pawnCounts.append(np.stack(BatchEval.pawnTermCounts(chunk), axis=1).astype(np.float32))
+            extraCounts.append(np.stack(BatchEval.extraTermCounts(chunk, fullmoves[start:start + len(chunk)]),
+                                        axis=1).astype(np.float32))
+
+        self.positions = np.concatenate(positions)
+        self.entries = np.concatenate(entries)
+        self.pieceTypes = self.entries // 64
+        self.signs = np.concatenate(signs).astype(np.float32)
+        self.phase = np.concatenate(phases)
+        # phase of the position every piece is in, for the table gradients
+        self.piecePhase = self.phase[self.positions].astype(np.float32)
+        self.pawnCounts = np.concatenate(pawnCounts)
+        self.extraCounts = np.concatenate(extraCounts)
+
+        self.results = (records["result"].astype(np.float64) + 1) / 2
+        self.scores = records["score"].astype(np.float64)
+
+    # evaluations of every position from white's point of view, unrounded
+    def evaluate(self, vector):
+        pieces = vector[Tuner.PIECES + self.pieceTypes] + vector[Tuner.MIDDLEGAME + self.entries] * self.piecePhase + \
+            vector[Tuner.ENDGAME + self.entries] * (1 - self.piecePhase)
+        scores = np.bincount(self.positions, weights=self.signs * pieces, minlength=self.count)
+        scores += self.pawnCounts @ vector[Tuner.PAWN_MIDDLEGAME:Tuner.PAWN_ENDGAME] * self.phase
+        scores += self.pawnCounts @ vector[Tuner.PAWN_ENDGAME:Tuner.EXTRAS] * (1 - self.phase)
+        scores += self.extraCounts @ vector[Tuner.EXTRAS:]
+        return scores
+
+    # what the fit aims for, the game results blended with the search scores through the same curve
+    def targets(self, scale, scoreWeight=0.0):
+        return (1 - scoreWeight) * self.results + scoreWeight * Tuner.sigmoid(self.scores, scale)
+
+    def error(self, vector, scale, targets):
+        return float(np.mean((Tuner.sigmoid(self.evaluate(vector), scale) - targets) ** 2))
+
+    # mean squared error and its gradient by every weight
+    def gradient(self, vector, scale, targets):
+        predicted = Tuner.sigmoid(self.evaluate(vector), scale)
+        difference = predicted - targets
+        # by the evaluation of every position
+        scores = 2 * difference * predicted * (1 - predicted) * scale * math.log(10) / 400 / self.count
+        pieces = scores[self.positions] * self.signs
+
+        gradient = np.empty(Tuner.SIZE)
+        gradient[Tuner.PIECES:Tuner.MIDDLEGAME] = np.bincount(self.pieceTypes, weights=pieces, minlength=6)
+        gradient[Tuner.MIDDLEGAME:Tuner.ENDGAME] = np.bincount(self.entries, weights=pieces * self.piecePhase,
+                                                               minlength=384)
+        gradient[Tuner.ENDGAME:Tuner.PAWN_MIDDLEGAME] = np.bincount(self.entries,
+                                                                    weights=pieces * (1 - self.piecePhase),
+                                                                    minlength=384)
+        gradient[Tuner.PAWN_MIDDLEGAME:Tuner.PAWN_ENDGAME] = self.pawnCounts.T @ (scores * self.phase)
+        gradient[Tuner.PAWN_ENDGAME:Tuner.EXTRAS] = self.pawnCounts.T @ (scores * (1 - self.phase))
+        gradient[Tuner.EXTRAS:] = self.extraCounts.T @ scores
+        return float(np.mean(difference ** 2)), gradient
+
+    # the scale of the curve that fits the current evaluation to the results best, a golden section search
+    def fitScale(self, vector, low=0.1, high=4.0, steps=40):
+        scores = self.evaluate(vector)
+
+        def error(scale):
+            return float(np.mean((Tuner.sigmoid(scores, scale) - self.results) ** 2))
+
+        ratio = (math.sqrt(5) - 1) / 2
+        a, b = high - ratio * (high - low), low + ratio * (high - low)
+        errorA, errorB = error(a), error(b)
+        for step in range(steps):
+            if errorA < errorB:
+                high, b, errorB = b, a, errorA
+                a = high - ratio * (high - low)
+                errorA = error(a)
+            else:
+                low, a, errorA = a, b, errorB
+                b = low + ratio * (high - low)
+                errorB = error(b)
+        return (low + high) / 2
+
+    # adam steps from a vector, returns the tuned vector
+    # the king's value stays where it is, it is on both sides of every position so nothing moves it
+    def tune(self, vector, scale, targets, iterations=1000, learningRate=1.0, report=100):
+        vector = vector.copy()
+        first = np.zeros(Tuner.SIZE)
+        second = np.zeros(Tuner.SIZE)
+        start = time.time()
+        for iteration in range(1, iterations + 1):
+            error, gradient = self.gradient(vector, scale, targets)
+            gradient[Tuner.PIECES + chess.KING - 1] = 0
+            first = Tuner.beta1 * first + (1 - Tuner.beta1) * gradient
+            second = Tuner.beta2 * second + (1 - Tuner.beta2) * gradient ** 2
+            corrected = first / (1 - Tuner.beta1 ** iteration)
+            vector -= learningRate * corrected / (np.sqrt(second / (1 - Tuner.beta2 ** iteration)) + 1e-12)
+            if report and iteration % report == 0:
+                print(f"iteration {iteration}: error {error:.6f}, {time.time() - start:.1f} seconds")
+        return vector
+
+    # tunes the current weights against training data and writes them to output, which the engine loads at
+    # startup if it is AI.weightsPath
+    # positions picks that many records at random instead of using all of them
+    # returns the error before and after
+    @staticmethod
+    def run(paths, output=None, positions=None, iterations=1000, learningRate=1.0, scoreWeight=0.0, seed=0):
+        if np is None:
+            raise ImportError("tuning needs numpy")
+        data = TrainingData(paths)
+        if not len(data):
+            raise ValueError("no training data")
+        records = data.sample(positions, seed) if positions else data.take(np.arange(len(data)))
+
+        start = time.time()
+        tuner = Tuner(records)
+        print(f"Features of {tuner.count} positions in {time.time() - start:.1f} seconds")
+        vector = Tuner.vector(AI.weights())
+
+        scale = tuner.fitScale(vector)
+        targets = tuner.targets(scale, scoreWeight)
+        before = tuner.error(vector, scale, targets)
+        print(f"scale {scale:.3f}, error {before:.6f}")
+
+        vector = tuner.tune(vector, scale, targets, iterations, learningRate)
+        weights = Tuner.weights(vector)
+        after = tuner.error(Tuner.vector(weights), scale, targets)
+        print(f"error {before:.6f} -> {after:.6f}")
+
+        output = output or AI.weightsPath
+        AI.saveWeights(output, weights)
+        print(f"Wrote weights to {output}")
+        return before, after
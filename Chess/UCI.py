@@ -0,0 +1,266 @@
+import sys
+import threading
+import time
+
+import chess
+from AI import *
+from LazySMP import *
+from OpeningBook import *
+
+
+# class wrapping the uci protocol, so the engine can be run by any uci gui or tournament manager
+# the search runs on a worker thread so commands like stop are handled while it is thinking
+class UCI:
+    name = "Chess-Engine"
+    author = "Krtoonbrat"
+
+    def __init__(self, output=sys.stdout, book=None):
+        self.output = output
+        self.outputLock = threading.Lock()
+        self.board = chess.Board()
+        self.worker = None
+        self.threads = 1
+        # the parallel search, only running when Threads is more than 1
+        self.smp = None
+        # opening book, only played from when OwnBook is on
+        self.book = book or OpeningBook()
+        self.ownBook = bool(self.book)
+
+    # sends a line to the gui
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    # reads commands until quit or the input closes
+    def loop(self, commands=sys.stdin):
+        for line in commands:
+            if not self.command(line):
+                break
+        self.stop()
+
+    # handles a single command, returns false when the engine should quit
+    # a command the engine can't make sense of, like an illegal move or a value that isn't a number, is reported
+    # to the gui and otherwise ignored, a gui sending one bad line shouldn't take the engine down
+    def command(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        try:
+            return self.dispatch(tokens[0], tokens[1:])
+        except (ValueError, chess.IllegalMoveError) as error:
+            self.send(f"info string error in {line.strip()!r}: {error}")
+            return True
+
+    def dispatch(self, name, args):
+        if name == "uci":
+            self.send(f"id name {UCI.name}")
+            self.send(f"id author {UCI.author}")
+            self.send(f"option name Hash type spin default {AI.transpoTable.sizeMB} min 1 max 4096")
+            self.send(f"option name Threads type spin default 1 min 1 max 256")
+            self.send(f"option name Ponder type check default false")
+            self.send(f"option name PawnHash type spin default {AI.pawnHash.sizeMB} min 1 max 1024")
+            self.send(f"option name OwnBook type check default {'true' if self.ownBook else 'false'}")
+            self.send(f"option name BookFile type string default {';'.join(self.book.paths) or '<empty>'}")
+            self.send(f"option name BookSelection type combo default {self.book.selection} "
+                      f"{' '.join('var ' + selection for selection in OpeningBook.selections)}")
+            self.send(f"option name SyzygyPath type string default {';'.join(AI.tablebase.directories) or '<empty>'}")
+            self.send(f"option name SearchCache type string default "
+                      f"{AI.searchCache.path if AI.searchCache is not None else '<empty>'}")
+            self.send("uciok")
+        elif name == "isready":
+            self.send("readyok")
+        elif name == "ucinewgame":
+            self.wait()
+            AI.newGame()
+            if self.smp is not None:
+                self.smp.table.clear()
+        elif name == "setoption":
+            self.setOption(args)
+        elif name == "position":
+            self.wait()
+            self.position(args)
+        elif name == "go":
+            self.wait()
+            self.go(args)
+        elif name == "ponderhit":
+            AI.ponderHit()
+        elif name == "stop":
+            self.stop()
+        elif name == "quit":
+            self.stop()
+            self.startSMP(1)
+            return False
+        return True
+
+    # setoption name <name> value <value>
+    def setOption(self, args):
+        if "name" not in args:
+            return
+        valueIndex = args.index("value") if "value" in args else len(args)
+        name = " ".join(args[args.index("name") + 1:valueIndex]).lower()
+        value = " ".join(args[valueIndex + 1:])
+
+        if name == "hash":
+            self.wait()
+            AI.transpoTable.resize(max(1, int(value)))
+            self.startSMP(self.threads)
+        elif name == "threads":
+            self.wait()
+            self.startSMP(max(1, int(value)))
+        elif name == "pawnhash":
+            self.wait()
+            AI.pawnHash.resize(max(1, int(value)))
+        elif name == "ownbook":
+            self.ownBook = value.lower() == "true"
+        elif name == "bookfile":
+            # several books can be given separated by semicolons, they are probed in order
+            self.wait()
+            selection = self.book.selection
+            self.book.close()
+            self.book = OpeningBook(selection=selection)
+            # a book that can't be opened is left out, the rest still load
+            for path in value.split(";"):
+                if path and path != "<empty>":
+                    try:
+                        self.book.add(path)
+                    except (OSError, ValueError) as error:
+                        self.send(f"info string book {path} not loaded: {error}")
+        elif name == "bookselection":
+            if value in OpeningBook.selections:
+                self.book.selection = value
+        elif name == "syzygypath":
+            # several directories can be given separated by semicolons
+            self.wait()
+            AI.tablebase.close()
+            for directory in value.split(";"):
+                if directory and directory != "<empty>":
+                    AI.tablebase.addDirectory(directory)
+            # the helpers open their own tables when they start
+            self.startSMP(self.threads)
+        elif name == "searchcache":
+            self.wait()
+            if AI.searchCache is not None:
+                AI.searchCache.close()
+            AI.searchCache = SearchCache(value, AI.evaluationVersion()) if value and value != "<empty>" else None
+
+    # replaces the parallel search with one using the given number of processes
+    def startSMP(self, threads):
+        self.threads = threads
+        if self.smp is not None:
+            self.smp.close()
+            self.smp = None
+        if threads > 1:
+            self.smp = LazySMP(threads, AI.transpoTable.sizeMB)
+
+    # position [startpos | fen <fen>] [moves <move> ...]
+    # a bad fen keeps the last position, an illegal move stops the game at the move before it
+    def position(self, args):
+        movesIndex = args.index("moves") if "moves" in args else len(args)
+        if args and args[0] == "fen":
+            self.board = chess.Board(" ".join(args[1:movesIndex]))
+        else:
+            self.board = chess.Board()
+        for move in args[movesIndex + 1:]:
+            try:
+                self.board.push_uci(move)
+            except ValueError:
+                self.send(f"info string illegal move {move}, the position stops at the move before it")
+                return
+
+    # go [depth <d>] [movetime <ms>] [wtime <ms>] [btime <ms>] [winc <ms>] [binc <ms>] [movestogo <n>]
+    #    [nodes <n>] [infinite] [ponder]
+    def go(self, args):
+        limits = {}
+        infinite = False
+        ponder = False
+        index = 0
+        while index < len(args):
+            if args[index] == "infinite":
+                infinite = True
+            elif args[index] == "ponder":
+                ponder = True
+            elif args[index] in ("depth", "movetime", "wtime", "btime", "winc", "binc", "movestogo", "nodes") \
+                    and index + 1 < len(args):
+                limits[args[index]] = int(args[index + 1])
+                index += 1
+            index += 1
+
+        # with no limit at all, search until told to stop
+        if not limits:
+            infinite = True
+
+        AI.stopSearch = False
+        # set before the search starts, so a ponderhit that arrives first isn't lost
+        AI.pondering = ponder
+        self.worker = threading.Thread(target=self.think, args=(self.board.copy(), limits, infinite, ponder),
+                                       daemon=True)
+        self.worker.start()
+
+    # lets the current search finish on its own
+    def wait(self):
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
+
+    # ends the current search, the worker sends its bestmove before this returns
+    def stop(self):
+        if self.worker is not None:
+            AI.stopSearch = True
+            self.worker.join()
+            self.worker = None
+
+    # runs on the worker thread
+    # while pondering the gui is already showing the position after the move we expect, and bestmove can only be
+    # sent once it says ponderhit or stop
+    def think(self, board, limits, infinite, ponder):
+        def info(depth, score, elapsed, PV):
+            nodes = AI.stats.nodes
+            line = [move for move in PV if move != 0]
+            self.send(f"info depth {depth} score {UCI.formatScore(score, board.turn)} nodes {nodes} "
+                      f"nps {int(nodes / max(elapsed, 0.001))} time {int(elapsed * 1000)} "
+                      f"hashfull {AI.transpoTable.hashfull()} pv {' '.join(line)}")
+
+        if board.is_game_over():
+            self.send("bestmove 0000")
+            return
+
+        # book moves are played straight away, go infinite is analysis so it always searches
+        if self.ownBook and not infinite and not ponder:
+            move = self.book.choose(board)
+            if move is not None:
+                self.send(f"bestmove {move.uci()}")
+                return
+
+        search = AI.search if self.smp is None else self.smp.search
+        bestMove, score, PV, stats = search(board, limits.get("depth"), movetime=limits.get("movetime"),
+                                            wtime=limits.get("wtime"), btime=limits.get("btime"),
+                                            winc=limits.get("winc", 0), binc=limits.get("binc", 0),
+                                            movestogo=limits.get("movestogo"), nodes=limits.get("nodes"),
+                                            infinite=infinite, ponder=ponder, info=info)
+
+        # an infinite search has to wait for stop before it can answer, and a ponder search for the ponder hit
+        while (infinite or AI.pondering) and not AI.stopSearch:
+            time.sleep(0.01)
+        AI.pondering = False
+
+        # the reply we expect, for the gui to ponder on
+        if len(PV) > 1 and PV[1]:
+            self.send(f"bestmove {bestMove.uci()} ponder {PV[1]}")
+        else:
+            self.send(f"bestmove {bestMove.uci()}")
+
+    # scores are from white's point of view, uci wants the side to move's point of view and mates in moves
+    @staticmethod
+    def formatScore(score, turn):
+        if not turn:
+            score = -score
+        if score >= AI.MATE_BOUND:
+            return f"mate {(AI.MATE_SCORE - score + 1) // 2}"
+        if score <= -AI.MATE_BOUND:
+            return f"mate -{(AI.MATE_SCORE + score) // 2}"
+        return f"cp {int(score)}"
+
+
+if __name__ == "__main__":
+    UCI().loop()
@@ -0,0 +1,66 @@
+import concurrent.futures
+
+from AI import *
+
+
+# runs independent tasks across a pool of processes
+# workers are set up with the settings of the process that starts the pool, the command line only changes this
+# process, and workers started by spawn rather than fork would otherwise run with the defaults
+class WorkerPool:
+    # the settings of this process that workers need too
+    @staticmethod
+    def settings():
+        return {"searchFeatures": {feature: getattr(AI, feature) for feature in AI.searchFeatures},
+                "syzygy": list(AI.tablebase.directories),
+                "searchCache": (AI.searchCache.path, AI.searchCache.maxEntries) if AI.searchCache is not None else None}
+
+    # what every worker runs when it starts
+    @staticmethod
+    def initialize(settings):
+        for feature, value in settings["searchFeatures"].items():
+            setattr(AI, feature, value)
+        # a forked worker already has the tables open
+        if AI.tablebase.directories != settings["syzygy"]:
+            AI.tablebase.close()
+            for directory in settings["syzygy"]:
+                AI.tablebase.addDirectory(directory)
+        # a cache of its own even when forked, an sqlite connection can't be shared with the parent
+        AI.searchCache = None
+        if settings["searchCache"] is not None:
+            path, maxEntries = settings["searchCache"]
+            AI.searchCache = SearchCache(path, AI.evaluationVersion(), maxEntries)
+
+    # a process pool with workers set up like this process
+    @staticmethod
+    def executor(workers):
+        return concurrent.futures.ProcessPoolExecutor(workers, initializer=WorkerPool.initialize,
+                                                      initargs=(WorkerPool.settings(),))
+
+    # runs (function, arguments) tasks and yields their results as they finish
+    # only inFlight tasks per worker are submitted at once, so the tasks can be a stream of any length, and
+    # stopping early wastes little, tasks that haven't started are cancelled
+    # with workers=1 everything runs in this process, in order
+    @staticmethod
+    def run(tasks, workers=1, inFlight=2):
+        if workers <= 1:
+            for function, arguments in tasks:
+                yield function(*arguments)
+            return
+
+        with WorkerPool.executor(workers) as pool:
+            pending = set()
+            try:
+                for function, arguments in tasks:
+                    pending.add(pool.submit(function, *arguments))
+                    if len(pending) >= workers * inFlight:
+                        done, pending = concurrent.futures.wait(pending,
+                                                                return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
+                while pending:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            finally:
+                for future in pending:
+                    future.cancel()
@@ -0,0 +1,164 @@
+import os
+import shutil
+
+import chess
+import chess.polyglot
+import pytest
+from AI import *
+
+# every three piece table, see syzygy/SOURCE.txt
+directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), "syzygy")
+
+
+@pytest.fixture
+def tablebase():
+    tablebase = Tablebase([directory])
+    yield tablebase
+    tablebase.close()
+
+
+# the search with the tables in place of whatever AI has
+@pytest.fixture
+def searchTablebase(tablebase):
+    previous = AI.tablebase
+    AI.tablebase = tablebase
+    AI.newGame()
+    yield tablebase
+    AI.tablebase = previous
+    AI.newGame()
+
+
+# probes through the same cache the search uses
+def wdl(tablebase, fen):
+    board = chess.Board(fen)
+    return tablebase.wdl(board, chess.polyglot.zobrist_hash(board))
+
+
+def test_empty():
+    tablebase = Tablebase()
+    assert not tablebase
+    assert not tablebase.covers(chess.Board("8/8/8/8/8/2k5/8/KQ6 w - - 0 1"))
+    assert tablebase.rootMove(chess.Board("8/8/8/8/8/2k5/8/KQ6 w - - 0 1")) is None
+
+
+def test_covers(tablebase):
+    assert tablebase
+    assert tablebase.maxPieces == 3
+    assert tablebase.covers(chess.Board("8/8/8/8/8/2k5/8/KQ6 w - - 0 1"))
+    assert not tablebase.covers(chess.Board("8/8/8/8/8/2k5/8/KQ5R w - - 0 1"))
+    assert not tablebase.covers(chess.Board("4k3/8/8/8/8/8/8/4K2R w K - 0 1"))
+
+
+@pytest.mark.parametrize("fen, expected", [
+    # the side with the queen or rook to move wins
+    ("8/8/8/8/8/2k5/8/KQ6 w - - 0 1", 2),
+    ("8/8/8/4k3/8/8/8/R3K3 w - - 0 1", 2),
+    # the lone king to move loses
+    ("8/8/8/4k3/8/8/8/R3K3 b - - 0 1", -2),
+    ("8/8/8/8/8/2k5/8/KQ6 b - - 0 1", -2),
+    # the lone king to move takes the queen, the rook, or the pawn
+    ("8/8/8/8/8/8/1kQ5/4K3 b - - 0 1", 0),
+    ("8/8/8/8/8/8/1kR5/4K3 b - - 0 1", 0),
+    ("8/8/8/8/8/8/1Pk5/7K b - - 0 1", 0),
+    # the pawn queens whoever is to move
+    ("8/P7/8/8/8/8/8/K6k w - - 0 1", 2),
+    ("8/P7/8/8/8/8/8/K6k b - - 0 1", -2),
+])
+def test_wdl(tablebase, fen, expected):
+    assert wdl(tablebase, fen) == expected
+    # a second probe comes from the cache
+    probes = tablebase.probes
+    assert wdl(tablebase, fen) == expected
+    assert tablebase.probes == probes
+
+
+def test_wdl_outside_tables(tablebase):
+    board = chess.Board("8/8/8/8/8/2k5/8/KQ5R w - - 0 1")
+    assert tablebase.wdl(board, chess.polyglot.zobrist_hash(board)) is None
+    assert tablebase.rootMove(board) is None
+
+
+@pytest.mark.parametrize("fen", ["8/8/8/8/8/2k5/8/KQ6 w - - 0 1", "8/8/8/4k3/8/8/8/R3K3 w - - 0 1"])
+def test_dtz(tablebase, fen):
+    board = chess.Board(fen)
+    dtz = tablebase.tables.get_dtz(board)
+    assert dtz is not None and dtz > 0
+    # the best move gets closer to mate
+    move, result = tablebase.rootMove(board)
+    assert result == 2
+    board.push(move)
+    assert board.is_checkmate() or 0 < -tablebase.tables.get_dtz(board) < dtz
+
+
+@pytest.mark.parametrize("fen, expected, result", [
+    # every other move loses, taking the queen draws
+    ("8/8/8/8/8/8/1kQ5/4K3 b - - 0 1", "b2c2", 0),
+    # the rook is attacked and unprotected, the win needs it moved or guarded
+    ("8/8/8/8/3R4/4k3/8/K7 w - - 0 1", None, 2),
+])
+def test_root_move(tablebase, fen, expected, result):
+    board = chess.Board(fen)
+    move, wdl = tablebase.rootMove(board)
+    assert wdl == result
+    assert expected is None or move.uci() == expected
+    board.push(move)
+    assert board.is_checkmate() or tablebase.tables.get_wdl(board) == -result
+
+
+def test_root_move_mates(tablebase):
+    board = chess.Board("k7/8/1K6/8/8/8/8/6Q1 w - - 0 1")
+    move, wdl = tablebase.rootMove(board)
+    assert wdl == 2
+    board.push(move)
+    assert board.is_checkmate()
+
+
+# a pawn move resets the fifty move count, so promoting right away is the quickest way to keep the win
+def test_root_move_zeroing(tablebase):
+    board = chess.Board("8/P7/8/8/8/8/8/K6k w - - 0 1")
+    move, wdl = tablebase.rootMove(board)
+    assert wdl == 2
+    assert move.from_square == chess.A7 and move.promotion in (chess.QUEEN, chess.ROOK)
+
+
+# a move into a table that is missing leaves the root to the search, it can't be ranked against the others
+def test_root_move_missing_table(tmp_path):
+    for name in ("KPvK.rtbw", "KPvK.rtbz", "KQvK.rtbw", "KQvK.rtbz", "KRvK.rtbw", "KRvK.rtbz"):
+        shutil.copy(os.path.join(directory, name), tmp_path)
+    tablebase = Tablebase([str(tmp_path)])
+    try:
+        board = chess.Board("8/P7/8/8/8/8/8/K6k w - - 0 1")
+        assert tablebase.wdl(board, chess.polyglot.zobrist_hash(board)) == 2
+        assert tablebase.rootMove(board) is None
+    finally:
+        tablebase.close()
+
+
+# a win the fifty move rule takes away is only a cursed win
+def test_root_move_cursed(tablebase):
+    board = chess.Board("8/8/8/8/8/2k5/8/KQ6 w - - 95 80")
+    move, wdl = tablebase.rootMove(board)
+    assert wdl == 1
+    assert AI.tablebaseScore(wdl, 0) == 1
+
+
+# the search takes the tables' move at the root, and never throws a win or a draw away
+@pytest.mark.parametrize("fen, score", [("8/8/8/8/8/2k5/8/KQ6 w - - 0 1", AI.TABLEBASE_WIN),
+                                        ("8/8/8/8/8/8/1kQ5/4K3 b - - 0 1", 0)])
+def test_search_root(searchTablebase, fen, score):
+    board = chess.Board(fen)
+    move, found, PV, stats = AI.search(board, 3)
+    assert (found if board.turn else -found) == score
+    assert move == searchTablebase.rootMove(board)[0]
+    assert stats.tablebaseHits == 1
+
+
+# four pieces are past the tables, but taking the pawn reaches a tablebase win one ply in, which the search
+# probes instead of searching on
+def test_search_probe(searchTablebase):
+    board = chess.Board("7k/8/8/8/p7/8/8/R3K3 w - - 0 1")
+    assert searchTablebase.rootMove(board) is None
+    move, score, PV, stats = AI.search(board, 2)
+    assert move == chess.Move.from_uci("a1a4")
+    assert score == AI.TABLEBASE_WIN - 1
+    assert stats.tablebaseHits > 0